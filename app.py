@@ -1,18 +1,38 @@
-from os import urandom, listdir, path
+import json
+from os import urandom, path, environ
 from uuid import uuid4
 
 import absl.logging
-from flask import Flask, render_template, redirect
+from flask import Flask, render_template, redirect, jsonify, Response
 from werkzeug.utils import secure_filename
-import pickledb
+from core.datasetcache import DatasetCache
+from core.hyperparametersearch import get_search_space
+from core.journalstore import JournalStore
+from core.metadatastore import MetadataStore
 from core.modelcomponents import LAYERS, NORMALIZATION_METHODS
 from core.projectmanager import ProjectManager
 from core.runtimemanager import RuntimeManager
+from core.runtimeserver import RuntimeClient
+from core.sqlitestore import SQLiteStore
+from core.trainingworker import TrainingWorkerPool
 from core.usermanager import UserManager
 from core.validation import *
 
 # Global variables
+DATABASE_BACKEND = environ.get('KERASUITE_DATABASE_BACKEND', 'journal')  # 'journal' or 'sqlite'
 DATABASE_NAME = 'Kerasuite.db'
+DATABASE_FLUSH_INTERVAL = 1.0  # Seconds between two fsyncs of the database journal
+SQLITE_DATABASE_NAME = 'Kerasuite.sqlite'  # Shared by all worker processes, see core/migration.py to import Kerasuite.db
+TRAINING_WORKERS = int(environ.get('KERASUITE_TRAINING_WORKERS', 1))  # Models trained at the same time
+TRAINING_PROGRESS_INTERVAL = 0.5  # Minimal seconds between two training progress updates within an epoch
+TRAINING_PROGRESS_KEEPALIVE = 15.0  # Seconds between two keep-alive comments on an idle progress stream
+TRAINING_PROCESSES = environ.get('KERASUITE_TRAINING_PROCESSES', '1') == '1'  # Train in worker processes
+TRAINING_INTRA_OP_THREADS = int(environ.get('KERASUITE_TRAINING_INTRA_OP_THREADS', 0))  # 0 lets TensorFlow decide
+TRAINING_INTER_OP_THREADS = int(environ.get('KERASUITE_TRAINING_INTER_OP_THREADS', 0))  # 0 lets TensorFlow decide
+TRAINING_CPU_AFFINITY = environ.get('KERASUITE_TRAINING_CPU_AFFINITY', '1') == '1'  # Give every worker its own cores
+RUNTIME_MEMORY_BUDGET = int(environ.get('KERASUITE_RUNTIME_MEMORY_BUDGET', 0))  # MB for all loaded projects, 0 = no limit
+RUNTIME_IDLE_TIMEOUT = int(environ.get('KERASUITE_RUNTIME_IDLE_TIMEOUT', 1800))  # Seconds, 0 keeps idle projects loaded
+RUNTIME_SERVER = environ.get('KERASUITE_RUNTIME_SERVER')  # Socket of the runtime server, runtimes are in-process if unset
 
 # Enable logging
 logging.basicConfig(level=logging.INFO)  # Default logging level
@@ -23,28 +43,50 @@ absl.logging._warn_preinit_stderr = False
 
 # Create Flask app
 app = Flask(__name__)
-app.secret_key = urandom(80)
 app.config['UPLOAD_FOLDER'] = path.join(path.dirname(path.realpath(__file__)), 'data')
 
-# Check if the database exists
-if DATABASE_NAME not in listdir('.'):
-    # Initialise the database with a default user & password (admin - Kerasuite)
-    logging.warning('The database does not exist, initialising now ...')
-    database = pickledb.load(DATABASE_NAME, auto_dump=True)
-    database.set('users',
-                 {
-                     "admin": {
-                         "password": "$2b$12$9PlFNhsAFENiKcsOsqjzAOPwUJyAF6FXCUxxbBHYJAhHai9q8eeCa",
-                         "admin": True
-                     }
-                 })
-
 # Load database
-logging.info('Loading database into memory ...')
-database = pickledb.load(DATABASE_NAME, auto_dump=True)
-project_manager = ProjectManager(database)
-user_manager = UserManager(database)
-runtime_manager = RuntimeManager(project_manager, app.config['UPLOAD_FOLDER'])
+if DATABASE_BACKEND == 'sqlite':
+    logging.info('Opening SQLite database ...')
+    database = SQLiteStore(SQLITE_DATABASE_NAME)
+else:
+    logging.info('Loading database into memory ...')
+    database = JournalStore(DATABASE_NAME, flush_interval=DATABASE_FLUSH_INTERVAL)
+metadata_store = MetadataStore(database)
+
+with metadata_store.transaction():
+    # Check if the database has been initialised
+    if not metadata_store.get_index(MetadataStore.USER):
+        # Initialise the database with a default user & password (admin - Kerasuite)
+        logging.warning('The database does not exist, initialising now ...')
+        metadata_store.set_record(MetadataStore.USER,
+                                  {
+                                      "password": "$2b$12$9PlFNhsAFENiKcsOsqjzAOPwUJyAF6FXCUxxbBHYJAhHai9q8eeCa",
+                                      "admin": True
+                                  },
+                                  'admin')
+        metadata_store.add_to_index('admin', MetadataStore.USER)
+
+    # Share the session key between all worker processes, else a session is only valid on the worker that created it
+    if metadata_store.get_record(MetadataStore.CONFIG, 'secret-key') is None:
+        metadata_store.set_record(MetadataStore.CONFIG, urandom(80).hex(), 'secret-key')
+    app.secret_key = bytes.fromhex(metadata_store.get_record(MetadataStore.CONFIG, 'secret-key'))
+
+project_manager = ProjectManager(metadata_store)
+user_manager = UserManager(metadata_store)
+if RUNTIME_SERVER:
+    # Running projects live in the runtime server, shared by all worker processes
+    runtime_manager = RuntimeClient(RUNTIME_SERVER)
+else:
+    worker_pool = TrainingWorkerPool(workers=TRAINING_WORKERS,
+                                     intra_op_threads=TRAINING_INTRA_OP_THREADS,
+                                     inter_op_threads=TRAINING_INTER_OP_THREADS,
+                                     cpu_affinity=TRAINING_CPU_AFFINITY) if TRAINING_PROCESSES else None
+    runtime_manager = RuntimeManager(project_manager, app.config['UPLOAD_FOLDER'], training_workers=TRAINING_WORKERS,
+                                     progress_interval=TRAINING_PROGRESS_INTERVAL, worker_pool=worker_pool,
+                                     memory_budget=RUNTIME_MEMORY_BUDGET * 1000000 or None,
+                                     idle_timeout=RUNTIME_IDLE_TIMEOUT or None)
+dataset_cache = DatasetCache(app.config['UPLOAD_FOLDER'])
 
 
 @app.errorhandler(404)
@@ -210,6 +252,8 @@ def run():
     drop_form = DropColumnForm()
     replace_form = ReplaceDataForm()
     create_layer_form = CreateLayerForm()
+    search_form = SearchModelForm()
+    training_form = TrainingSettingsForm()
 
     if is_user_logged_in():
         data = get_has_keys('project')
@@ -239,8 +283,13 @@ def run():
                                        TrainTestSplit=project_manager.get_preprocessing(project,
                                                                                         'train-test-split'),
                                        RandomState=project_manager.get_preprocessing(project, 'random-state'),
+                                       Folds=project_manager.get_preprocessing(project, 'folds'),
+                                       Stratify=project_manager.get_preprocessing(project, 'stratify'),
+                                       Streaming=project_manager.get_preprocessing(project, 'streaming'),
                                        ColumnNames=columns,
                                        DataBalance=runtime_manager.get_data_balance(project),
+                                       MemoryReport=runtime_manager.get_memory_report(project),
+                                       TrainingJob=runtime_manager.get_training_job(project),
                                        ModelLayers=LAYERS,
                                        ProjectModel=project_manager.load_model(project),
                                        LayerOptions=LAYER_OPTIONS,
@@ -250,6 +299,9 @@ def run():
                                        TestScoring=project_manager.load_model_scoring(
                                            project_name=project,
                                            scoring_source=project_manager.SCORING_TEST),
+                                       CrossValidationScoring=project_manager.load_model_scoring(
+                                           project_name=project,
+                                           scoring_source=project_manager.SCORING_CROSSVALIDATION),
                                        Error=err['error'],
                                        ModifyProjectForm=edit_form,
                                        PreprocessingForm=preprocessing_form,
@@ -258,7 +310,9 @@ def run():
                                        Normalizers=NORMALIZATION_METHODS,
                                        DropForm=drop_form,
                                        ReplaceForm=replace_form,
-                                       CreateLayerForm=create_layer_form)
+                                       CreateLayerForm=create_layer_form,
+                                       SearchForm=search_form,
+                                       TrainingForm=training_form)
 
     return redirect('/login')
 
@@ -290,9 +344,16 @@ def set_dataset():
                 if is_file_allowed(dataset.filename):
                     file_ext = str(secure_filename(dataset.filename)).rsplit('.', 1)[1]
                     new_filename = str(uuid4())
-                    dataset.save(f'{app.config["UPLOAD_FOLDER"]}/{new_filename}.{file_ext}')
+                    # Parse the upload into the dataset cache while saving it, identical uploads are stored once
+                    content = dataset_cache.ingest(f'{new_filename}.{file_ext}', dataset.stream)
+                    if content is None:
+                        logging.error(f'Could not save the dataset of project {request.form["projectname"]}')
+                        return redirect(f'/run?project={request.form["projectname"]}'
+                                        f'&error=The dataset could not be saved, upload it again')
+                    # The runtime keeps the previous dataset, whose files are removed
+                    runtime_manager.stop_project(request.form['projectname'])
                     project_manager.assign_dataset(new_filename, file_ext,
-                                                   request.form['projectname'])
+                                                   request.form['projectname'], content=content)
                     logging.info(f'Project {request.form["projectname"]} received a new dataset')
                     return redirect(f'/run?project={request.form["projectname"]}')
     return redirect('/login')
@@ -316,6 +377,18 @@ def set_dataset_split():
             project_manager.set_preprocessing(form.project.data,
                                               'output-columns',
                                               form.column_output.data)
+            project_manager.set_preprocessing(form.project.data,
+                                              'folds',
+                                              int(form.folds.data))
+            project_manager.set_preprocessing(form.project.data,
+                                              'stratify',
+                                              bool(form.stratify.data))
+            _streaming = bool(form.streaming.data)
+            if _streaming != bool(project_manager.get_preprocessing(form.project.data, 'streaming')):
+                project_manager.set_preprocessing(form.project.data, 'streaming', _streaming)
+                if runtime_manager.is_project_running(form.project.data):
+                    # A streaming runtime keeps its dataset on disk, the runtime is loaded again in the other mode
+                    runtime_manager.run_project(form.project.data)
             return redirect(f'/run?project={form.project.data}')
     return redirect('/')
 
@@ -472,6 +545,32 @@ def create_layer():
     return redirect('/')
 
 
+@app.route('/set/model/training', methods=['GET', 'POST'])
+def set_training_settings():
+    """
+    Set the epochs, batch size, validation split and early stopping of a model
+    """
+    if is_user_logged_in() and request.method == 'POST':
+        form = TrainingSettingsForm(request.form)
+        if form.validate():
+            early_stopping = None
+            if form.early_stopping.data:
+                early_stopping = {
+                    'monitor': form.monitor.data,
+                    'patience': int(form.patience.data),
+                    'min-delta': float(form.min_delta.data)
+                }
+            project_manager.set_training_settings(project_name=form.project.data,
+                                                  epochs=int(form.epochs.data),
+                                                  batch_size=int(form.batch_size.data),
+                                                  validation_split=(form.validation_split.data or 0) / 100.0,
+                                                  early_stopping=early_stopping)
+            return redirect(f'/run?project={form.project.data}')
+        else:
+            print(form.errors)
+    return redirect('/')
+
+
 @app.route('/remove/layer')
 def remove_layer():
     """
@@ -490,22 +589,132 @@ def remove_layer():
 @app.route('/train/model')
 def train_model():
     """
-    Train a model for the current project
+    Queue training a model for the current project, the project page follows the progress of the training job. With
+    continue=1 training continues from the stored model.
     """
     if is_user_logged_in():
         data = get_has_keys('project')
         if data is not None:
+            # Check the settings before queueing, so the error can be shown right away
+            err = project_manager.validate_training_settings(data['project'])
+            if err is not None:
+                return redirect(f'/run?project={data["project"]}&error={err}')
             try:
-                runtime_manager.split_project_dataset(data['project'])
-                runtime_manager.train_project_model(data['project'])
-                return redirect(f'/run?project={data["project"]}')
+                runtime_manager.train_project_model(data['project'], warm_start=request.args.get('continue') == '1')
+            except Exception as e:
+                logging.error(f'Failed to queue training project {data["project"]}: {e}')
+            return redirect(f'/run?project={data["project"]}')
+    return redirect('/')
+
+
+@app.route('/train/crossvalidate')
+def train_crossvalidate():
+    """
+    Queue k-fold cross-validation of the model of the current project, it is followed like a training job
+    """
+    if is_user_logged_in():
+        data = get_has_keys('project')
+        if data is not None:
+            err = project_manager.validate_training_settings(data['project'])
+            if err is not None:
+                return redirect(f'/run?project={data["project"]}&error={err}')
+            try:
+                runtime_manager.cross_validate_project_model(data['project'])
             except Exception as e:
-                logging.error(f'Failed to train project {data["project"]}: {e}')
+                logging.error(f'Failed to queue cross-validating project {data["project"]}: {e}')
+            return redirect(f'/run?project={data["project"]}')
+    return redirect('/')
 
-                # Check where the error happened
-                err = project_manager.validate_training_settings(data['project'])
-                if err is not None:
-                    return redirect(f'/run?project={data["project"]}&error={err}')
+
+@app.route('/search/model', methods=['GET', 'POST'])
+def search_model():
+    """
+    Queue a hyperparameter search for the current project, it is followed like a training job
+    """
+    if is_user_logged_in() and request.method == 'POST':
+        form = SearchModelForm(request.form)
+        if form.validate():
+            project = form.project.data
+            err = project_manager.validate_training_settings(project)
+            if err is not None:
+                return redirect(f'/run?project={project}&error={err}')
+            try:
+                # The search space reads the model parameters by their model record name
+                space = get_search_space(project_manager.load_model(project),
+                                         {**request.form.to_dict(), 'batch-size': form.batch_size.data or ''})
+                runtime_manager.search_project_model(project, space, form.strategy.data, trials=form.trials.data)
+            except ValueError as e:
+                return redirect(f'/run?project={project}&error={e}')
+            except Exception as e:
+                logging.error(f'Failed to queue a search for project {project}: {e}')
+            return redirect(f'/run?project={project}')
+        else:
+            print(form.errors)
+    return redirect('/')
+
+
+@app.route('/search/apply')
+def search_apply():
+    """
+    Use the model parameters of a trial of the last hyperparameter search
+    """
+    if is_user_logged_in():
+        data = get_has_keys('project', 'trial')
+        if data is not None:
+            project_manager.apply_search_trial(data['project'], data['trial'])
+            return redirect(f'/run?project={data["project"]}')
+    return redirect('/')
+
+
+@app.route('/train/status')
+def train_status():
+    """
+    Return the state of the training job of a project as JSON
+    """
+    if is_user_logged_in():
+        data = get_has_keys('project')
+        if data is not None and runtime_manager.is_project_running(data['project']):
+            return jsonify(runtime_manager.get_training_job(data['project']))
+    return jsonify(None)
+
+
+@app.route('/train/progress')
+def train_progress():
+    """
+    Stream the progress of the training job of a project as Server-Sent Events, the stream ends with the job
+    """
+    if is_user_logged_in():
+        data = get_has_keys('project')
+        if data is not None and runtime_manager.is_project_running(data['project']):
+            progress = runtime_manager.get_training_progress(data['project'])
+            if progress is not None:
+                def _stream():
+                    _version, _closed = 0, False
+                    while not _closed:
+                        _new_version, _state, _closed = progress.wait(_version, timeout=TRAINING_PROGRESS_KEEPALIVE)
+                        if _new_version == _version and not _closed:
+                            # Keep proxies from closing the idle connection
+                            yield ': keep-alive\n\n'
+                            continue
+                        _version = _new_version
+                        yield f'data: {json.dumps(_state)}\n\n'
+
+                return Response(_stream(), mimetype='text/event-stream',
+                                headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    return Response(status=204)
+
+
+@app.route('/train/cancel')
+def train_cancel():
+    """
+    Cancel the training job of a project
+    """
+    if is_user_logged_in():
+        data = get_has_keys('project')
+        if data is not None:
+            if runtime_manager.is_project_running(data['project']):
+                runtime_manager.cancel_training(data['project'])
+            return redirect(f'/run?project={data["project"]}')
     return redirect('/')
 
 
@@ -0,0 +1,334 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame, Series
+
+
+class ColumnarWriter:
+    CATEGORY_RATIO = 0.5  # Text columns with at most this ratio of unique values per row are stored as categories
+    MAX_CATEGORIES = 1 << 16  # Text columns with more unique values are stored value by value, see __to_text
+    __REWRITE_ROWS = 1 << 20
+    __JSON_TYPES = (str, int, float, bool)
+    __INTEGER_TYPES = [np.int8, np.int16, np.int32, np.int64]
+
+    def __init__(self, location, compact=False):
+        """
+        Write a dataset to a directory with one raw binary file per column, chunk by chunk. Column types are widened
+        when a later chunk does not fit the type inferred from the earlier chunks. Text columns are stored as codes into
+        their unique values, or as the values themselves once they have too many unique values to keep in memory.
+
+        :param location: The directory to write to, it should not exist yet
+        :type location: str
+
+        :param compact: Downcast numeric columns and store low-cardinality text columns as categories
+        :type compact: bool
+        """
+        self.__location = location
+        self.__compact = compact
+        self.__rows = 0
+        self.__columns = None
+        os.makedirs(location)
+
+    @property
+    def is_empty(self):
+        """
+        Check if no chunk with columns has been written yet
+
+        :rtype: bool
+        """
+        return self.__columns is None
+
+    def __get_path(self, index):
+        """
+        Request the file of a column
+
+        :rtype: str
+        """
+        return os.path.join(self.__location, f'{index}.bin')
+
+    def __get_text_path(self, index):
+        """
+        Request the file holding the values of a text column, see __to_text
+
+        :rtype: str
+        """
+        return os.path.join(self.__location, f'{index}.txt')
+
+    @staticmethod
+    def __to_json_value(value):
+        """
+        Convert a unique value to something the schema can hold
+
+        :rtype: str or int or float or bool
+        """
+        if isinstance(value, ColumnarWriter.__JSON_TYPES):
+            return value
+        return str(value)
+
+    @staticmethod
+    def __get_codes_type(categories):
+        """
+        Request the smallest integer type for codes, the same one pandas uses so loading a category does not copy
+
+        :rtype: np.dtype
+        """
+        for _type in ColumnarWriter.__INTEGER_TYPES:
+            if len(categories) < np.iinfo(_type).max:
+                return np.dtype(_type)
+        return np.dtype(np.int64)
+
+    def __rewrite(self, index, old_type, new_type, convert=None):
+        """
+        Rewrite a column file with another type, a slice at a time so memory use stays bounded
+
+        :param index: The position of the column
+        :type index: int
+
+        :param old_type: The type the file is currently written in
+        :type old_type: np.dtype
+
+        :param new_type: The type to write
+        :type new_type: np.dtype
+
+        :param convert: Optional conversion of a slice of values, defaults to a type cast
+        :type convert: callable
+        """
+        _path, _tmp_path = self.__get_path(index), f'{self.__get_path(index)}.tmp'
+        with open(_tmp_path, 'wb') as f:
+            if self.__rows > 0:
+                _values = np.memmap(_path, dtype=old_type, mode='r', shape=(self.__rows,))
+                for _start in range(0, self.__rows, ColumnarWriter.__REWRITE_ROWS):
+                    _slice = _values[_start:_start + ColumnarWriter.__REWRITE_ROWS]
+                    _slice = convert(_slice) if convert is not None else _slice.astype(new_type)
+                    np.ascontiguousarray(_slice, dtype=new_type).tofile(f)
+                del _values
+        os.replace(_tmp_path, _path)
+
+    def __encode_codes(self, column, values, uniques):
+        """
+        Map the codes of a chunk to codes into the unique values of the whole column
+
+        :param column: The state of the column
+        :type column: dict
+
+        :param values: The codes of the chunk, -1 for missing values
+        :type values: np.ndarray
+
+        :param uniques: The unique values the chunk codes point to
+        :type uniques: list
+
+        :rtype: np.ndarray
+        """
+        _mapping = np.empty(len(uniques) + 1, dtype=np.int64)
+        for _i, _value in enumerate(uniques):
+            _value = ColumnarWriter.__to_json_value(_value)
+            if _value not in column['lookup']:
+                column['lookup'][_value] = len(column['categories'])
+                column['categories'].append(_value)
+            _mapping[_i] = column['lookup'][_value]
+        # Code -1 takes the last entry, which keeps missing values missing
+        _mapping[-1] = -1
+        return _mapping.take(values)
+
+    def __to_codes(self, index, column):
+        """
+        Convert a numeric column written so far into codes, when a later chunk contains text
+
+        :param index: The position of the column
+        :type index: int
+
+        :param column: The state of the column
+        :type column: dict
+        """
+        column.update({'kind': 'object', 'lookup': {}, 'categories': []})
+
+        def _convert(values):
+            _codes, _uniques = pd.factorize(values)
+            return self.__encode_codes(column, _codes, _uniques.tolist())
+
+        self.__rewrite(index, column['dtype'], np.dtype(np.int64), convert=_convert)
+        column['dtype'] = np.dtype(np.int64)
+
+    def __append_text(self, index, column, values):
+        """
+        Append values to a text column: one JSON value per line to its text file, and the end offset of every line to
+        its column file. Missing values are written as null.
+
+        :param index: The position of the column
+        :type index: int
+
+        :param column: The state of the column
+        :type column: dict
+
+        :param values: The values to append
+        :type values: list
+        """
+        _lines = [(json.dumps(None if pd.isnull(_value) else ColumnarWriter.__to_json_value(_value)) + '\n')
+                  .encode('utf-8') for _value in values]
+        _ends = column['size'] + np.cumsum([len(_line) for _line in _lines], dtype=np.int64)
+        with open(self.__get_text_path(index), 'ab') as f:
+            f.write(b''.join(_lines))
+        with open(self.__get_path(index), 'ab') as f:
+            _ends.tofile(f)
+        column['size'] = int(_ends[-1]) if len(_ends) else column['size']
+
+    def __to_text(self, index, column, rows):
+        """
+        Convert the codes written so far into a text column, when a column has too many unique values to keep them in
+        memory. The codes are read a slice at a time.
+
+        :param index: The position of the column
+        :type index: int
+
+        :param column: The state of the column
+        :type column: dict
+
+        :param rows: The amount of rows written to the column
+        :type rows: int
+        """
+        _path, _categories = self.__get_path(index), column['categories'] + [np.nan]
+        os.replace(_path, f'{_path}.codes')
+        column.update({'kind': 'text', 'size': 0})
+        if rows > 0:
+            _codes = np.memmap(f'{_path}.codes', dtype=column['dtype'], mode='r', shape=(rows,))
+            for _start in range(0, rows, ColumnarWriter.__REWRITE_ROWS):
+                # Code -1 takes the NaN appended to the categories
+                self.__append_text(index, column, [_categories[_code] for _code in
+                                                   _codes[_start:_start + ColumnarWriter.__REWRITE_ROWS].tolist()])
+            del _codes
+        os.remove(f'{_path}.codes')
+        for _key in ['lookup', 'categories', 'ordered']:
+            column.pop(_key, None)
+        column['dtype'] = np.dtype(np.int64)
+
+    def __append_column(self, index, column, values):
+        """
+        Append the values of a chunk to a column file
+
+        :param index: The position of the column
+        :type index: int
+
+        :param column: The state of the column
+        :type column: dict
+
+        :param values: The values of the chunk
+        :type values: Series
+        """
+        if pd.api.types.is_integer_dtype(values.dtype) and not isinstance(values.dtype, np.dtype):
+            # Nullable integers are written as floats, missing values become NaN
+            values = values.astype(np.float64)
+        if isinstance(values.dtype, np.dtype) and values.dtype.kind in 'biufM' and column['kind'] in [None, 'array']:
+            _type = values.dtype
+            if column['kind'] is None:
+                column.update({'kind': 'array', 'dtype': _type})
+            elif column['dtype'] != _type:
+                try:
+                    _type = np.result_type(column['dtype'], _type)
+                except TypeError:
+                    _type = None
+                if _type is None or _type.kind == 'O':
+                    self.__to_codes(index, column)
+                    return self.__append_column(index, column, values.astype(object))
+                if _type != column['dtype']:
+                    self.__rewrite(index, column['dtype'], _type)
+                    column['dtype'] = _type
+            _array = values.to_numpy().astype(column['dtype'], copy=False)
+            if column['dtype'].kind in 'iu' and len(_array) > 0:
+                column['min'] = min(column.get('min', _array.min()), _array.min())
+                column['max'] = max(column.get('max', _array.max()), _array.max())
+            elif column['dtype'].kind == 'f':
+                # Only downcast to float32 when every value survives the round trip, NaN stays NaN
+                _round_trip = _array.astype(np.float32).astype(_array.dtype)
+                column['float32'] = column.get('float32', True) and \
+                    bool(((_round_trip == _array) | np.isnan(_array)).all())
+        elif column['kind'] == 'text':
+            return self.__append_text(index, column, values.tolist())
+        else:
+            if column['kind'] == 'array':
+                self.__to_codes(index, column)
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                _codes, _uniques = values.cat.codes.to_numpy(), values.cat.categories.tolist()
+                if column['kind'] is None:
+                    column.update({'kind': 'category', 'ordered': bool(values.cat.ordered)})
+            else:
+                _codes, _uniques = pd.factorize(values)
+                _uniques = _uniques.tolist()
+            if column['kind'] is None:
+                column.update({'kind': 'object'})
+            if 'lookup' not in column:
+                column.update({'lookup': {}, 'categories': [], 'dtype': np.dtype(np.int64)})
+            _array = self.__encode_codes(column, _codes, _uniques).astype(column['dtype'])
+
+        with open(self.__get_path(index), 'ab') as f:
+            np.ascontiguousarray(_array).tofile(f)
+        if column.get('categories') is not None and len(column['categories']) > ColumnarWriter.MAX_CATEGORIES:
+            self.__to_text(index, column, self.__rows + len(values))
+
+    def append(self, chunk):
+        """
+        Append the rows of a chunk, every chunk has to have the same columns
+
+        :param chunk: The rows to append
+        :type chunk: DataFrame
+        """
+        if self.__columns is None:
+            self.__columns = [{'name': _name, 'kind': None} for _name in chunk.columns]
+        for _i, _column in enumerate(self.__columns):
+            self.__append_column(_i, _column, chunk.iloc[:, _i])
+        self.__rows += len(chunk)
+
+    def __finish_column(self, index, column):
+        """
+        Pick the final type of a column and rewrite it if needed
+
+        :param index: The position of the column
+        :type index: int
+
+        :param column: The state of the column
+        :type column: dict
+
+        :returns: The schema of the column
+        :rtype: dict
+        """
+        _type = column['dtype']
+        if column['kind'] == 'array' and self.__compact:
+            if _type.kind in 'iu' and 'min' in column:
+                _type = next(np.dtype(_t) for _t in ColumnarWriter.__INTEGER_TYPES
+                             if np.iinfo(_t).min <= column['min'] and column['max'] <= np.iinfo(_t).max)
+            elif _type.kind == 'f' and column.get('float32', False):
+                _type = np.dtype(np.float32)
+        elif column['kind'] in ['object', 'category']:
+            if self.__compact and column['kind'] == 'object' and \
+                    len(column['categories']) <= self.__rows * ColumnarWriter.CATEGORY_RATIO:
+                column.update({'kind': 'category', 'ordered': False})
+            _type = ColumnarWriter.__get_codes_type(column['categories'])
+        if _type != column['dtype']:
+            self.__rewrite(index, column['dtype'], _type)
+
+        schema = {'name': column['name'], 'kind': column['kind'], 'dtype': _type.str}
+        if column['kind'] in ['object', 'category']:
+            schema['categories'] = column['categories']
+        if column['kind'] == 'category':
+            schema['ordered'] = column['ordered']
+        return schema
+
+    def finish(self, **properties):
+        """
+        Finalise the column files and write the schema, the dataset can not be appended to afterwards
+
+        :param properties: Extra properties to store in the schema
+
+        :returns: The schema
+        :rtype: dict
+        """
+        schema = {
+            **properties,
+            'rows': self.__rows,
+            'columns': [self.__finish_column(_i, _column) for _i, _column in enumerate(self.__columns or [])]
+        }
+        # The schema is written last, a directory without schema is incomplete
+        with open(os.path.join(self.__location, 'schema.json'), 'w', encoding='utf-8') as f:
+            json.dump(schema, f)
+        return schema
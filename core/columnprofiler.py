@@ -0,0 +1,240 @@
+import numpy as np
+import pandas as pd
+from pandas import Series
+
+HISTOGRAM_BINS = 20  # Amount of bins for numeric columns
+TOP_VALUES = 20  # Amount of values shown for other columns, numeric columns with at most this many values are counted
+CHUNK_ROWS = 100000  # Rows profiled at once
+
+
+class SpaceSaving:
+    def __init__(self, capacity):
+        """
+        Space-Saving sketch which keeps approximate counts of the most frequent values in bounded memory. Counts are
+        never underestimated and exact as long as there are fewer distinct values than the capacity.
+
+        :param capacity: The amount of counters to keep
+        :type capacity: int
+        """
+        self.__capacity = capacity
+        self.__counters = {}
+
+    @staticmethod
+    def __get_floor(counters, capacity):
+        """
+        Request the count a value missing from a full summary can at most have
+
+        :rtype: int
+        """
+        return min(counters.values()) if len(counters) >= capacity else 0
+
+    def update(self, values):
+        """
+        Count a chunk of values, the exact counts of the chunk are merged into the summary
+
+        :param values: The values to count, missing values are ignored
+        :type values: Series
+        """
+        _counts = values.value_counts()
+        _chunk = {_value: int(_count) for _value, _count in _counts.iloc[:self.__capacity].items()}
+        _chunk_floor = int(_counts.iloc[self.__capacity]) if len(_counts) > self.__capacity else 0
+        _floor = SpaceSaving.__get_floor(self.__counters, self.__capacity)
+        _merged = {
+            _value: self.__counters.get(_value, _floor) + _chunk.get(_value, _chunk_floor)
+            for _value in set(self.__counters) | set(_chunk)
+        }
+        self.__counters = dict(sorted(_merged.items(), key=lambda _item: -_item[1])[:self.__capacity])
+
+    def get_top(self, k):
+        """
+        Request the most frequent values
+
+        :param k: The amount of values to return
+        :type k: int
+
+        :returns: Tuples of a value and its approximate count, most frequent first
+        :rtype: list
+        """
+        return sorted(self.__counters.items(), key=lambda _item: -_item[1])[:k]
+
+
+class HyperLogLog:
+    def __init__(self, precision=12):
+        """
+        HyperLogLog sketch which estimates the amount of distinct values in 2 ** precision bytes, with a relative error
+        of about 1.04 / sqrt(2 ** precision)
+
+        :param precision: The amount of hash bits used to pick a register
+        :type precision: int
+        """
+        self.__precision = precision
+        self.__registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    def update(self, values):
+        """
+        Add a chunk of values
+
+        :param values: The values to add, missing values are ignored
+        :type values: Series
+        """
+        _hashes = pd.util.hash_pandas_object(values.dropna(), index=False).to_numpy()
+        _remainder_bits = 64 - self.__precision
+        _registers = (_hashes >> np.uint64(_remainder_bits)).astype(np.intp)
+        _remainder = _hashes & np.uint64((1 << _remainder_bits) - 1)
+        # The rank is the position of the first set bit, frexp returns the bit length of the remainder as exponent
+        _ranks = (_remainder_bits - np.frexp(_remainder.astype(np.float64))[1] + 1).astype(np.uint8)
+        np.maximum.at(self.__registers, _registers, _ranks)
+
+    def count(self):
+        """
+        Estimate the amount of distinct values added
+
+        :rtype: int
+        """
+        _m = len(self.__registers)
+        _estimate = 0.7213 / (1 + 1.079 / _m) * _m * _m / np.sum(np.power(2.0, -self.__registers.astype(np.float64)))
+        _zeros = int(np.count_nonzero(self.__registers == 0))
+        if _estimate <= 2.5 * _m and _zeros > 0:
+            # Linear counting is more accurate for small cardinalities
+            _estimate = _m * np.log(_m / _zeros)
+        return int(round(_estimate))
+
+
+def _format_label(value, precision=None):
+    """
+    Format a value as a chart label
+
+    :param value: The value to format
+    :type value: Any
+
+    :param precision: The amount of significant digits of floats, as many as tell the float apart from others if None
+    :type precision: int
+
+    :rtype: str
+    """
+    if isinstance(value, float):
+        return repr(float(value)) if precision is None else f'{value:.{precision}g}'
+    return str(value)
+
+
+def _get_counts(top):
+    """
+    Label the counts of values, values of different types with the same text get their type added to their label
+
+    :param top: Tuples of a value and its count, see SpaceSaving.get_top
+    :type top: list
+
+    :returns: The count by label
+    :rtype: dict
+    """
+    _labels = [_format_label(_value) for _value, _ in top]
+    _duplicates = {_label for _label in _labels if _labels.count(_label) > 1}
+    return {
+        (f'{_label} ({type(_value).__name__})' if _label in _duplicates else _label): _count
+        for _label, (_value, _count) in zip(_labels, top)
+    }
+
+
+def _format_edges(edges):
+    """
+    Format the edges of histogram bins with as few digits as keep them apart, so no two bins get the same label
+
+    :param edges: The increasing edges of the bins
+    :type edges: np.ndarray
+
+    :rtype: list
+    """
+    for _precision in range(4, 17):
+        _labels = [_format_label(float(_edge), _precision) for _edge in edges]
+        if len(set(_labels)) == len(_labels):
+            return _labels
+    # Distinct floats always differ in 17 digits
+    return [_format_label(float(_edge), 17) for _edge in edges]
+
+
+def _get_histogram(get_chunks, lowest, highest):
+    """
+    Count the values of a numeric column in equal-width bins, infinite values are counted apart
+
+    :param get_chunks: Function which returns the chunks of the column, see profile_chunks
+    :type get_chunks: callable
+
+    :param lowest: The lowest finite value of the column
+    :type lowest: float
+
+    :param highest: The highest finite value of the column
+    :type highest: float
+
+    :returns: The count by bin label
+    :rtype: dict
+    """
+    _edges = np.linspace(lowest, highest, HISTOGRAM_BINS + 1)
+    _counts = np.zeros(HISTOGRAM_BINS, dtype=np.int64)
+    _negative, _positive = 0, 0
+    for _chunk in get_chunks():
+        _array = _chunk.to_numpy(dtype=np.float64, na_value=np.nan)
+        _counts += np.histogram(_array[np.isfinite(_array)], bins=_edges)[0]
+        _negative += int(np.count_nonzero(_array == -np.inf))
+        _positive += int(np.count_nonzero(_array == np.inf))
+    _labels = _format_edges(_edges)
+    counts = {f'{_labels[_i]} - {_labels[_i + 1]}': int(_counts[_i]) for _i in range(HISTOGRAM_BINS)}
+    if _negative:
+        counts = {'-inf': _negative, **counts}
+    if _positive:
+        counts['inf'] = _positive
+    return counts
+
+
+def profile_chunks(get_chunks, dtype):
+    """
+    Summarize the distribution of a column which is read in chunks, see profile_column. The chunks are read once, or
+    twice for a histogram, so the column never has to be in memory as a whole.
+
+    :param get_chunks: Function which returns an iterable of the chunks of the column, as Series
+    :type get_chunks: callable
+
+    :param dtype: The type of the column
+    :type dtype: np.dtype
+
+    :rtype: dict
+    """
+    _numeric = pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype)
+    _distinct, _top = HyperLogLog(), SpaceSaving(TOP_VALUES * 2)
+    _lowest, _highest = np.inf, -np.inf
+    for _chunk in get_chunks():
+        _distinct.update(_chunk)
+        _top.update(_chunk)
+        if _numeric:
+            _array = _chunk.to_numpy(dtype=np.float64, na_value=np.nan)
+            _array = _array[np.isfinite(_array)]
+            if len(_array):
+                _lowest, _highest = min(_lowest, _array.min()), max(_highest, _array.max())
+    distinct = _distinct.count()
+
+    if distinct <= TOP_VALUES:
+        summary = 'counts'
+        counts = _get_counts(_top.get_top(TOP_VALUES))
+    elif _numeric and _lowest < _highest:
+        summary = 'histogram'
+        counts = _get_histogram(get_chunks, _lowest, _highest)
+    else:
+        summary = 'top-values'
+        counts = _get_counts(_top.get_top(TOP_VALUES))
+    return {'summary': summary, 'counts': counts, 'distinct': distinct}
+
+
+def profile_column(values):
+    """
+    Summarize the distribution of a column in a bounded amount of labels, whatever the amount of rows. Numeric columns
+    with many distinct values get a histogram, other columns get the counts of their most frequent values.
+
+    :param values: The column to profile
+    :type values: Series
+
+    :returns: The summary type ('counts', 'histogram' or 'top-values'), the count by label and the approximate amount
+              of distinct values
+    :rtype: dict
+    """
+    return profile_chunks(
+        lambda: (values.iloc[_start:_start + CHUNK_ROWS] for _start in range(0, len(values), CHUNK_ROWS)),
+        values.dtype)
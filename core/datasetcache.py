@@ -0,0 +1,556 @@
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import shutil
+import threading
+from uuid import uuid4
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+from core.columnarwriter import ColumnarWriter
+
+
+class DatasetCache:
+    __FORMAT = 2
+    __SCHEMA_NAME = 'schema.json'
+    __HASH_BLOCK = 1 << 20  # Bytes of the uploaded file hashed at once
+    __upload_lock = threading.Lock()  # Stores an upload uploaded twice at the same time once
+    UPLOAD_DIR = 'uploads'  # Directory holding the uploads by content hash, within the dataset directory
+    CHUNK_ROWS = 100000  # Rows parsed at once while ingesting an upload
+
+    def __init__(self, dataset_dir):
+        """
+        Columnar binary cache of parsed datasets. Every column is stored as a raw binary file next to a schema, so a
+        dataset is memory-mapped back in instead of parsing the uploaded CSV or JSON file again.
+
+        :param dataset_dir: The directory where datasets can be found
+        :type dataset_dir: str
+        """
+        self.__dataset_dir = dataset_dir
+        self.__cache_dir = os.path.join(dataset_dir, 'cache')
+
+    def __get_location(self, dataset_name):
+        """
+        Request the directory holding the cache of a dataset
+
+        :param dataset_name: The filename of the dataset, eg. an UUID4 with extension
+        :type dataset_name: str
+
+        :rtype: str
+        """
+        return os.path.join(self.__cache_dir, dataset_name)
+
+    def __get_source_signature(self, dataset_name):
+        """
+        Identify the current version of the uploaded file, a cache for another version is stale
+
+        :param dataset_name: The filename of the dataset
+        :type dataset_name: str
+
+        :rtype: dict
+        """
+        _stat = os.stat(os.path.join(self.__dataset_dir, dataset_name))
+        return {'size': _stat.st_size, 'mtime': _stat.st_mtime_ns}
+
+    def __hash_source(self, dataset_name):
+        """
+        Hash the contents of the uploaded file of a dataset, the hash of the current cache is reused if there is one
+
+        :param dataset_name: The filename of the dataset
+        :type dataset_name: str
+
+        :rtype: str
+        """
+        _cached = self.open(dataset_name)
+        if _cached is not None and _cached.source_hash is not None:
+            return _cached.source_hash
+        _digest = hashlib.sha256()
+        with open(os.path.join(self.__dataset_dir, dataset_name), 'rb') as f:
+            for _block in iter(lambda: f.read(DatasetCache.__HASH_BLOCK), b''):
+                _digest.update(_block)
+        return _digest.hexdigest()
+
+    @staticmethod
+    def __get_content_key(content, operations):
+        """
+        Identify the contents of a dataset by the contents it was edited from and the edits applied since. Every edit
+        is chained onto the key by itself, so the key does not depend on which edits were materialized together.
+
+        :param content: The content key of the edited dataset, the hash of the uploaded file if it was not edited
+        :type content: str
+
+        :param operations: The edits applied since, see TransformationLog
+        :type operations: list
+
+        :rtype: str
+        """
+        for _operation in operations or []:
+            # Sequence numbers do not change the contents, the same edits made in another project give the same dataset
+            _edit = {_key: _value for _key, _value in _operation.items() if _key != 'seq'}
+            content = hashlib.sha256(json.dumps([content, _edit], sort_keys=True).encode('utf-8')).hexdigest()
+        return content
+
+    def read_source(self, dataset_name):
+        """
+        Parse the uploaded file of a dataset
+
+        :param dataset_name: The filename of the dataset
+        :type dataset_name: str
+
+        :rtype: DataFrame or None
+        """
+        if '.csv' in dataset_name:
+            return pd.read_csv(os.path.join(self.__dataset_dir, dataset_name))
+        elif 'json' in dataset_name:
+            return pd.read_json(os.path.join(self.__dataset_dir, dataset_name))
+        return None
+
+    def read_dataset(self, dataset_name):
+        """
+        Load a dataset from its cache, or parse the uploaded file and cache it when the cache is missing or stale
+
+        :param dataset_name: The filename of the dataset
+        :type dataset_name: str
+
+        :returns: The dataset and the sequence number of the last edit it contains
+        :rtype: tuple
+        """
+        dataset, sequence = self.load(dataset_name)
+        if dataset is None:
+            dataset = self.read_source(dataset_name)
+            if dataset is not None:
+                self.store(dataset_name, dataset)
+        return dataset, sequence
+
+    def open(self, dataset_name):
+        """
+        Memory-map the cache of a dataset, without reading any rows yet
+
+        :param dataset_name: The filename of the dataset
+        :type dataset_name: str
+
+        :returns: The cached dataset, or None if there is no up-to-date cache
+        :rtype: CachedDataset or None
+        """
+        _location = self.__get_location(dataset_name)
+        try:
+            with open(os.path.join(_location, DatasetCache.__SCHEMA_NAME), 'r', encoding='utf-8') as f:
+                schema = json.load(f)
+        except FileNotFoundError:
+            return None
+
+        if schema['format'] != DatasetCache.__FORMAT or \
+                schema['source'] != self.__get_source_signature(dataset_name):
+            logging.info(f'The cache of dataset {dataset_name} is stale')
+            return None
+        return CachedDataset(_location, schema)
+
+    def load(self, dataset_name):
+        """
+        Load a dataset from its cache
+
+        :param dataset_name: The filename of the dataset
+        :type dataset_name: str
+
+        :returns: The dataset, or None if there is no up-to-date cache, and the sequence number of the last edit it
+                  contains, see TransformationLog
+        :rtype: tuple
+        """
+        _cached = self.open(dataset_name)
+        if _cached is None:
+            return None, 0
+        dataset = _cached.read(0, _cached.rows)
+        logging.info(f'Loaded dataset {dataset_name} from cache')
+        return dataset, _cached.sequence
+
+    def __publish(self, dataset_name, writer, tmp_location, sequence, source_hash, content):
+        """
+        Finish a cache written to a temporary directory and move it into place
+
+        :param dataset_name: The filename of the dataset
+        :type dataset_name: str
+
+        :param writer: The writer holding the columns
+        :type writer: ColumnarWriter
+
+        :param tmp_location: The directory the writer writes to
+        :type tmp_location: str
+
+        :param sequence: The sequence number of the last edit applied to the dataset, see TransformationLog
+        :type sequence: int
+
+        :param source_hash: The hash of the uploaded file
+        :type source_hash: str
+
+        :param content: The content key of the dataset, see DatasetRegistry
+        :type content: str
+        """
+        _location = self.__get_location(dataset_name)
+        writer.finish(format=DatasetCache.__FORMAT,
+                      source=self.__get_source_signature(dataset_name),
+                      sequence=sequence,
+                      source_hash=source_hash,
+                      content=content)
+        # Memory-mapped files of the replaced cache stay valid until they are closed
+        shutil.rmtree(_location, ignore_errors=True)
+        os.rename(tmp_location, _location)
+
+    def store(self, dataset_name, dataset, sequence=0, operations=None):
+        """
+        Write the cache of a dataset, replacing the current cache
+
+        :param dataset_name: The filename of the dataset
+        :type dataset_name: str
+
+        :param dataset: The parsed dataset
+        :type dataset: DataFrame
+
+        :param sequence: The sequence number of the last edit applied to the dataset, see TransformationLog
+        :type sequence: int
+
+        :param operations: The edits applied to the dataset up to the sequence number, at least the ones after the
+                           current cache, they identify its contents
+        :type operations: list
+
+        :returns: If the cache was written
+        :rtype: bool
+        """
+        _tmp_location = f'{self.__get_location(dataset_name)}.{uuid4()}.tmp'
+        try:
+            _source_hash = self.__hash_source(dataset_name)
+            _cached = self.open(dataset_name)
+            if _cached is None or not _cached.sequence:
+                _content = DatasetCache.__get_content_key(_source_hash, operations)
+            elif _cached.content is not None:
+                # The edits the current cache contains may already be dropped from the log
+                _content = DatasetCache.__get_content_key(_cached.content, [
+                    _operation for _operation in operations or [] if _operation['seq'] > _cached.sequence
+                ])
+            else:
+                _content = None
+            writer = ColumnarWriter(_tmp_location)
+            writer.append(dataset)
+            self.__publish(dataset_name, writer, _tmp_location, sequence, _source_hash, _content)
+            logging.info(f'Cached dataset {dataset_name}')
+            return 1
+        except Exception as e:
+            logging.error(f'Error caching dataset {dataset_name}: {e}')
+            shutil.rmtree(_tmp_location, ignore_errors=True)
+            return 0
+
+    @staticmethod
+    def get_upload_name(content, data_type):
+        """
+        Request the filename an upload is stored under, the same contents are stored once
+
+        :param content: The hash of the uploaded file
+        :type content: str
+
+        :param data_type: The extension of the uploaded file
+        :type data_type: str
+
+        :rtype: str
+        """
+        return f'{DatasetCache.UPLOAD_DIR}/{content}.{data_type}'
+
+    def __link(self, upload_name, dataset_name):
+        """
+        Give a dataset the contents of a stored upload, its file and the files of its cache are hard links to the ones
+        of the upload so they take no space of their own. Writing a cache never changes existing files, so the links
+        stay identical to the upload.
+
+        :param upload_name: The filename of the stored upload
+        :type upload_name: str
+
+        :param dataset_name: The filename of the dataset
+        :type dataset_name: str
+        """
+        _link(os.path.join(self.__dataset_dir, upload_name), os.path.join(self.__dataset_dir, dataset_name))
+        _source = self.__get_location(upload_name)
+        if self.open(upload_name) is None:
+            return
+        _tmp_location = f'{self.__get_location(dataset_name)}.{uuid4()}.tmp'
+        os.makedirs(_tmp_location)
+        for _file in os.listdir(_source):
+            if _file != DatasetCache.__SCHEMA_NAME:
+                _link(os.path.join(_source, _file), os.path.join(_tmp_location, _file))
+        # The schema is written last, a directory without schema is incomplete. The source signatures of a file and its
+        # hard link are the same, so the schema holds for the dataset as well.
+        shutil.copyfile(os.path.join(_source, DatasetCache.__SCHEMA_NAME),
+                        os.path.join(_tmp_location, DatasetCache.__SCHEMA_NAME))
+        shutil.rmtree(self.__get_location(dataset_name), ignore_errors=True)
+        os.rename(_tmp_location, self.__get_location(dataset_name))
+
+    def ingest(self, dataset_name, stream):
+        """
+        Save an uploaded dataset while hashing it and parsing it, a chunk of rows at a time, into a compact cache. CSV
+        files are parsed in the same pass as they are written to disk, JSON documents are parsed after writing them.
+        Uploads are stored once by the hash of their contents, an upload which has been stored before is not stored or
+        cached again. The dataset links to the stored upload, see remove_upload.
+
+        :param dataset_name: The filename to save the dataset as
+        :type dataset_name: str
+
+        :param stream: The uploaded file
+        :type stream: BinaryIO
+
+        :returns: The hash of the upload, or None if it could not be saved. A dataset which could not be parsed is
+                  saved anyway.
+        :rtype: str or None
+        """
+        _data_type = dataset_name.rsplit('.', 1)[1]
+        os.makedirs(os.path.join(self.__dataset_dir, DatasetCache.UPLOAD_DIR), exist_ok=True)
+        os.makedirs(os.path.join(self.__cache_dir, DatasetCache.UPLOAD_DIR), exist_ok=True)
+        _tmp_upload = os.path.join(self.__dataset_dir, DatasetCache.UPLOAD_DIR, f'{uuid4()}.tmp.{_data_type}')
+        _tmp_location = f'{self.__get_location(dataset_name)}.{uuid4()}.tmp'
+        writer = ColumnarWriter(_tmp_location, compact=True)
+        _digest = hashlib.sha256()
+        try:
+            _parsed = True
+            with open(_tmp_upload, 'wb') as f:
+                _tee = StreamTee(stream, f, _digest)
+                try:
+                    if '.csv' in dataset_name:
+                        for _chunk in pd.read_csv(_tee, chunksize=DatasetCache.CHUNK_ROWS):
+                            writer.append(_chunk)
+                except Exception as e:
+                    logging.error(f'Error parsing dataset {dataset_name}: {e}')
+                    _parsed = False
+                finally:
+                    # Save and hash whatever the parser did not read
+                    while _tee.read(DatasetCache.__HASH_BLOCK):
+                        pass
+
+            content = _digest.hexdigest()
+            _upload = DatasetCache.get_upload_name(content, _data_type)
+            with DatasetCache.__upload_lock:
+                if os.path.exists(os.path.join(self.__dataset_dir, _upload)):
+                    logging.info(f'Dataset {dataset_name} has been uploaded before as {_upload}')
+                else:
+                    os.replace(_tmp_upload, os.path.join(self.__dataset_dir, _upload))
+                if _parsed and self.open(_upload) is None:
+                    try:
+                        if writer.is_empty:
+                            # JSON documents, or a CSV file without rows
+                            writer.append(self.read_source(_upload))
+                        self.__publish(_upload, writer, _tmp_location, 0, content, content)
+                    except Exception as e:
+                        logging.error(f'Error parsing dataset {dataset_name}: {e}')
+                self.__link(_upload, dataset_name)
+            logging.info(f'Ingested dataset {dataset_name}')
+            return content
+        except Exception as e:
+            logging.error(f'Error ingesting dataset {dataset_name}: {e}')
+            return None
+        finally:
+            if os.path.exists(_tmp_upload):
+                os.remove(_tmp_upload)
+            shutil.rmtree(_tmp_location, ignore_errors=True)
+
+    def remove_upload(self, upload_name):
+        """
+        Delete a stored upload and its cache, once no dataset links to it anymore
+
+        :param upload_name: The filename of the stored upload, see get_upload_name
+        :type upload_name: str
+        """
+        with DatasetCache.__upload_lock:
+            pathlib.Path(os.path.join(self.__dataset_dir, upload_name)).unlink(missing_ok=True)
+            self.clear(upload_name)
+
+    def clear(self, dataset_name):
+        """
+        Delete the cache of a dataset
+
+        :param dataset_name: The filename of the dataset
+        :type dataset_name: str
+        """
+        shutil.rmtree(self.__get_location(dataset_name), ignore_errors=True)
+
+
+def _link(source, target):
+    """
+    Hard link a file, or copy it with its modification time on file systems without hard links
+    """
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copy2(source, target)
+
+
+class CachedDataset:
+    def __init__(self, location, schema):
+        """
+        Read-only view of a cached dataset, which reads ranges of rows. The column files are memory-mapped once, so a
+        cache which gets replaced while reading does not change the rows read.
+
+        :param location: The directory holding the cache
+        :type location: str
+
+        :param schema: The schema of the cache
+        :type schema: dict
+        """
+        self.rows = schema['rows']
+        self.sequence = schema['sequence']
+        # Caches written before content keys were introduced have none
+        self.source_hash = schema.get('source_hash')
+        self.content = schema.get('content')
+        self.columns = [_column['name'] for _column in schema['columns']]
+        self.__schema = schema
+        self.__arrays = [
+            CachedDataset.__map_array(os.path.join(location, f'{_i}.bin'), _column['dtype'], schema['rows'])
+            for _i, _column in enumerate(schema['columns'])
+        ]
+        # Built once, so reading a range of rows does not take time in the amount of categories
+        self.__lookups = [CachedDataset.__get_lookup(os.path.join(location, f'{_i}.txt'), _column)
+                          for _i, _column in enumerate(schema['columns'])]
+
+    @staticmethod
+    def __get_lookup(location, column):
+        """
+        Create what turns the codes of a column into its values
+
+        :param location: The path of the text file of the column, only text columns have one
+        :type location: str
+
+        :param column: The schema of the column
+        :type column: dict
+
+        :returns: The dtype of a category column, the values by code of an object column, the memory-mapped text file
+                  of a text column, None for other columns
+        :rtype: CategoricalDtype or np.ndarray or None
+        """
+        if column['kind'] == 'text':
+            if os.path.getsize(location) == 0:
+                return np.empty(0, dtype=np.uint8)
+            return np.memmap(location, dtype=np.uint8, mode='r')
+        elif column['kind'] == 'category':
+            return pd.CategoricalDtype(column['categories'], ordered=column['ordered'])
+        elif column['kind'] == 'object':
+            # Missing values have code -1, which points to the NaN appended to the lookup table
+            return np.array(column['categories'] + [np.nan], dtype=object)
+        return None
+
+    @staticmethod
+    def __map_array(location, dtype, rows):
+        """
+        Memory-map a column file read-only
+
+        :rtype: np.ndarray
+        """
+        if rows == 0:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(location, dtype=np.dtype(dtype), mode='r', shape=(rows,))
+
+    @staticmethod
+    def __read_text(text, ends, start, stop):
+        """
+        Read a range of values of a text column, see ColumnarWriter
+
+        :param text: The text file of the column, one JSON value per line
+        :type text: np.ndarray
+
+        :param ends: The offset of the end of the line of every row
+        :type ends: np.ndarray
+
+        :rtype: np.ndarray
+        """
+        values = np.empty(max(0, stop - start), dtype=object)
+        if len(values) == 0:
+            return values
+        _begin = int(ends[start - 1]) if start > 0 else 0
+        _lines = text[_begin:int(ends[stop - 1])].tobytes().decode('utf-8')
+        # JSON escapes line breaks within values, so the lines are the values and can be parsed at once
+        values[:] = json.loads('[' + _lines[:-1].replace('\n', ',') + ']')
+        values[pd.isnull(values)] = np.nan
+        return values
+
+    def read(self, start, stop, columns=None):
+        """
+        Read a range of rows into memory, the DataFrame holds copies of the memory-mapped values, so only the rows read
+        take memory
+
+        :param start: The first row
+        :type start: int
+
+        :param stop: The row after the last row
+        :type stop: int
+
+        :param columns: The names of the columns to read, all columns if None
+        :type columns: list
+
+        :rtype: DataFrame
+        """
+        start, stop = min(start, self.rows), min(stop, self.rows)
+        _positions = range(len(self.columns)) if columns is None else [self.columns.index(_name) for _name in columns]
+        _values = {}
+        for _i in _positions:
+            _kind, _codes = self.__schema['columns'][_i]['kind'], self.__arrays[_i][start:stop]
+            if _kind == 'category':
+                _values[_i] = pd.Categorical.from_codes(_codes, dtype=self.__lookups[_i])
+            elif _kind == 'object':
+                _values[_i] = self.__lookups[_i].take(_codes)
+            elif _kind == 'text':
+                _values[_i] = CachedDataset.__read_text(self.__lookups[_i], self.__arrays[_i], start, stop)
+            else:
+                _values[_i] = _codes
+        dataset = DataFrame(_values, index=pd.RangeIndex(start, max(start, stop)))
+        dataset.columns = [self.columns[_i] for _i in _positions]
+        return dataset
+
+
+class StreamTee:
+    def __init__(self, source, target, digest=None):
+        """
+        Readable stream which writes everything read from the source to the target as well
+
+        :param source: The stream to read from
+        :type source: BinaryIO
+
+        :param target: The stream to copy to
+        :type target: BinaryIO
+
+        :param digest: Optional hash object to update with everything read
+        :type digest: hashlib._Hash
+        """
+        self.__source = source
+        self.__target = target
+        self.__digest = digest
+
+    def __copy(self, data):
+        """
+        Copy data read from the source to the target and the digest
+        """
+        self.__target.write(data)
+        if self.__digest is not None:
+            self.__digest.update(data)
+
+    def read(self, size=-1):
+        """
+        Read from the source and copy the data to the target
+
+        :rtype: bytes
+        """
+        data = self.__source.read(size)
+        self.__copy(data)
+        return data
+
+    def readline(self, size=-1):
+        """
+        Read a line from the source and copy it to the target
+
+        :rtype: bytes
+        """
+        data = self.__source.readline(size)
+        self.__copy(data)
+        return data
+
+    def __iter__(self):
+        """
+        Iterate over the lines of the source, pandas only accepts iterable streams
+        """
+        return iter(self.readline, b'')
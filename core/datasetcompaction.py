@@ -0,0 +1,132 @@
+import numpy as np
+import pandas as pd
+from pandas import DataFrame, Series
+
+from core.columnarwriter import ColumnarWriter
+
+NULLABLE_INTEGER_TYPES = ['Int8', 'Int16', 'Int32', 'Int64']
+
+
+def get_column_memory(values):
+    """
+    Request the amount of bytes a column takes in memory, including the Python objects it points to
+
+    :param values: The column to measure
+    :type values: Series
+
+    :rtype: int
+    """
+    return int(values.memory_usage(index=False, deep=True))
+
+
+def _get_integer_type(values):
+    """
+    Request the smallest nullable integer type which can hold every value of an integral column
+
+    :param values: The non-missing values of the column
+    :type values: np.ndarray
+
+    :rtype: str
+    """
+    if len(values) == 0:
+        return NULLABLE_INTEGER_TYPES[0]
+    _min, _max = values.min(), values.max()
+    for _type in NULLABLE_INTEGER_TYPES:
+        _info = np.iinfo(_type.lower())
+        if _info.min <= _min and _max <= _info.max:
+            return _type
+    return None
+
+
+def compact_column(values):
+    """
+    Convert a column to the smallest type which holds the same values. Integers are downcast, floats holding only whole
+    numbers become (nullable) integers, other floats become float32 when that is lossless and text columns with few
+    unique values become categories.
+
+    :param values: The column to compact
+    :type values: Series
+
+    :returns: The compacted column, or the column itself if it can not be compacted
+    :rtype: Series
+    """
+    _kind = values.dtype.kind if isinstance(values.dtype, np.dtype) else None
+    if _kind is not None and _kind in 'iu':
+        return pd.to_numeric(values, downcast='integer' if _kind == 'i' else 'unsigned')
+    elif _kind == 'f':
+        _array = values.to_numpy()
+        _present = _array[~np.isnan(_array)]
+        if np.isfinite(_present).all() and (_present == np.round(_present)).all():
+            _type = _get_integer_type(_present)
+            if _type is not None:
+                if len(_present) == len(_array):
+                    return values.astype(_type.lower())
+                return values.astype(_type)
+        _round_trip = _array.astype(np.float32).astype(_array.dtype)
+        if ((_round_trip == _array) | np.isnan(_array)).all():
+            return values.astype(np.float32)
+    elif _kind == 'O' and pd.api.types.infer_dtype(values, skipna=True) == 'string':
+        if values.nunique() <= len(values) * ColumnarWriter.CATEGORY_RATIO:
+            return values.astype('category')
+    return values
+
+
+def compact_columns(dataset, columns=None):
+    """
+    Compact the columns of a dataset, the dataset itself is not changed
+
+    :param dataset: The dataset to compact
+    :type dataset: DataFrame
+
+    :param columns: The names of the columns to compact, all columns if None
+    :type columns: list
+
+    :returns: The compacted columns by name, only the columns which changed type, and a report with the memory usage
+              of every compacted column before and after compaction
+    :rtype: tuple
+    """
+    compacted, report = {}, {}
+    for _name in dataset.columns.to_list() if columns is None else columns:
+        _values = dataset[_name]
+        _compacted = compact_column(_values)
+        report[_name] = {
+            'dtype': str(_compacted.dtype),
+            'before': get_column_memory(_values),
+            'after': get_column_memory(_compacted)
+        }
+        if _compacted.dtype != _values.dtype:
+            compacted[_name] = _compacted
+    return compacted, report
+
+
+def to_float32(values):
+    """
+    Convert features or targets to a contiguous float32 array, which Keras uses without converting it again. Arrays
+    which already are are returned as they are.
+
+    :param values: The values to convert
+    :type values: DataFrame or np.ndarray
+
+    :rtype: np.ndarray
+    """
+    return np.ascontiguousarray(np.asarray(values, dtype=np.float32))
+
+
+def to_numpy_types(dataset):
+    """
+    Convert nullable integer and categorical columns back to plain NumPy types, which scikit-learn and Keras expect
+
+    :param dataset: The dataset to convert
+    :type dataset: DataFrame
+
+    :rtype: DataFrame
+    """
+    _types = {}
+    for _name, _type in dataset.dtypes.items():
+        if isinstance(_type, pd.CategoricalDtype):
+            _types[_name] = _type.categories.dtype
+        elif str(_type) in NULLABLE_INTEGER_TYPES:
+            _types[_name] = np.float64
+    if not _types:
+        return dataset
+    return dataset.astype(_types)
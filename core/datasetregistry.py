@@ -0,0 +1,53 @@
+import logging
+import threading
+import weakref
+
+
+class DatasetRegistry:
+    def __init__(self):
+        """
+        Loaded datasets by content key, so runtimes which open the same uploaded file with the same edits share one
+        DataFrame instead of each loading a copy. Datasets are kept as long as a runtime holds them.
+
+        Shared datasets are read-only: edits create a new DataFrame which shares the columns it does not change, see
+        ProjectRuntime, so a runtime only gets its own copy of the columns it edits.
+        """
+        self.__lock = threading.Lock()
+        self.__datasets = weakref.WeakValueDictionary()
+
+    def read_dataset(self, dataset_cache, dataset_name):
+        """
+        Request a dataset, shared with other runtimes when its cache has the same content key
+
+        :param dataset_cache: The cache of the dataset
+        :type dataset_cache: DatasetCache
+
+        :param dataset_name: The filename of the dataset
+        :type dataset_name: str
+
+        :returns: The dataset and the sequence number of the last edit it contains, see DatasetCache.read_dataset
+        :rtype: tuple
+        """
+        _cached = dataset_cache.open(dataset_name)
+        if _cached is None or _cached.content is None:
+            return dataset_cache.read_dataset(dataset_name)
+        with self.__lock:
+            dataset = self.__datasets.get(_cached.content)
+        if dataset is not None:
+            logging.info(f'Sharing loaded dataset {dataset_name}')
+            return dataset, _cached.sequence
+
+        dataset = _cached.read(0, _cached.rows)
+        with self.__lock:
+            # Another runtime may have loaded the same dataset meanwhile, the first one is kept
+            dataset = self.__datasets.setdefault(_cached.content, dataset)
+        logging.info(f'Loaded dataset {dataset_name} from cache')
+        return dataset, _cached.sequence
+
+    def __len__(self):
+        with self.__lock:
+            return len(self.__datasets)
+
+
+# Shared by all runtimes in this process
+SHARED_DATASETS = DatasetRegistry()
@@ -0,0 +1,309 @@
+"""
+Out-of-core access to datasets: views which read ranges of rows from the columnar cache of a dataset, and input
+pipelines which read a dataset in chunks while a model trains on it, so memory does not grow with the size of the
+dataset.
+"""
+import os
+
+import numpy as np
+import tensorflow as tf
+
+from core.datasetcache import DatasetCache
+from core.datasetcompaction import to_numpy_types, to_float32
+from core.transformationlog import TransformationLog
+
+_MASK = (1 << 64) - 1
+
+
+def get_split_fractions(index, random_state):
+    """
+    Hash row numbers to uniform fractions in [0, 1), the same row always gets the same fraction for a random state,
+    whichever chunk it is read in
+
+    :param index: The row numbers
+    :type index: np.ndarray
+
+    :param random_state: The seed of the split
+    :type random_state: int
+
+    :rtype: np.ndarray
+    """
+    # SplitMix64 finalizer, unsigned arithmetic wraps around
+    _z = np.asarray(index, dtype=np.uint64) + np.uint64((int(random_state) * 0x9E3779B97F4A7C15) & _MASK)
+    _z = _z + np.uint64(0x9E3779B97F4A7C15)
+    _z = (_z ^ (_z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    _z = (_z ^ (_z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    _z = _z ^ (_z >> np.uint64(31))
+    return (_z >> np.uint64(11)).astype(np.float64) / float(1 << 53)
+
+
+class DatasetView:
+    ROW_EDITS = [TransformationLog.RENAME, TransformationLog.DROP, TransformationLog.REPLACE]
+
+    def __init__(self, cached, operations):
+        """
+        Read-only view of a materialized dataset with the edits made after it was materialized, which reads ranges of
+        rows from the memory-mapped cache instead of holding the dataset in memory. Only edits which depend on the
+        values within a row can be replayed on a range of rows.
+
+        :param cached: The materialized dataset
+        :type cached: CachedDataset
+
+        :param operations: The edits made after the dataset was materialized, see TransformationLog
+        :type operations: list
+        """
+        for _operation in operations:
+            if _operation['op'] not in DatasetView.ROW_EDITS:
+                # Preprocessing fits on the whole dataset, it has to be materialized first
+                raise ValueError(f'Edit {_operation["op"]} can not be applied while streaming')
+        self.rows = cached.rows
+        self.sequence = operations[-1]['seq'] if operations else cached.sequence
+        self.__cached = cached
+        self.__operations = list(operations)
+        # The cached column every column is read from, edits only rename and drop columns
+        self.__sources = {_column: _column for _column in cached.columns}
+        for _operation in operations:
+            if _operation['op'] == TransformationLog.RENAME:
+                self.__sources = {
+                    (_operation['new_name'] if _name == _operation['old_name'] else _name): _source
+                    for _name, _source in self.__sources.items()
+                }
+            elif _operation['op'] == TransformationLog.DROP:
+                self.__sources.pop(_operation['column'])
+        self.columns = list(self.__sources.keys())
+
+    @staticmethod
+    def open(dataset_dir, dataset_name, sequence):
+        """
+        Open the view of a dataset up to an edit
+
+        :param dataset_dir: The directory where datasets can be found
+        :type dataset_dir: str
+
+        :param dataset_name: The filename of the dataset
+        :type dataset_name: str
+
+        :param sequence: The sequence number of the last edit to include, see TransformationLog
+        :type sequence: int
+
+        :rtype: DatasetView
+        """
+        _cached = DatasetCache(dataset_dir).open(dataset_name)
+        if _cached is None or _cached.sequence > sequence:
+            raise ValueError(f'The materialized dataset {dataset_name} changed, start training again')
+        return DatasetView(_cached, [
+            _operation for _operation in TransformationLog(
+                os.path.join(dataset_dir, f'{dataset_name}.log')).get_operations(after=_cached.sequence)
+            if _operation['seq'] <= sequence
+        ])
+
+    def extend(self, operation):
+        """
+        Create the view with one more edit, this view does not change
+
+        :param operation: The edit, see TransformationLog
+        :type operation: dict
+
+        :rtype: DatasetView
+        """
+        return DatasetView(self.__cached, self.__operations + [operation])
+
+    @staticmethod
+    def __apply_operations(chunk, operations):
+        """
+        Replay edits which only depend on the values within a row on a chunk, edits of columns which were not read are
+        skipped
+
+        :rtype: DataFrame
+        """
+        for _operation in operations:
+            if _operation['op'] == TransformationLog.RENAME:
+                chunk = chunk.rename(columns={_operation['old_name']: _operation['new_name']})
+            elif _operation['column'] not in chunk.columns:
+                continue
+            elif _operation['op'] == TransformationLog.DROP:
+                chunk = chunk.drop([_operation['column']], axis=1)
+            else:
+                chunk = chunk.assign(**{
+                    _operation['column']: chunk[_operation['column']].replace(_operation['old_value'],
+                                                                              _operation['new_value'])
+                })
+        return chunk
+
+    def read(self, start, stop, columns=None):
+        """
+        Read a range of rows with the edits applied
+
+        :param start: The first row
+        :type start: int
+
+        :param stop: The row after the last row
+        :type stop: int
+
+        :param columns: The names of the columns to read, all columns if None
+        :type columns: list
+
+        :rtype: DataFrame
+        """
+        if columns is None:
+            columns = self.columns
+        _chunk = self.__cached.read(start, stop, [self.__sources[_column] for _column in columns])
+        return DatasetView.__apply_operations(_chunk, self.__operations)[columns]
+
+
+class DatasetStream:
+    TRAIN = 'train'
+    VALIDATION = 'validation'
+    TEST = 'test'
+    CHUNK_ROWS = 50000  # Rows read from disk at once
+
+    def __init__(self, dataset_dir, dataset_name, sequence, output_columns, train_size, validation_split=0.0,
+                 random_state=0, chunk_rows=CHUNK_ROWS):
+        """
+        Stream the rows of a materialized dataset in batches of float32 features and targets. Rows are assigned to the
+        train, validation or test subset by a hash of their row number, so the split is deterministic without shuffling
+        the dataset in memory. The stream only holds the location of the dataset, it can be sent to a training worker
+        process cheaply and opens the dataset when it is first read.
+
+        :param dataset_dir: The directory where datasets can be found
+        :type dataset_dir: str
+
+        :param dataset_name: The filename of the dataset
+        :type dataset_name: str
+
+        :param sequence: The sequence number of the last edit to include, see TransformationLog
+        :type sequence: int
+
+        :param output_columns: The target columns, the other columns are features
+        :type output_columns: list
+
+        :param train_size: The fraction of rows used for training and validation
+        :type train_size: float
+
+        :param validation_split: The fraction of the training rows held out for validation
+        :type validation_split: float
+
+        :param random_state: The seed of the split
+        :type random_state: int
+
+        :param chunk_rows: The amount of rows read from disk at once
+        :type chunk_rows: int
+        """
+        self.__dataset_dir = os.path.abspath(dataset_dir)
+        self.__dataset_name = dataset_name
+        self.__sequence = sequence
+        self.__output_columns = list(output_columns)
+        self.__bounds = {
+            DatasetStream.TRAIN: (0.0, train_size * (1.0 - validation_split)),
+            DatasetStream.VALIDATION: (train_size * (1.0 - validation_split), train_size),
+            DatasetStream.TEST: (train_size, 1.0)
+        }
+        self.__random_state = random_state
+        self.__chunk_rows = chunk_rows
+        self.__view, self.__input_columns = None, None
+
+    def __getstate__(self):
+        # The memory-mapped dataset is opened again by the process which reads it
+        _state = dict(self.__dict__)
+        _state['_DatasetStream__view'] = None
+        return _state
+
+    def __open(self):
+        """
+        Memory-map the cached dataset with the edits made after it was materialized
+        """
+        if self.__view is not None:
+            return
+        _view = DatasetView.open(self.__dataset_dir, self.__dataset_name, self.__sequence)
+        self.__input_columns = [_column for _column in _view.columns if _column not in self.__output_columns]
+        self.__view = _view
+
+    @property
+    def input_shape(self):
+        """
+        The shape of one input sample
+
+        :rtype: tuple
+        """
+        self.__open()
+        return (len(self.__input_columns),)
+
+    def __read_chunks(self, subset, rng=None):
+        """
+        Read the rows of a subset chunk by chunk, in a random chunk and row order if a generator is given
+
+        :returns: A generator of features and targets
+        :rtype: generator
+        """
+        self.__open()
+        _low, _high = self.__bounds[subset]
+        _starts = np.arange(0, self.__view.rows, self.__chunk_rows)
+        if rng is not None:
+            rng.shuffle(_starts)
+        for _start in _starts:
+            _stop = min(_start + self.__chunk_rows, self.__view.rows)
+            _fractions = get_split_fractions(np.arange(_start, _stop), self.__random_state)
+            _rows = np.flatnonzero((_fractions >= _low) & (_fractions < _high))
+            if len(_rows) == 0:
+                continue
+            if rng is not None:
+                rng.shuffle(_rows)
+            _chunk = self.__view.read(_start, _stop).iloc[_rows]
+            yield to_float32(to_numpy_types(_chunk[self.__input_columns])), \
+                to_float32(to_numpy_types(_chunk[self.__output_columns]))
+
+    def __read_batches(self, subset, batch_size, shuffle):
+        """
+        Cut the chunks of a subset into batches, batches span chunk borders so all but the last one are full
+
+        :returns: A generator of features and targets
+        :rtype: generator
+        """
+        _x, _y = None, None
+        for _chunk_x, _chunk_y in self.__read_chunks(subset, np.random.RandomState() if shuffle else None):
+            if _x is not None:
+                _chunk_x, _chunk_y = np.concatenate([_x, _chunk_x]), np.concatenate([_y, _chunk_y])
+            _full = len(_chunk_x) - len(_chunk_x) % batch_size
+            for _start in range(0, _full, batch_size):
+                yield _chunk_x[_start:_start + batch_size], _chunk_y[_start:_start + batch_size]
+            _x, _y = _chunk_x[_full:], _chunk_y[_full:]
+        if _x is not None and len(_x):
+            yield _x, _y
+
+    def is_empty(self, subset):
+        """
+        Check if no rows belong to a subset, only the row numbers are hashed
+
+        :rtype: bool
+        """
+        self.__open()
+        _low, _high = self.__bounds[subset]
+        for _start in range(0, self.__view.rows, self.__chunk_rows):
+            _fractions = get_split_fractions(np.arange(_start, min(_start + self.__chunk_rows, self.__view.rows)),
+                                             self.__random_state)
+            if np.any((_fractions >= _low) & (_fractions < _high)):
+                return 0
+        return 1
+
+    def get_dataset(self, subset, batch_size, shuffle=False):
+        """
+        Build an input pipeline over a subset, which reads the next chunk while the model trains on the previous batch.
+        Every pass over the pipeline reads the dataset from disk again, a shuffled pipeline in a new order.
+
+        :param subset: One of TRAIN, VALIDATION or TEST
+        :type subset: str
+
+        :param batch_size: The amount of rows in a batch
+        :type batch_size: int
+
+        :param shuffle: Shuffle the chunks and the rows within a chunk every pass
+        :type shuffle: bool
+
+        :rtype: tf.data.Dataset
+        """
+        self.__open()
+        return tf.data.Dataset.from_generator(
+            lambda: self.__read_batches(subset, batch_size, shuffle),
+            output_types=(tf.float32, tf.float32),
+            output_shapes=((None, len(self.__input_columns)), (None, len(self.__output_columns)))
+        ).prefetch(tf.data.experimental.AUTOTUNE)
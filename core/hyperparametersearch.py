@@ -0,0 +1,427 @@
+import copy
+import itertools
+import logging
+import math
+import os
+import random
+import shutil
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from core.modelcomponents import LAYER_OPTIONS
+
+GRID = 'grid'
+RANDOM = 'random'
+SUCCESSIVE_HALVING = 'successive-halving'
+HYPERBAND = 'hyperband'
+STRATEGIES = {
+    GRID: 'Grid: train every combination of values',
+    RANDOM: 'Random: train randomly sampled combinations',
+    SUCCESSIVE_HALVING: 'Successive halving: train sampled combinations for a few epochs, keep training the best',
+    HYPERBAND: 'Hyperband: successive halving with several trade-offs between combinations and epochs'
+}
+
+# Model parameters which can be searched, described like LAYER_OPTIONS
+MODEL_OPTIONS = {
+    'epochs': {
+        'description': 'The amount of passes over the training data, the largest value is the budget of halving',
+        'inputInfo': {
+            'type': 'number',
+            'min': 1,
+            'max': None
+        }
+    },
+    'batch-size': {
+        'description': 'The amount of rows used for every update of the weights',
+        'inputInfo': {
+            'type': 'number',
+            'min': 1,
+            'max': None
+        }
+    }
+}
+
+MAX_TRIALS = 200  # Maximum amount of combinations a search trains
+GRID_RANGE_POINTS = 3  # Evenly spaced values a grid takes from a range
+REDUCTION_FACTOR = 3  # Successive halving keeps the best 1 / REDUCTION_FACTOR of the trials in every rung
+
+
+def _parse_number(text, input_info):
+    """
+    Parse a whole number within the bounds of a parameter
+
+    :rtype: int
+    """
+    try:
+        value = int(text.strip())
+    except ValueError:
+        raise ValueError(f'{text.strip()} is not a whole number')
+    if input_info.get('min') is not None and value < input_info['min']:
+        raise ValueError(f'{value} is below the minimum of {input_info["min"]}')
+    if input_info.get('max') is not None and value > input_info['max']:
+        raise ValueError(f'{value} is above the maximum of {input_info["max"]}')
+    return value
+
+
+def parse_values(text, input_info):
+    """
+    Parse the values to search for a parameter, a comma separated list of values or a range of numbers written as
+    min..max
+
+    :param text: The values as entered by the user
+    :type text: str
+
+    :param input_info: The input information of the parameter, see LAYER_OPTIONS
+    :type input_info: dict
+
+    :returns: The values as {'choices': [...]} or {'range': [min, max]}, None if no values were entered
+    :rtype: dict or None
+    """
+    text = text.strip()
+    if len(text) == 0:
+        return None
+    if input_info['type'] == 'select':
+        _known = {_value.lower(): _value for _value in input_info['values'].keys()}
+        choices = []
+        for _value in [_item.strip() for _item in text.split(',') if len(_item.strip()) > 0]:
+            if _value.lower() not in _known:
+                raise ValueError(f'{_value} is not one of {", ".join(_known.values())}')
+            if _known[_value.lower()] not in choices:
+                choices.append(_known[_value.lower()])
+        return {'choices': choices}
+    if '..' in text:
+        _low, _high = [_parse_number(_item, input_info) for _item in text.split('..', 1)]
+        if _low > _high:
+            raise ValueError(f'The range {text} is empty')
+        return {'range': [_low, _high]}
+    return {'choices': sorted({_parse_number(_item, input_info) for _item in text.split(',') if len(_item.strip()) > 0})}
+
+
+def get_search_space(model, fields):
+    """
+    Build a search space from submitted fields, model parameters are read from the fields named after them and layer
+    parameters from the fields named layer-<layer id>-<parameter>
+
+    :param model: The model of the project
+    :type model: dict
+
+    :param fields: The submitted fields
+    :type fields: dict
+
+    :returns: The values to search by model parameter and by layer id and parameter
+    :rtype: dict
+    """
+    space = {'model': {}, 'layers': {}}
+    for _name, _option in MODEL_OPTIONS.items():
+        try:
+            _values = parse_values(fields.get(_name, ''), _option['inputInfo'])
+        except ValueError as e:
+            raise ValueError(f'{_name}: {e}')
+        if _values is not None:
+            space['model'][_name] = _values
+    for _layer in sorted(model['layers'], key=lambda x: x['order']):
+        for _name, _option in LAYER_OPTIONS[_layer['layerType']].items():
+            try:
+                _values = parse_values(fields.get(f'layer-{_layer["layerId"]}-{_name}', ''), _option['inputInfo'])
+            except ValueError as e:
+                raise ValueError(f'{_layer["layerType"]} layer {_layer["order"] + 1} {_name}: {e}')
+            if _values is not None:
+                space['layers'].setdefault(_layer['layerId'], {})[_name] = _values
+    return space
+
+
+def _get_dimensions(space, budget=None):
+    """
+    Flatten a search space to a list of parameter paths and their values
+
+    :param budget: The model parameter which is the budget of halving, it is not searched
+    :type budget: str
+
+    :rtype: list
+    """
+    dimensions = [(('model', _name), _values) for _name, _values in space['model'].items() if _name != budget]
+    for _layer_id, _params in space['layers'].items():
+        dimensions += [(('layers', _layer_id, _name), _values) for _name, _values in _params.items()]
+    return dimensions
+
+
+def _get_grid_values(values):
+    """
+    Request the values a grid takes for a parameter
+
+    :rtype: list
+    """
+    if 'choices' in values:
+        return values['choices']
+    _low, _high = values['range']
+    return sorted({int(round(_low + (_high - _low) * _i / (GRID_RANGE_POINTS - 1))) for _i in range(GRID_RANGE_POINTS)})
+
+
+def _get_random_value(values, generator):
+    """
+    Draw a random value for a parameter
+
+    :type generator: random.Random
+    """
+    if 'choices' in values:
+        return generator.choice(values['choices'])
+    return generator.randint(*values['range'])
+
+
+def _to_values(dimensions, combination):
+    """
+    Convert a combination of values of the dimensions to nested trial values
+
+    :rtype: dict
+    """
+    values = {'layers': {}}
+    for (_path, _), _value in zip(dimensions, combination):
+        if _path[0] == 'model':
+            values[_path[1]] = _value
+        else:
+            values['layers'].setdefault(_path[1], {})[_path[2]] = _value
+    return values
+
+
+def apply_trial(params, values):
+    """
+    Apply the values of a trial to model parameters
+
+    :param params: The model parameters, they are not changed
+    :type params: dict
+
+    :param values: The trial values
+    :type values: dict
+
+    :returns: A copy of the model parameters with the trial values
+    :rtype: dict
+    """
+    params = copy.deepcopy(params)
+    for _name in MODEL_OPTIONS.keys():
+        if _name in values:
+            params[_name] = values[_name]
+    for _layer in params['layers']:
+        _layer['parameters'].update(values['layers'].get(_layer['layerId'], {}))
+    return params
+
+
+def _get_log(value, base):
+    """
+    Request the largest whole power of base which is at most value
+
+    :rtype: int
+    """
+    _power = 0
+    while base ** (_power + 1) <= value:
+        _power += 1
+    return _power
+
+
+class HyperparameterSearch:
+    def __init__(self, params, space, strategy, train, directory, trials=10, workers=1,
+                 reduction=REDUCTION_FACTOR, random_state=None):
+        """
+        Search the model parameters of a project for the combination with the lowest validation loss. Trials of a rung
+        are trained concurrently by a pool of workers, successive halving and Hyperband stop bad trials after a few
+        epochs and continue training the best trials from their stored model.
+
+        :param params: The model parameters of the project
+        :type params: dict
+
+        :param space: The values to search, see get_search_space
+        :type space: dict
+
+        :param strategy: The search strategy, one of STRATEGIES
+        :type strategy: str
+
+        :param train: Function which trains a trial, called with the model parameters, the path to store the model at,
+                      the definition hash of the stored model to continue training or None and the stop event. It
+                      returns the train scoring and the definition hash of the stored model.
+        :type train: callable
+
+        :param directory: The directory to store the models of trials in, it is removed after the search
+        :type directory: str
+
+        :param trials: The amount of sampled combinations, unused by grid and Hyperband searches
+        :type trials: int
+
+        :param workers: The amount of trials trained at the same time
+        :type workers: int
+
+        :param reduction: Successive halving keeps the best 1 / reduction of the trials in every rung
+        :type reduction: int
+
+        :param random_state: Seed of sampled combinations
+        :type random_state: int
+        """
+        if strategy not in STRATEGIES:
+            raise ValueError(f'There is no search strategy {strategy}')
+        self.__params = params
+        self.__strategy = strategy
+        self.__train = train
+        self.__directory = directory
+        self.__workers = max(1, workers)
+        self.__reduction = reduction
+        self.__random = random.Random(random_state)
+        self.__trials = []
+
+        # Halving spends epochs as budget, instead of searching them
+        _halving = strategy in [SUCCESSIVE_HALVING, HYPERBAND]
+        self.__dimensions = _get_dimensions(space, budget='epochs' if _halving else None)
+        self.__max_epochs = max(_get_grid_values(space['model']['epochs'])) if 'epochs' in space['model'] \
+            else int(params['epochs'])
+        self.__brackets = self.__get_brackets(trials)
+        if sum(_bracket[0][0] for _bracket in self.__brackets) > MAX_TRIALS:
+            raise ValueError(f'The search has more than {MAX_TRIALS} combinations')
+
+    def __get_brackets(self, trials):
+        """
+        Plan the search as brackets of rungs, every rung trains an amount of trials up to an amount of epochs. Trials
+        of a rung are the best trials of the previous rung of their bracket.
+
+        :returns: For every bracket a list of rungs, as (trials, epochs) tuples, epochs is None to train trials for
+                  their own amount of epochs
+        :rtype: list
+        """
+        if self.__strategy == GRID:
+            return [[(math.prod(len(_get_grid_values(_values)) for _, _values in self.__dimensions), None)]]
+        elif self.__strategy == RANDOM:
+            return [[(trials, None)]]
+        _eta = self.__reduction
+        if self.__strategy == SUCCESSIVE_HALVING:
+            _rungs = min(_get_log(trials, _eta), _get_log(self.__max_epochs, _eta))
+            return [[(max(1, trials // _eta ** _i), max(1, int(round(self.__max_epochs / _eta ** (_rungs - _i)))))
+                     for _i in range(_rungs + 1)]]
+        # Hyperband runs successive halving from many trials with few epochs up to few trials with all epochs
+        _largest = _get_log(self.__max_epochs, _eta)
+        brackets = []
+        for _bracket in range(_largest, -1, -1):
+            _trials = int(math.ceil((_largest + 1) / (_bracket + 1) * _eta ** _bracket))
+            brackets.append([(max(1, _trials // _eta ** _i),
+                              max(1, int(round(self.__max_epochs / _eta ** (_bracket - _i)))))
+                             for _i in range(_bracket + 1)])
+        return brackets
+
+    def __create_trials(self, amount):
+        """
+        Create trials with new combinations of values
+
+        :rtype: list
+        """
+        if self.__strategy == GRID:
+            _combinations = itertools.product(*[_get_grid_values(_values) for _, _values in self.__dimensions])
+        else:
+            _combinations = ([_get_random_value(_values, self.__random) for _, _values in self.__dimensions]
+                             for _ in range(amount))
+        trials = []
+        for _combination in _combinations:
+            trials.append({
+                'trial': len(self.__trials) + 1,
+                'values': _to_values(self.__dimensions, _combination),
+                'epochs': 0,
+                'model-hash': None,
+                'loss': None,
+                'accuracy': None,
+                'error': None
+            })
+            self.__trials.append(trials[-1])
+        return trials
+
+    def __train_trial(self, trial, epochs, stop_event):
+        """
+        Train a trial up to an amount of epochs, continuing from its stored model
+
+        :param epochs: The total amount of epochs, the trial's own amount if None
+        :type epochs: int
+        """
+        if stop_event is not None and stop_event.is_set():
+            return
+        _params = apply_trial(self.__params, trial['values'])
+        if epochs is None:
+            epochs = int(_params['epochs'])
+        _params['epochs'] = epochs - trial['epochs']
+        _scoring, trial['model-hash'] = self.__train(_params, os.path.join(self.__directory, f'{trial["trial"]}.h5'),
+                                                     trial['model-hash'], stop_event)
+        # Trials are ranked by validation metrics, the test data is kept for the final model
+        _loss = _scoring.get('val_loss') or _scoring.get('loss')
+        _accuracy = _scoring.get('val_accuracy') or _scoring.get('accuracy')
+        # Early stopping restores the weights of the best epoch, which are the weights the trial continues from
+        _epoch = _scoring['early_stopping']['best_epoch'] - 1 \
+            if _scoring.get('early_stopping', {}).get('best_epoch') else -1
+        trial.update(epochs=epochs, loss=_loss[_epoch] if _loss else None,
+                     accuracy=_accuracy[_epoch] if _accuracy else None)
+
+    @staticmethod
+    def __get_rank_key(trial):
+        """
+        Sort trials which trained longest first, then by validation loss, failed trials last
+
+        :rtype: tuple
+        """
+        return trial['error'] is not None or trial['loss'] is None, -trial['epochs'], \
+            trial['loss'] if trial['loss'] is not None else math.inf
+
+    def run(self, stop_event=None, progress=None):
+        """
+        Run the search, a stopped search returns the trials finished so far
+
+        :param stop_event: Optional event which stops the search when it is set
+        :type stop_event: threading.Event
+
+        :param progress: Optional channel to publish search progress to
+        :type progress: ProgressChannel
+
+        :returns: The leaderboard, see get_leaderboard
+        :rtype: list
+        """
+        _planned = sum(_trials for _bracket in self.__brackets for _trials, _ in _bracket)
+        _done = 0
+        os.makedirs(self.__directory, exist_ok=True)
+        try:
+            with ThreadPoolExecutor(max_workers=self.__workers, thread_name_prefix='search-trial') as executor:
+                for _bracket in self.__brackets:
+                    _trials = self.__create_trials(_bracket[0][0])
+                    for _rung, (_amount, _epochs) in enumerate(_bracket):
+                        if _rung > 0:
+                            _trials = sorted(_trials, key=HyperparameterSearch.__get_rank_key)[:_amount]
+                        _futures = {
+                            executor.submit(self.__train_trial, _trial, _epochs, stop_event): _trial
+                            for _trial in _trials
+                        }
+                        for _future in as_completed(_futures):
+                            try:
+                                _future.result()
+                            except Exception as e:
+                                logging.error(f'Search trial {_futures[_future]["trial"]} failed: {e}')
+                                _futures[_future]['error'] = str(e)
+                            _done += 1
+                            if progress is not None:
+                                _best = self.get_leaderboard()[0]
+                                progress.publish(trial=_done, trials=_planned, best=_best['loss'])
+                        if stop_event is not None and stop_event.is_set():
+                            return self.get_leaderboard()
+        finally:
+            shutil.rmtree(self.__directory, ignore_errors=True)
+        return self.get_leaderboard()
+
+    def get_leaderboard(self):
+        """
+        Rank the trials of the search
+
+        :returns: The rank, trial number, trial values, trained epochs, validation loss and accuracy and error of every
+                  trial
+        :rtype: list
+        """
+        leaderboard = []
+        for _rank, _trial in enumerate(sorted(self.__trials, key=HyperparameterSearch.__get_rank_key)):
+            leaderboard.append({
+                'rank': _rank + 1,
+                'trial': _trial['trial'],
+                # The trained epochs replace the searched epochs, so applying a trial reproduces it
+                'values': {**_trial['values'], 'epochs': _trial['epochs']},
+                'batch-size': _trial['values'].get('batch-size', self.__params['batch-size']),
+                'epochs': _trial['epochs'],
+                'loss': _trial['loss'],
+                'accuracy': _trial['accuracy'],
+                'error': _trial['error']
+            })
+        return leaderboard
@@ -0,0 +1,233 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from uuid import uuid4
+
+from core.progresschannel import ProgressChannel
+
+
+class JobManager:
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    FINISHED = 'finished'
+    FAILED = 'failed'
+    CANCELLED = 'cancelled'
+    __ACTIVE_STATES = [QUEUED, RUNNING]
+
+    def __init__(self, workers=1, progress_interval=0.5):
+        """
+        Run long tasks, like training a model, on a pool of background workers so requests do not wait for them. Every
+        project has at most one active job, the record of its last job is kept until a new job is submitted.
+
+        :param workers: The amount of jobs which can run at the same time
+        :type workers: int
+
+        :param progress_interval: The minimal amount of seconds between two throttled progress updates of a job
+        :type progress_interval: float
+        """
+        self.__executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='job-worker')
+        self.__lock = threading.Lock()
+        self.__jobs = {}
+        self.__futures = {}
+        self.__stop_events = {}
+        self.__progress = {}
+        self.__progress_interval = progress_interval
+        self.__project_jobs = {}
+
+    def submit(self, username, project_name, target):
+        """
+        Queue a job for a project, unless the project already has an active job
+
+        :param username: The owner of the project
+        :type username: str
+
+        :param project_name: The project the job belongs to
+        :type project_name: str
+
+        :param target: The function to run, called with a threading.Event which is set when the job gets cancelled and
+                       a ProgressChannel to publish progress to
+        :type target: callable
+
+        :returns: The id of the queued job, or of the job which was already active
+        :rtype: str
+        """
+        with self.__lock:
+            _current = self.__project_jobs.get((username, project_name))
+            if _current is not None and self.__jobs[_current]['state'] in JobManager.__ACTIVE_STATES:
+                return _current
+            if _current is not None:
+                self.__forget(_current)
+
+            job_id = str(uuid4())
+            self.__jobs[job_id] = {
+                'id': job_id,
+                'username': username,
+                'project': project_name,
+                'state': JobManager.QUEUED,
+                'submitted': time.time(),
+                'started': None,
+                'finished': None,
+                'error': None
+            }
+            self.__stop_events[job_id] = threading.Event()
+            self.__progress[job_id] = ProgressChannel(self.__progress_interval)
+            self.__progress[job_id].publish(state=JobManager.QUEUED)
+            self.__project_jobs[(username, project_name)] = job_id
+            self.__futures[job_id] = self.__executor.submit(self.__run, job_id, target)
+        logging.info(f'Queued job {job_id} for project {project_name} of user {username}')
+        return job_id
+
+    def __forget(self, job_id):
+        """
+        Drop the record of a job which is no longer active, must be called while holding the lock
+
+        :param job_id: The job to forget
+        :type job_id: str
+        """
+        _job = self.__jobs.pop(job_id)
+        self.__futures.pop(job_id, None)
+        self.__stop_events.pop(job_id, None)
+        self.__progress.pop(job_id, None)
+        if self.__project_jobs.get((_job['username'], _job['project'])) == job_id:
+            del self.__project_jobs[(_job['username'], _job['project'])]
+
+    def __set_state(self, job_id, state, **fields):
+        """
+        Change the state of a job
+
+        :param job_id: The job to update
+        :type job_id: str
+
+        :param state: The new state
+        :type state: str
+
+        :param fields: Other fields of the job record to update
+        """
+        with self.__lock:
+            if job_id in self.__jobs:
+                self.__jobs[job_id].update(state=state, **fields)
+                _progress = self.__progress[job_id]
+            else:
+                return
+        if state in JobManager.__ACTIVE_STATES:
+            _progress.publish(state=state)
+        else:
+            _progress.close(state=state, error=fields.get('error'))
+
+    def __run(self, job_id, target):
+        """
+        Run a job on a worker and record its outcome
+
+        :param job_id: The job to run
+        :type job_id: str
+
+        :param target: The function to run
+        :type target: callable
+        """
+        with self.__lock:
+            stop_event, progress = self.__stop_events[job_id], self.__progress[job_id]
+        if stop_event.is_set():
+            self.__set_state(job_id, JobManager.CANCELLED, finished=time.time())
+            return
+        self.__set_state(job_id, JobManager.RUNNING, started=time.time())
+        try:
+            target(stop_event, progress)
+            _state = JobManager.CANCELLED if stop_event.is_set() else JobManager.FINISHED
+            self.__set_state(job_id, _state, finished=time.time())
+            logging.info(f'Job {job_id} {_state}')
+        except Exception as e:
+            logging.error(f'Job {job_id} failed: {e}')
+            self.__set_state(job_id, JobManager.FAILED, finished=time.time(), error=str(e))
+
+    def get_job(self, job_id):
+        """
+        Request the record of a job
+
+        :param job_id: The job to request
+        :type job_id: str
+
+        :returns: A copy of the job record, or None if the job does not exist
+        :rtype: dict or None
+        """
+        with self.__lock:
+            if job_id in self.__jobs:
+                return dict(self.__jobs[job_id])
+        return None
+
+    def get_project_job(self, username, project_name):
+        """
+        Request the record of the last job of a project
+
+        :param username: The owner of the project
+        :type username: str
+
+        :param project_name: The project to request the job for
+        :type project_name: str
+
+        :returns: A copy of the job record, or None if the project has no job
+        :rtype: dict or None
+        """
+        with self.__lock:
+            _job_id = self.__project_jobs.get((username, project_name))
+        return self.get_job(_job_id) if _job_id is not None else None
+
+    def has_active_job(self, username, project_name):
+        """
+        Check if a project has a queued or running job
+
+        :param username: The owner of the project
+        :type username: str
+
+        :param project_name: The project to check
+        :type project_name: str
+
+        :rtype: bool
+        """
+        _job = self.get_project_job(username, project_name)
+        if _job is not None and _job['state'] in JobManager.__ACTIVE_STATES:
+            return 1
+        return 0
+
+    def get_progress(self, job_id):
+        """
+        Request the progress channel of a job
+
+        :param job_id: The job to request progress for
+        :type job_id: str
+
+        :returns: The channel, or None if the job does not exist
+        :rtype: ProgressChannel or None
+        """
+        with self.__lock:
+            return self.__progress.get(job_id)
+
+    def cancel(self, job_id):
+        """
+        Cancel a job, a queued job will not start and a running job is asked to stop
+
+        :param job_id: The job to cancel
+        :type job_id: str
+
+        :returns: If the job was still active
+        :rtype: bool
+        """
+        with self.__lock:
+            if job_id not in self.__jobs or self.__jobs[job_id]['state'] not in JobManager.__ACTIVE_STATES:
+                return 0
+            self.__stop_events[job_id].set()
+            _cancelled = self.__futures[job_id].cancel()
+        if _cancelled:
+            self.__set_state(job_id, JobManager.CANCELLED, finished=time.time())
+        logging.info(f'Cancelled job {job_id}')
+        return 1
+
+    def shutdown(self):
+        """
+        Cancel all jobs and wait for running jobs to stop
+        """
+        with self.__lock:
+            _job_ids = list(self.__jobs.keys())
+        for _job_id in _job_ids:
+            self.cancel(_job_id)
+        self.__executor.shutdown(wait=True)
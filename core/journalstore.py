@@ -0,0 +1,273 @@
+import atexit
+import json
+import logging
+import os
+import shutil
+import threading
+
+
+class JournalStore:
+    def __init__(self, location, flush_interval=1.0, compact_size=4 * 1024 * 1024):
+        """
+        Open a key-value database which keeps its data in memory, like PickleDB, but writes changes to an append-only
+        journal next to the database file. The journal is fsynced every flush interval and compacted into a new
+        snapshot of the database in the background once it grows larger than compact_size.
+
+        :param location: The path of the database snapshot, a plain JSON file compatible with PickleDB
+        :type location: str
+
+        :param flush_interval: The amount of seconds between two journal fsyncs
+        :type flush_interval: float
+
+        :param compact_size: The journal size in bytes from which the journal is compacted into a new snapshot
+        :type compact_size: int
+        """
+        self.__location = os.path.expanduser(location)
+        self.__journal_location = f'{self.__location}.journal'
+        self.__rotated_journal_location = f'{self.__location}.journal.old'
+        self.__flush_interval = flush_interval
+        self.__compact_size = compact_size
+        self.__lock = threading.RLock()
+        self.__compact_lock = threading.Lock()
+        self.__db = {}
+        self.__dirty = False
+
+        replayed = self.__load()
+        self.__journal = open(self.__journal_location, 'a', encoding='utf-8')
+        self.__journal_size = os.path.getsize(self.__journal_location)
+        if replayed:
+            # Start from a clean snapshot so the rotated journal can be reused
+            self.compact()
+
+        self.__closed = threading.Event()
+        self.__flusher = threading.Thread(target=self.__flush_loop, name='journalstore-flusher', daemon=True)
+        self.__flusher.start()
+        atexit.register(self.close)
+
+    def __load(self):
+        """
+        Load the last snapshot and replay the journals written after it
+
+        :returns: The amount of replayed journal entries
+        :rtype: int
+        """
+        if os.path.exists(self.__location):
+            with open(self.__location, 'r', encoding='utf-8') as f:
+                self.__db = json.load(f)
+
+        replayed = 0
+        for _journal in [self.__rotated_journal_location, self.__journal_location]:
+            if not os.path.exists(_journal):
+                continue
+            with open(_journal, 'r', encoding='utf-8') as f:
+                for _line in f:
+                    try:
+                        _entry = json.loads(_line)
+                    except json.JSONDecodeError:
+                        # Written while crashing, the rotated journal can have more entries appended after it
+                        logging.warning(f'Ignoring incomplete entry in journal {_journal}')
+                        continue
+                    if _entry['op'] == 'set':
+                        self.__db[_entry['key']] = _entry['value']
+                    elif _entry['op'] == 'rem':
+                        self.__db.pop(_entry['key'], None)
+                    replayed += 1
+        if replayed > 0:
+            logging.info(f'Replayed {replayed} journal entries for database {self.__location}')
+        return replayed
+
+    def __append(self, entry):
+        """
+        Append an entry to the journal, must be called while holding the lock
+
+        :param entry: The change to write
+        :type entry: dict
+        """
+        _line = json.dumps(entry) + '\n'
+        self.__journal.write(_line)
+        self.__journal_size += len(_line)
+        self.__dirty = True
+
+    def get(self, key):
+        """
+        Request the value of a key
+
+        :param key: The key to request
+        :type key: str
+
+        :returns: The value or False if the key does not exist, like PickleDB
+        """
+        with self.__lock:
+            return self.__db.get(key, False)
+
+    def set(self, key, value):
+        """
+        Set the value of a key
+
+        :param key: The key to set
+        :type key: str
+
+        :param value: A JSON serializable value
+        :type value: Any
+
+        :rtype: bool
+        """
+        with self.__lock:
+            self.__append({'op': 'set', 'key': key, 'value': value})
+            self.__db[key] = value
+        return True
+
+    def rem(self, key):
+        """
+        Remove a key
+
+        :param key: The key to remove
+        :type key: str
+
+        :rtype: bool
+        """
+        with self.__lock:
+            if key not in self.__db:
+                return False
+            self.__append({'op': 'rem', 'key': key})
+            del self.__db[key]
+        return True
+
+    def exists(self, key):
+        """
+        Check if a key exists
+
+        :param key: The key to check
+        :type key: str
+
+        :rtype: bool
+        """
+        with self.__lock:
+            return key in self.__db
+
+    def getall(self):
+        """
+        Request all keys
+
+        :rtype: list
+        """
+        with self.__lock:
+            return list(self.__db.keys())
+
+    def transaction(self):
+        """
+        Group reads and writes so no other thread interleaves with them
+
+        :rtype: threading.RLock
+        """
+        return self.__lock
+
+    def dump(self):
+        """
+        Force writing the database to disk as a new snapshot
+
+        :rtype: bool
+        """
+        self.compact()
+        return True
+
+    def flush(self):
+        """
+        Write buffered journal entries to disk and fsync the journal
+        """
+        with self.__lock:
+            if not self.__dirty:
+                return
+            self.__journal.flush()
+            self.__dirty = False
+            _fileno = os.dup(self.__journal.fileno())
+        try:
+            # Syncing happens outside of the lock, writers only wait for the buffer flush
+            os.fsync(_fileno)
+        finally:
+            os.close(_fileno)
+
+    def compact(self):
+        """
+        Replace the snapshot by the current state of the database and drop the journal entries it contains
+        """
+        with self.__compact_lock:
+            with self.__lock:
+                snapshot = json.dumps(self.__db)
+                # Rotate the journal, new changes are written to an empty journal while the snapshot is written
+                self.__journal.flush()
+                self.__journal.close()
+                self.__rotate()
+                self.__journal = open(self.__journal_location, 'a', encoding='utf-8')
+                self.__journal_size = 0
+                self.__dirty = False
+
+            # Write the snapshot next to the current one and atomically swap them
+            _tmp_location = f'{self.__location}.tmp'
+            with open(_tmp_location, 'w', encoding='utf-8') as f:
+                f.write(snapshot)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(_tmp_location, self.__location)
+            self.__fsync_directory()
+            os.remove(self.__rotated_journal_location)
+            logging.debug(f'Compacted database {self.__location}')
+
+    def __rotate(self):
+        """
+        Move the journal aside while a snapshot is written, must be called while holding both locks. A rotated journal
+        which is still there holds entries of a failed compaction the snapshot lacks, the journal is appended to it.
+        """
+        if not os.path.exists(self.__rotated_journal_location):
+            os.replace(self.__journal_location, self.__rotated_journal_location)
+            return
+        logging.warning(f'Keeping the journal of a failed compaction of database {self.__location}')
+        with open(self.__rotated_journal_location, 'rb+') as _rotated:
+            _rotated.seek(0, os.SEEK_END)
+            if _rotated.tell() > 0:
+                _rotated.seek(-1, os.SEEK_END)
+                if _rotated.read(1) != b'\n':
+                    # Do not append to an entry which was cut off while crashing
+                    _rotated.write(b'\n')
+            with open(self.__journal_location, 'rb') as _journal:
+                shutil.copyfileobj(_journal, _rotated)
+            _rotated.flush()
+            os.fsync(_rotated.fileno())
+        os.remove(self.__journal_location)
+
+    def __fsync_directory(self):
+        """
+        Make the snapshot rename durable, not supported on every platform
+        """
+        try:
+            _fd = os.open(os.path.dirname(os.path.abspath(self.__location)), os.O_RDONLY)
+            try:
+                os.fsync(_fd)
+            finally:
+                os.close(_fd)
+        except OSError:
+            pass
+
+    def __flush_loop(self):
+        """
+        Periodically fsync the journal and compact it once it grows too large
+        """
+        while not self.__closed.wait(self.__flush_interval):
+            try:
+                self.flush()
+                if self.__journal_size > self.__compact_size:
+                    self.compact()
+            except Exception as e:
+                logging.error(f'Error persisting database {self.__location}: {e}')
+
+    def close(self):
+        """
+        Stop the background flusher and write a final snapshot
+        """
+        if self.__closed.is_set():
+            return
+        self.__closed.set()
+        self.__flusher.join()
+        self.compact()
+        with self.__lock:
+            self.__journal.close()
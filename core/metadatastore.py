@@ -0,0 +1,215 @@
+import logging
+
+from core.journalstore import JournalStore
+from core.sqlitestore import SQLiteStore
+
+
+class MetadataStore:
+    USER = 'user'
+    PROJECT = 'project'
+    DATASET = 'dataset'
+    MODEL = 'model'
+    UPLOAD = 'upload'
+    CONFIG = 'config'
+    __INDEX = 'index'
+    __SEPARATOR = '/'
+    # Documents used before records were keyed per user & project, mapped to the kind of record they hold
+    __LEGACY_DOCUMENTS = {
+        'users': USER,
+        'projects': PROJECT,
+        'datasets': DATASET,
+        'models': MODEL
+    }
+
+    def __init__(self, db_instance):
+        """
+        Initialise a store of records keyed by (user) or (user, project)
+
+        :param db_instance: The key-value database connector
+        :type db_instance: JournalStore or SQLiteStore
+        """
+        self.__db_client = db_instance
+        self.__migrate_legacy_documents()
+
+    @staticmethod
+    def __get_key(*parts):
+        """
+        Build the database key for a record
+
+        :rtype: str
+        """
+        return MetadataStore.__SEPARATOR.join(parts)
+
+    def get_record(self, kind, *keys):
+        """
+        Request a single record
+
+        :param kind: The kind of record, one of USER, PROJECT, DATASET, MODEL, UPLOAD or CONFIG
+        :type kind: str
+
+        :param keys: The username, followed by the project name for project bound records, the setting name or the
+                     content hash of an upload
+        :type keys: str
+
+        :returns: The record or None if it does not exist
+        :rtype: dict or None
+        """
+        _key = MetadataStore.__get_key(kind, *keys)
+        if self.__db_client.exists(_key):
+            return self.__db_client.get(_key)
+        return None
+
+    def set_record(self, kind, record, *keys):
+        """
+        Create or overwrite a single record
+
+        :param kind: The kind of record, one of USER, PROJECT, DATASET, MODEL, UPLOAD or CONFIG
+        :type kind: str
+
+        :param record: The data to store
+        :type record: dict
+
+        :param keys: The username, followed by the project name for project bound records, the setting name or the
+                     content hash of an upload
+        :type keys: str
+        """
+        self.__db_client.set(MetadataStore.__get_key(kind, *keys), record)
+
+    def remove_record(self, kind, *keys):
+        """
+        Delete a single record if it exists
+
+        :param kind: The kind of record, one of USER, PROJECT, DATASET, MODEL, UPLOAD or CONFIG
+        :type kind: str
+
+        :param keys: The username, followed by the project name for project bound records, the setting name or the
+                     content hash of an upload
+        :type keys: str
+
+        :rtype: bool
+        """
+        _key = MetadataStore.__get_key(kind, *keys)
+        if self.__db_client.exists(_key):
+            self.__db_client.rem(_key)
+            return 1
+        return 0
+
+    def get_index(self, kind, *keys):
+        """
+        Request the ordered list of record names of a kind, eg. all projects of a user
+
+        :param kind: The kind of record to list
+        :type kind: str
+
+        :param keys: The username for project bound records
+        :type keys: str
+
+        :rtype: list
+        """
+        _key = MetadataStore.__get_key(MetadataStore.__INDEX, kind, *keys)
+        if self.__db_client.exists(_key):
+            return self.__db_client.get(_key)
+        return []
+
+    def add_to_index(self, name, kind, *keys):
+        """
+        Register a record name in an index
+
+        :param name: The name to register, a username or project name
+        :type name: str
+
+        :param kind: The kind of record to list
+        :type kind: str
+
+        :param keys: The username for project bound records
+        :type keys: str
+        """
+        with self.transaction():
+            _index = self.get_index(kind, *keys)
+            if name not in _index:
+                _index.append(name)
+                self.__db_client.set(MetadataStore.__get_key(MetadataStore.__INDEX, kind, *keys), _index)
+
+    def remove_from_index(self, name, kind, *keys):
+        """
+        Unregister a record name from an index
+
+        :param name: The name to unregister, a username or project name
+        :type name: str
+
+        :param kind: The kind of record to list
+        :type kind: str
+
+        :param keys: The username for project bound records
+        :type keys: str
+        """
+        with self.transaction():
+            _index = self.get_index(kind, *keys)
+            if name in _index:
+                _index.remove(name)
+                self.__db_client.set(MetadataStore.__get_key(MetadataStore.__INDEX, kind, *keys), _index)
+
+    def rename_in_index(self, old_name, new_name, kind, *keys):
+        """
+        Rename a record name in an index, keeping its position
+
+        :param old_name: The name currently registered
+        :type old_name: str
+
+        :param new_name: The name to register instead
+        :type new_name: str
+
+        :param kind: The kind of record to list
+        :type kind: str
+
+        :param keys: The username for project bound records
+        :type keys: str
+        """
+        with self.transaction():
+            _index = self.get_index(kind, *keys)
+            if old_name in _index:
+                _index[_index.index(old_name)] = new_name
+                self.__db_client.set(MetadataStore.__get_key(MetadataStore.__INDEX, kind, *keys), _index)
+
+    def transaction(self):
+        """
+        Group several reads and writes, they are applied together or not at all when the backend supports it
+        """
+        return self.__db_client.transaction()
+
+    def dump(self):
+        """
+        Force writing the database to disk
+        """
+        self.__db_client.dump()
+
+    def __migrate_legacy_documents(self):
+        """
+        Split the single 'users', 'projects', 'datasets' and 'models' documents of older databases into keyed records
+        """
+        with self.transaction():
+            migrated = 0
+            for _document, _kind in MetadataStore.__LEGACY_DOCUMENTS.items():
+                if not self.__db_client.exists(_document):
+                    continue
+                migrated += 1
+                logging.warning(f'Migrating database document "{_document}" to keyed records ...')
+                data = self.__db_client.get(_document)
+                if isinstance(data, dict):
+                    for _username, _records in data.items():
+                        if _kind == MetadataStore.USER:
+                            self.set_record(_kind, _records, _username)
+                            self.add_to_index(_username, _kind)
+                        elif _kind == MetadataStore.PROJECT:
+                            for _project in _records:
+                                self.set_record(_kind, _project, _username, _project['name'])
+                                self.add_to_index(_project['name'], _kind, _username)
+                        elif _kind == MetadataStore.DATASET:
+                            for _dataset in _records:
+                                self.set_record(_kind, _dataset, _username, _dataset['projectname'])
+                        elif _kind == MetadataStore.MODEL:
+                            for _project_name, _model in _records.items():
+                                self.set_record(_kind, _model, _username, _project_name)
+                self.__db_client.rem(_document)
+        if migrated > 0:
+            self.dump()
@@ -0,0 +1,47 @@
+"""
+Import an existing Kerasuite.db into a SQLite database, usage:
+
+    python3 -m core.migration Kerasuite.db Kerasuite.sqlite
+"""
+import argparse
+import logging
+
+from core.journalstore import JournalStore
+from core.metadatastore import MetadataStore
+from core.sqlitestore import SQLiteStore
+
+
+def migrate_database(source, target):
+    """
+    Copy every key of a journal (or PickleDB) database into a SQLite database
+
+    :param source: The path of the database to import, eg. Kerasuite.db
+    :type source: str
+
+    :param target: The path of the SQLite database to create or update
+    :type target: str
+
+    :returns: The amount of copied keys
+    :rtype: int
+    """
+    source_db = JournalStore(source)
+    target_db = SQLiteStore(target)
+    keys = source_db.getall()
+    with target_db.transaction():
+        for _key in keys:
+            target_db.set(_key, source_db.get(_key))
+    # Databases from before keyed records are split while opening them
+    MetadataStore(target_db)
+    target_db.dump()
+    source_db.close()
+    logging.info(f'Imported {len(keys)} keys from {source} into {target}')
+    return len(keys)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description='Import a Kerasuite.db database into a SQLite database')
+    parser.add_argument('source', help='The database to import, eg. Kerasuite.db')
+    parser.add_argument('target', help='The SQLite database to import into, eg. Kerasuite.sqlite')
+    args = parser.parse_args()
+    migrate_database(args.source, args.target)
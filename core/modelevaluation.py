@@ -0,0 +1,181 @@
+import numpy as np
+
+
+class ModelEvaluation:
+    MAX_CLASSES = 100  # Targets with more classes are not scored per class, the confusion matrix grows quadratically
+
+    def __init__(self, threshold=0.5):
+        """
+        Score a model from its predicted outputs, batch by batch, so the test set is passed through the model once and
+        never has to be held in memory. Loss and accuracy match the mean squared error and accuracy Keras reports, the
+        classification report has the layout of the one of scikit-learn. The confusion matrix and the classification
+        report are only kept for classification targets: one-hot targets, or a single integer target with at most
+        MAX_CLASSES classes.
+
+        :param threshold: The output above which a single output predicts class 1, like Sequential.predict_classes
+        :type threshold: float
+        """
+        self.__threshold = threshold
+        self.__samples = 0
+        self.__squared_error = 0.0
+        self.__correct = 0.0
+        self.__labels = np.empty(0, dtype=np.int64)
+        self.__confusion = np.zeros((0, 0), dtype=np.int64)
+        self.__classification = 1
+
+    def __get_classes(self, y_true, outputs):
+        """
+        Request the true and predicted class of every sample
+
+        :rtype: tuple
+        """
+        if outputs.shape[1] > 1:
+            return np.argmax(y_true, axis=1), np.argmax(outputs, axis=1)
+        return np.rint(y_true[:, 0]).astype(np.int64), (outputs[:, 0] > self.__threshold).astype(np.int64)
+
+    def __add_labels(self, labels):
+        """
+        Grow the confusion matrix with labels which were not seen before
+
+        :param labels: The sorted labels seen so far and in a batch
+        :type labels: np.ndarray
+        """
+        if len(labels) == len(self.__labels):
+            return
+        _positions = np.searchsorted(labels, self.__labels)
+        _confusion = np.zeros((len(labels), len(labels)), dtype=np.int64)
+        _confusion[np.ix_(_positions, _positions)] = self.__confusion
+        self.__labels, self.__confusion = labels, _confusion
+
+    def update(self, y_true, outputs):
+        """
+        Add a batch of samples
+
+        :param y_true: The targets of the batch
+        :type y_true: np.ndarray
+
+        :param outputs: The outputs the model predicted for the batch
+        :type outputs: np.ndarray
+        """
+        y_true = np.asarray(y_true, dtype=np.float64).reshape(len(y_true), -1)
+        outputs = np.asarray(outputs, dtype=np.float64).reshape(len(outputs), -1)
+        if len(y_true) == 0:
+            return
+        self.__samples += len(y_true)
+        self.__squared_error += float(np.square(y_true - outputs).mean(axis=1).sum())
+        _true, _predicted = self.__get_classes(y_true, outputs)
+        if outputs.shape[1] > 1:
+            self.__correct += float((_true == _predicted).sum())
+        else:
+            # Keras scores a single output with binary accuracy, against the raw target
+            self.__correct += float((y_true[:, 0] == _predicted).sum())
+        if not self.__classification:
+            return
+        if outputs.shape[1] == 1 and not np.array_equal(y_true[:, 0], _true):
+            # Continuous targets have no classes, every rounded value would become one
+            self.__stop_classification()
+            return
+        _labels = np.union1d(self.__labels, np.concatenate([_true, _predicted]))
+        if len(_labels) > ModelEvaluation.MAX_CLASSES:
+            self.__stop_classification()
+            return
+        self.__add_labels(_labels)
+        _size = len(self.__labels)
+        self.__confusion += np.bincount(
+            np.searchsorted(self.__labels, _true) * _size + np.searchsorted(self.__labels, _predicted),
+            minlength=_size * _size).reshape(_size, _size)
+
+    def __stop_classification(self):
+        """
+        Stop scoring per class, the target is not a classification target
+        """
+        self.__classification = 0
+        self.__labels = np.empty(0, dtype=np.int64)
+        self.__confusion = np.zeros((0, 0), dtype=np.int64)
+
+    @property
+    def is_classification(self):
+        """
+        Check if the target was scored as a classification target, with a confusion matrix
+
+        :rtype: bool
+        """
+        return self.__classification
+
+    @property
+    def confusion_matrix(self):
+        """
+        The amount of samples by true class (rows) and predicted class (columns), in the order of labels, empty for
+        targets which are not classification targets
+
+        :rtype: np.ndarray
+        """
+        return self.__confusion.copy()
+
+    @property
+    def labels(self):
+        """
+        The classes seen in the targets or predictions, sorted
+
+        :rtype: list
+        """
+        return self.__labels.tolist()
+
+    def get_classification_report(self):
+        """
+        Compute the precision, recall, F1-score and support of every class and their averages
+
+        :returns: The report, empty for targets which are not classification targets
+        :rtype: dict
+        """
+        if not self.__classification:
+            return {}
+        _true_positives = np.diag(self.__confusion).astype(np.float64)
+        _support = self.__confusion.sum(axis=1)
+        _predicted = self.__confusion.sum(axis=0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # Classes without predictions or samples score 0, like scikit-learn does
+            _precision = np.nan_to_num(_true_positives / _predicted)
+            _recall = np.nan_to_num(_true_positives / _support)
+            _f1 = np.nan_to_num(2 * _precision * _recall / (_precision + _recall))
+        report = {
+            str(_label): {
+                'precision': float(_precision[_i]),
+                'recall': float(_recall[_i]),
+                'f1-score': float(_f1[_i]),
+                'support': int(_support[_i])
+            } for _i, _label in enumerate(self.__labels)
+        }
+        _total = int(_support.sum())
+        _weights = _support / _total if _total else np.zeros(len(_support))
+        report['accuracy'] = float(_true_positives.sum() / _total) if _total else 0.0
+        report['macro avg'] = {
+            'precision': float(_precision.mean()) if len(_precision) else 0.0,
+            'recall': float(_recall.mean()) if len(_recall) else 0.0,
+            'f1-score': float(_f1.mean()) if len(_f1) else 0.0,
+            'support': _total
+        }
+        report['weighted avg'] = {
+            'precision': float((_precision * _weights).sum()),
+            'recall': float((_recall * _weights).sum()),
+            'f1-score': float((_f1 * _weights).sum()),
+            'support': _total
+        }
+        return report
+
+    def get_scoring(self):
+        """
+        Request the test scoring, loss and accuracy as percentages
+
+        :rtype: dict
+        """
+        _samples = max(1, self.__samples)
+        return {
+            "test_loss": round(self.__squared_error / _samples * 100.0, 2),
+            "test_accuracy": round(self.__correct / _samples * 100.0, 2),
+            "classification_report": self.get_classification_report(),
+            "confusion_matrix": {
+                'labels': self.labels,
+                'matrix': self.__confusion.tolist()
+            } if self.__classification else None
+        }
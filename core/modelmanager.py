@@ -1,23 +1,304 @@
+import hashlib
+import json
 import logging
+import os
+import threading
+import time
+from collections import OrderedDict
 
+import numpy as np
+
+import tensorflow as tf
 from pandas import DataFrame
-from sklearn.metrics import classification_report
 from tensorflow import keras
 from tensorflow.keras.layers import Dense, Dropout
 
+from core.datasetcompaction import to_float32
+from core.datasetstream import DatasetStream
+from core.modelevaluation import ModelEvaluation
+from core.progresschannel import ProgressChannel
 from core.projectmanager import ProjectManager
+from core.sharedarray import load_rows
 
 
 class LossHistory(keras.callbacks.Callback):
-    # Todo: stream training progress data to the UI
-    def on_train_begin(self, logs={}):
-        self.losses = []
+    def __init__(self, progress=None):
+        """
+        Publish training progress, batch metrics are throttled to the interval of the channel and epoch metrics are
+        always published
+
+        :param progress: The channel to publish to, progress is not published if None
+        :type progress: ProgressChannel
+        """
+        super().__init__()
+        self.__progress = progress
+        self.__epoch = 0
+        self.__history = {}
+        self.__steps, self.__step_time = 0, 0.0
+        self.__epoch_start, self.__last_step = 0.0, 0.0
+
+    @staticmethod
+    def __to_metrics(logs):
+        """
+        Convert Keras logs to JSON serializable metrics
+
+        :rtype: dict
+        """
+        return {_key: float(_value) for _key, _value in (logs or {}).items() if _key not in ['batch', 'size']}
+
+    @property
+    def steps_per_second(self):
+        """
+        The measured training speed, validation is not included
+
+        :rtype: float
+        """
+        return self.__steps / self.__step_time if self.__step_time > 0 else 0.0
+
+    def on_train_begin(self, logs=None):
+        self.__history = {}
+        self.__steps, self.__step_time = 0, 0.0
+        if self.__progress is not None:
+            self.__progress.publish(epochs=self.params.get('epochs'), steps=self.params.get('steps'),
+                                    epoch=0, batch=0, metrics={}, history={})
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.__epoch = epoch
+        self.__epoch_start = self.__last_step = time.perf_counter()
+
+    def on_batch_end(self, batch, logs=None):
+        self.__steps += 1
+        self.__last_step = time.perf_counter()
+        # Called for every batch, the clock check keeps the overhead of skipped updates negligible
+        if self.__progress is not None and self.__progress.is_due():
+            self.__progress.publish(epoch=self.__epoch + 1, batch=batch + 1, metrics=LossHistory.__to_metrics(logs))
+
+    def on_epoch_end(self, epoch, logs=None):
+        # The epoch's training time ends at its last batch, validation runs after it
+        self.__step_time += self.__last_step - self.__epoch_start
+        for _key, _value in LossHistory.__to_metrics(logs).items():
+            self.__history.setdefault(_key, []).append(_value)
+        if self.__progress is not None:
+            self.__progress.publish(epoch=epoch + 1, history={_key: list(_values)
+                                                              for _key, _values in self.__history.items()},
+                                    steps_per_second=self.steps_per_second)
+
+
+class StopTraining(keras.callbacks.Callback):
+    def __init__(self, stop_event):
+        """
+        Stop training after the current batch once an event is set, eg. when a training job gets cancelled
+
+        :param stop_event: The event which requests stopping
+        :type stop_event: threading.Event
+        """
+        super().__init__()
+        self.__stop_event = stop_event
+
+    def on_batch_end(self, batch, logs=None):
+        if self.__stop_event.is_set():
+            self.model.stop_training = True
+
+
+class EarlyStopping(keras.callbacks.Callback):
+    def __init__(self, monitor='val_loss', patience=10, min_delta=0.0):
+        """
+        Stop training once a metric has not improved for an amount of epochs and restore the weights of the best epoch
+        when training ends, also when it ran all epochs. Loss metrics improve by decreasing, other metrics by increasing.
+
+        :param monitor: The metric to watch, eg. val_loss
+        :type monitor: str
+
+        :param patience: The amount of epochs without improvement after which training stops
+        :type patience: int
+
+        :param min_delta: The minimal change of the metric which counts as an improvement
+        :type min_delta: float
+        """
+        super().__init__()
+        self.monitor = monitor
+        self.__patience = patience
+        self.__min_delta = abs(min_delta)
+        self.__sign = -1.0 if 'loss' in monitor else 1.0
+        self.__best, self.__best_weights, self.__wait = None, None, 0
+        self.best_epoch, self.epochs_run, self.stopped = 0, 0, False
+
+    def on_train_begin(self, logs=None):
+        self.__best, self.__best_weights, self.__wait = None, None, 0
+        self.best_epoch, self.epochs_run, self.stopped = 0, 0, False
+
+    def on_epoch_end(self, epoch, logs=None):
+        self.epochs_run = epoch + 1
+        _value = (logs or {}).get(self.monitor)
+        if _value is None:
+            if epoch == 0:
+                logging.warning(f'Early stopping metric {self.monitor} is not available, training all epochs')
+            return
+        _value = self.__sign * float(_value)
+        if self.__best is None or _value > self.__best + self.__min_delta:
+            self.__best, self.__wait, self.best_epoch = _value, 0, epoch + 1
+            self.__best_weights = self.model.get_weights()
+        else:
+            self.__wait += 1
+            if self.__wait >= self.__patience:
+                self.stopped = True
+                self.model.stop_training = True
+
+    def on_train_end(self, logs=None):
+        if self.__best_weights is not None and self.best_epoch < self.epochs_run:
+            logging.info(f'Restoring the weights of epoch {self.best_epoch}')
+            self.model.set_weights(self.__best_weights)
+
+    @property
+    def restored(self):
+        """
+        If the weights of an earlier epoch than the last one have been restored
+
+        :rtype: bool
+        """
+        return self.__best_weights is not None and self.best_epoch < self.epochs_run
+
+
+class CompiledModelCache:
+    def __init__(self, models_per_project=3, models=8):
+        """
+        Cache of compiled models by project and model definition hash, so retraining an unchanged model skips building
+        and compiling it. The least recently used models of a project are evicted first, and the least recently used
+        models of any project once all projects together hold too many.
+
+        :param models_per_project: The maximal amount of cached models per project
+        :type models_per_project: int
+
+        :param models: The maximal amount of cached models of all projects together
+        :type models: int
+        """
+        self.__models_per_project = models_per_project
+        self.__models = models
+        self.__lock = threading.Lock()
+        self.__projects = {}
+        self.__order = OrderedDict()  # Keys of all cached models by project and hash, least recently used first
+
+    def get(self, project_key, model_hash):
+        """
+        Request a cached model
+
+        :param project_key: The owner and name of the project
+        :type project_key: tuple
+
+        :param model_hash: The hash of the model definition
+        :type model_hash: str
+
+        :returns: The cached entry or None
+        """
+        with self.__lock:
+            _models = self.__projects.get(project_key)
+            if _models is None or model_hash not in _models:
+                return None
+            _models.move_to_end(model_hash)
+            self.__order.move_to_end((project_key, model_hash))
+            return _models[model_hash]
+
+    def put(self, project_key, model_hash, entry):
+        """
+        Cache a model, evicting the least recently used model of the project when the project has too many
+
+        :param project_key: The owner and name of the project
+        :type project_key: tuple
+
+        :param model_hash: The hash of the model definition
+        :type model_hash: str
+
+        :param entry: The model and anything needed to reuse it
+        """
+        with self.__lock:
+            _models = self.__projects.setdefault(project_key, OrderedDict())
+            _models[model_hash] = entry
+            _models.move_to_end(model_hash)
+            self.__order[(project_key, model_hash)] = None
+            self.__order.move_to_end((project_key, model_hash))
+            while len(_models) > self.__models_per_project:
+                self.__order.pop((project_key, _models.popitem(last=False)[0]))
+            while len(self.__order) > self.__models:
+                _project_key, _model_hash = self.__order.popitem(last=False)[0]
+                _evicted = self.__projects[_project_key]
+                del _evicted[_model_hash]
+                if not _evicted:
+                    del self.__projects[_project_key]
+
+    def clear(self, project_key):
+        """
+        Drop all cached models of a project
+
+        :param project_key: The owner and name of the project
+        :type project_key: tuple
+        """
+        with self.__lock:
+            for _model_hash in self.__projects.pop(project_key, {}):
+                self.__order.pop((project_key, _model_hash))
+
+    def get_memory_usage(self, project_key):
+        """
+        Estimate the memory the cached models of a project take, their weights and the copy of their initial weights
+
+        :param project_key: The owner and name of the project
+        :type project_key: tuple
+
+        :returns: The amount of bytes
+        :rtype: int
+        """
+        with self.__lock:
+            _models = list(self.__projects.get(project_key, {}).values())
+        return CompiledModelCache.__get_memory(_models)
+
+    def get_memory_report(self):
+        """
+        Estimate the memory the cached models of every project take, see get_memory_usage
+
+        :returns: The amount of bytes by project
+        :rtype: dict
+        """
+        with self.__lock:
+            _projects = {_project_key: list(_models.values()) for _project_key, _models in self.__projects.items()}
+        return {_project_key: CompiledModelCache.__get_memory(_models) for _project_key, _models in _projects.items()}
+
+    @staticmethod
+    def __get_memory(models):
+        """
+        Estimate the memory of cached models, their weights and the copy of their initial weights
+
+        :rtype: int
+        """
+        return sum(2 * sum(_weights.nbytes for _weights in _initial_weights) for _, _initial_weights in models)
 
-    def on_batch_end(self, batch, logs={}):
-        self.losses.append(logs.get('loss'))
+    def __len__(self):
+        with self.__lock:
+            return len(self.__order)
+
+
+# Shared by all trainings in this process, every training worker process has its own cache
+COMPILED_MODELS = CompiledModelCache()
+
+
+def release_compiled_models(project_key):
+    """
+    Drop the compiled models of a project, and clear the Keras session once no project holds compiled models anymore so
+    TensorFlow frees the memory of the models as well
+
+    :param project_key: The owner and name of the project
+    :type project_key: tuple
+    """
+    COMPILED_MODELS.clear(project_key)
+    if len(COMPILED_MODELS) == 0:
+        keras.backend.clear_session()
 
 
 class ModelManager:
+    INPUT_PIPELINE = True  # Feed Keras from tf.data pipelines, False passes the arrays to Keras like before
+    SHUFFLE_BUFFER = 10000  # Rows shuffled at once, the train-test split already shuffled the rows
+    OPTIMIZER = 'adam'
+    LOSS = 'MeanSquaredError'
+    METRICS = ['accuracy']
+
     @staticmethod
     def __get_input_shape(targets):
         """
@@ -27,7 +308,7 @@ class ModelManager:
         logging.debug('Requesting input shape for input data')
         return (targets.shape[1],)
 
-    def __init__(self, project_name, project_manager):
+    def __init__(self, project_name, project_manager=None, model_params=None, username=None):
         """
         Initialise the model manager session
 
@@ -36,11 +317,20 @@ class ModelManager:
 
         :param project_manager: The manager which has database access
         :type project_manager: ProjectManager
+
+        :param model_params: The model parameters to use instead of loading them with the project manager, eg. in a
+                             training worker process without database access
+        :type model_params: dict
+
+        :param username: The owner of the project, which identifies the project in the compiled model cache
+        :type username: str
         """
         self.__project_manager = project_manager
         self.__project_name = project_name
-        self.__model = keras.models.Sequential()
-        self.__layer_count = 0
+        self.__model_params = model_params
+        self.__cache_key = (username, project_name)
+        self.__model = None
+        self.__model_hash = None
 
     def __get_model_params(self):
         """
@@ -48,6 +338,8 @@ class ModelManager:
         :rtype: dict
         """
         logging.debug('Requesting model parameters')
+        if self.__model_params is not None:
+            return self.__model_params
         return self.__project_manager.load_model(self.__project_name)
 
     def __get_layers(self):
@@ -71,6 +363,13 @@ class ModelManager:
         """
         return int(self.__get_model_params()['batch-size'])
 
+    def __get_early_stopping(self):
+        """
+        Load the early stopping settings, with the monitored metric, patience and min-delta
+        :rtype: dict or None
+        """
+        return self.__get_model_params().get('early-stopping')
+
     def __get_validation_split(self):
         """
         Load the validation-split to use during training
@@ -81,47 +380,111 @@ class ModelManager:
             _v /= 100.0
         return float(_v)
 
+    def __get_dataset(self, x, y, shuffle=False):
+        """
+        Build an input pipeline over prepared float32 arrays, which caches the rows and prefetches batches while the
+        model trains on the previous batch
+
+        :param x: The features
+        :type x: np.ndarray
+
+        :param y: The targets
+        :type y: np.ndarray
+
+        :param shuffle: Shuffle the rows again every epoch
+        :type shuffle: bool
+
+        :rtype: tf.data.Dataset
+        """
+        _dataset = tf.data.Dataset.from_tensor_slices((x, y)).cache()
+        if shuffle:
+            _dataset = _dataset.shuffle(min(len(x), ModelManager.SHUFFLE_BUFFER), reshuffle_each_iteration=True)
+        return _dataset.batch(self.__get_batch_size()).prefetch(tf.data.experimental.AUTOTUNE)
+
+    def __get_model_hash(self, input_shape):
+        """
+        Hash everything the compiled model depends on: the layers in order, the optimizer, loss, metrics and input shape
+
+        :param input_shape: The shape of one input sample
+        :type input_shape: tuple
+
+        :rtype: str
+        """
+        _definition = {
+            'layers': [[_layer['layerType'], _layer['parameters']]
+                       for _layer in sorted(self.__get_layers(), key=lambda x: x['order'])],
+            'optimizer': ModelManager.OPTIMIZER,
+            'loss': ModelManager.LOSS,
+            'metrics': ModelManager.METRICS,
+            'input_shape': list(input_shape)
+        }
+        return hashlib.sha256(json.dumps(_definition, sort_keys=True).encode('utf-8')).hexdigest()
+
     def __build_model(self, input_shape):
         """
-        Generate a model based on data from the database
-        """
-        if self.__layer_count < 1:
-            layers = self.__get_layers()
-            # Iterate over layers sorted by order
-            for _layer in sorted(layers, key=lambda x: x['order']):
-                if _layer['layerType'] == 'Dense':
-                    if self.__layer_count == 0:
-                        logging.info('Creating initial Dense layer')
-                        self.__model.add(Dense(
-                            units=_layer['parameters']['units'],
-                            activation=_layer['parameters']['activation'].lower(),
-                            input_shape=input_shape
-                        ))
-                    else:
-                        logging.info('New Dense layer')
-                        self.__model.add(Dense(
-                            units=_layer['parameters']['units'],
-                            activation=_layer['parameters']['activation'].lower()
-                        ))
-                    self.__layer_count += 1
-                elif _layer['layerType'] == 'Dropout':
-                    _r = _layer['parameters']['rate']
-                    if _r >= 1:
-                        _r /= 100.0
-                    logging.info('New Dropout layer')
-                    self.__model.add(Dropout(rate=_r))
-                    self.__layer_count += 1
+        Generate a model based on data from the database, or reuse a compiled model with the same definition
+
+        :param input_shape: The shape of one input sample
+        :type input_shape: tuple
+        """
+        _hash = self.__get_model_hash(input_shape)
+        if self.__model is not None:
+            if self.__model_hash == _hash:
+                logging.info('Continuing training from the stored model')
+                return
+            logging.warning('The stored model does not match the current model definition, training a new model')
+        self.__model_hash = _hash
+        _cached = COMPILED_MODELS.get(self.__cache_key, _hash)
+        if _cached is not None:
+            # Start from the initial weights and a fresh optimizer state, like a newly built model
+            self.__model, _initial_weights = _cached
+            self.__model.set_weights(_initial_weights)
+            keras.backend.batch_set_value([
+                (_variable, np.zeros(_variable.shape.as_list(), dtype=_variable.dtype.as_numpy_dtype))
+                for _variable in self.__model.optimizer.variables()
+            ])
+            logging.info(f'Reusing compiled model {_hash[:12]}')
+            return
+
+        self.__model = keras.models.Sequential()
+        _layer_count = 0
+        layers = self.__get_layers()
+        # Iterate over layers sorted by order
+        for _layer in sorted(layers, key=lambda x: x['order']):
+            if _layer['layerType'] == 'Dense':
+                if _layer_count == 0:
+                    logging.info('Creating initial Dense layer')
+                    self.__model.add(Dense(
+                        units=_layer['parameters']['units'],
+                        activation=_layer['parameters']['activation'].lower(),
+                        input_shape=input_shape
+                    ))
                 else:
-                    raise ValueError(f'Error building model: there is no layer type {_layer["layerType"]}')
+                    logging.info('New Dense layer')
+                    self.__model.add(Dense(
+                        units=_layer['parameters']['units'],
+                        activation=_layer['parameters']['activation'].lower()
+                    ))
+                _layer_count += 1
+            elif _layer['layerType'] == 'Dropout':
+                _r = _layer['parameters']['rate']
+                if _r >= 1:
+                    _r /= 100.0
+                logging.info('New Dropout layer')
+                self.__model.add(Dropout(rate=_r))
+                _layer_count += 1
+            else:
+                raise ValueError(f'Error building model: there is no layer type {_layer["layerType"]}')
 
-            # Compile the model
-            self.__model.compile(
-                optimizer='adam',
-                metrics=['accuracy'],
-                loss=keras.losses.MeanSquaredError()
-            )
+        # Compile the model
+        self.__model.compile(
+            optimizer=ModelManager.OPTIMIZER,
+            metrics=ModelManager.METRICS,
+            loss=keras.losses.MeanSquaredError()
+        )
+        COMPILED_MODELS.put(self.__cache_key, _hash, (self.__model, self.__model.get_weights()))
 
-    def train_model(self, x_train, y_train):
+    def train_model(self, x_train, y_train, stop_event=None, progress=None):
         """
         Train a model with given X_train and y_train data, epochs, batch_size and validation split
 
@@ -131,37 +494,140 @@ class ModelManager:
         :param y_train:
         :type y_train: Series
 
+        :param stop_event: Optional event which stops training when it is set
+        :type stop_event: threading.Event
+
+        :param progress: Optional channel to publish training progress to
+        :type progress: ProgressChannel
+
+        :returns: Every metric by epoch, the measured steps_per_second and the outcome of early stopping under
+                  early_stopping if it is enabled
         :rtype: dict
         """
-        self.__build_model(input_shape=ModelManager.__get_input_shape(x_train))
+        x_train, y_train = to_float32(x_train), to_float32(y_train)
+        if ModelManager.INPUT_PIPELINE:
+            # Hold out the last rows for validation, like the validation_split of Keras
+            _split = int(len(x_train) * (1.0 - self.__get_validation_split()))
+            _inputs = {
+                'x': self.__get_dataset(x_train[:_split], y_train[:_split], shuffle=True),
+                'validation_data': self.__get_dataset(x_train[_split:], y_train[_split:])
+                if _split < len(x_train) else None
+            }
+        else:
+            _inputs = {
+                'x': x_train,
+                'y': y_train,
+                'batch_size': self.__get_batch_size(),
+                'validation_split': self.__get_validation_split()
+            }
+        return self.__fit(ModelManager.__get_input_shape(x_train), _inputs, stop_event, progress)
+
+    def train_stream(self, stream, stop_event=None, progress=None):
+        """
+        Train a model on the train rows of a dataset read from disk while training, validating on its validation rows
+
+        :param stream: The dataset to stream
+        :type stream: DatasetStream
+
+        :param stop_event: Optional event which stops training when it is set
+        :type stop_event: threading.Event
+
+        :param progress: Optional channel to publish training progress to
+        :type progress: ProgressChannel
 
-        hist = LossHistory()
+        :returns: The same scoring as train_model
+        :rtype: dict
+        """
+        _inputs = {
+            'x': stream.get_dataset(DatasetStream.TRAIN, self.__get_batch_size(), shuffle=True),
+            'validation_data': stream.get_dataset(DatasetStream.VALIDATION, self.__get_batch_size())
+            if not stream.is_empty(DatasetStream.VALIDATION) else None
+        }
+        return self.__fit(stream.input_shape, _inputs, stop_event, progress)
+
+    def __fit(self, input_shape, inputs, stop_event=None, progress=None):
+        """
+        Build the model and fit it on prepared inputs
+
+        :param input_shape: The shape of one input sample
+        :type input_shape: tuple
+
+        :param inputs: The training and validation arguments of Model.fit
+        :type inputs: dict
+
+        :rtype: dict
+        """
+        self.__build_model(input_shape=input_shape)
+
+        hist = LossHistory(progress)
+        _callbacks = [hist, ]
+        if stop_event is not None:
+            _callbacks.append(StopTraining(stop_event))
+        _early_stopping = None
+        if self.__get_early_stopping() is not None:
+            _settings = self.__get_early_stopping()
+            _early_stopping = EarlyStopping(monitor=_settings['monitor'], patience=int(_settings['patience']),
+                                            min_delta=float(_settings['min-delta']))
+            _callbacks.append(_early_stopping)
         logging.info('Model compiled, training model now')
         model_history = self.__model.fit(
-            x=x_train,
-            y=y_train,
             epochs=self.__get_epochs(),
-            batch_size=self.__get_batch_size(),
-            validation_split=self.__get_validation_split(),
-            callbacks=[hist, ]
+            callbacks=_callbacks,
+            **inputs
         )
 
         _metrics = model_history.history
-        return {
+        scoring = {
             key: [round(float(_item) * 100.0, 2) for _item in _metrics[key]] for key in _metrics.keys()
         }
+        scoring['steps_per_second'] = round(hist.steps_per_second, 2)
+        if _early_stopping is not None:
+            scoring['early_stopping'] = {
+                'monitor': _early_stopping.monitor,
+                'best_epoch': _early_stopping.best_epoch,
+                'epochs_run': _early_stopping.epochs_run,
+                'epochs_saved': self.__get_epochs() - _early_stopping.epochs_run if _early_stopping.stopped else 0,
+                'restored': _early_stopping.restored
+            }
+        return scoring
 
-    def store_model(self):
+    @property
+    def model_hash(self):
         """
-        Write the model to disk
+        The definition hash of the current model, None if there is no model
+
+        :rtype: str or None
+        """
+        return self.__model_hash
+
+    def store_model(self, path):
         """
-        ...
+        Write the model, including its weights and optimizer state, to disk as HDF5
 
-    def load_model(self):
+        :param path: The file to write to
+        :type path: str
         """
-        Load model from disk
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write next to the current file and swap them, a crash never leaves a half-written model behind
+        _tmp_path = f'{path}.tmp.h5'
+        self.__model.save(_tmp_path)
+        os.replace(_tmp_path, path)
+        logging.info(f'Stored model of project {self.__project_name}')
+
+    def load_model(self, path, model_hash):
+        """
+        Load a model stored by store_model, training continues from its weights and optimizer state when its
+        definition still matches the project's model
+
+        :param path: The file to read
+        :type path: str
+
+        :param model_hash: The definition hash of the stored model
+        :type model_hash: str
         """
-        ...
+        self.__model = keras.models.load_model(path)
+        self.__model_hash = model_hash
+        logging.info(f'Loaded stored model of project {self.__project_name}')
 
     def test_model(self, x_test, y_test):
         """
@@ -175,16 +641,78 @@ class ModelManager:
 
         :rtype: dict
         """
-        if self.__layer_count > 0:
-            y_pred = self.__model.predict_classes(x_test)
-            results = self.__model.evaluate(x_test, y_test, batch_size=self.__get_batch_size())
-            print(type(y_test))
-            return {
-                "test_loss": round(float(results[0]) * 100.0, 2),
-                "test_accuracy": round(float(results[1]) * 100.0, 2),
-                "classification_report": classification_report(
-                    y_true=y_test,
-                    y_pred=y_pred,
-                    output_dict=True
-                )
-            }
+        if self.__model is not None:
+            x_test, y_test = to_float32(x_test), to_float32(y_test)
+            if ModelManager.INPUT_PIPELINE:
+                _batches = self.__get_dataset(x_test, y_test)
+            else:
+                _batch_size = self.__get_batch_size()
+                _batches = ((x_test[_i:_i + _batch_size], y_test[_i:_i + _batch_size])
+                            for _i in range(0, len(x_test), _batch_size))
+            return self.__evaluate(_batches)
+
+    def test_stream(self, stream):
+        """
+        Test how good the model scores on the test rows of a dataset read from disk
+
+        :param stream: The dataset to stream
+        :type stream: DatasetStream
+
+        :rtype: dict
+        """
+        if self.__model is not None:
+            return self.__evaluate(stream.get_dataset(DatasetStream.TEST, self.__get_batch_size()))
+
+    def __evaluate(self, batches):
+        """
+        Predict every batch once and score the model on the outputs, see ModelEvaluation
+
+        :param batches: The batches of features and targets
+        :type batches: iterable
+
+        :rtype: dict
+        """
+        _evaluation = ModelEvaluation()
+        for _x, _y in batches:
+            _evaluation.update(np.asarray(_y), np.asarray(self.__model.predict_on_batch(_x)))
+        return _evaluation.get_scoring()
+
+
+def run_training_task(task, stop_event=None, progress=None):
+    """
+    Build a new model, or load the stored model to continue training it, train it, evaluate it and store it. Used in
+    training worker processes as well as in-process.
+
+    :param task: The project owner and name, model parameters, train- and test-data as arrays, DataFrames or SharedRows,
+                 or a DatasetStream under stream which replaces them, the path to store the model at or None and if
+                 training continues from the stored model, see ProjectRuntime.train_model
+    :type task: dict
+
+    :param stop_event: Optional event which stops training when it is set
+    :type stop_event: threading.Event
+
+    :param progress: Optional channel to publish training progress to
+    :type progress: ProgressChannel
+
+    :returns: The train scoring, the test scoring, which is None if training was stopped or the task does not evaluate
+              the model, and the definition hash of the stored model
+    :rtype: tuple
+    """
+    model_manager = ModelManager(task['project'], model_params=task['params'], username=task['username'])
+    if task['warm_start'] and task['model_hash'] is not None and os.path.exists(task['model_path']):
+        model_manager.load_model(task['model_path'], task['model_hash'])
+    _stream = task.get('stream')
+    if _stream is not None:
+        train_scoring = model_manager.train_stream(_stream, stop_event=stop_event, progress=progress)
+    else:
+        train_scoring = model_manager.train_model(x_train=load_rows(task['x_train']),
+                                                  y_train=load_rows(task['y_train']),
+                                                  stop_event=stop_event, progress=progress)
+    if task['model_path'] is not None:
+        model_manager.store_model(task['model_path'])
+    if not task['evaluate'] or (stop_event is not None and stop_event.is_set()):
+        return train_scoring, None, model_manager.model_hash
+    if _stream is not None:
+        return train_scoring, model_manager.test_stream(_stream), model_manager.model_hash
+    test_scoring = model_manager.test_model(x_test=load_rows(task['x_test']), y_test=load_rows(task['y_test']))
+    return train_scoring, test_scoring, model_manager.model_hash
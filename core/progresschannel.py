@@ -0,0 +1,77 @@
+import threading
+import time
+
+
+class ProgressChannel:
+    def __init__(self, interval=0.5):
+        """
+        Broadcast the progress of a running task to any amount of listeners. Only the latest state is kept, listeners
+        which are slower than the publisher skip intermediate updates instead of buffering them.
+
+        :param interval: The minimal amount of seconds between two throttled updates, see is_due
+        :type interval: float
+        """
+        self.interval = interval
+        self.__condition = threading.Condition()
+        self.__state = {}
+        self.__version = 0
+        self.__closed = False
+        self.__next_update = 0.0
+
+    def is_due(self):
+        """
+        Check if a throttled update should be published now, cheap enough to call for every batch
+
+        :rtype: bool
+        """
+        return time.monotonic() >= self.__next_update
+
+    def publish(self, **fields):
+        """
+        Merge fields into the state and wake up all listeners
+
+        :param fields: The fields of the state to update
+        """
+        with self.__condition:
+            self.__update(fields)
+
+    def __update(self, fields):
+        """
+        Merge fields into the state and wake up all listeners, must be called while holding the condition
+
+        :param fields: The fields of the state to update
+        :type fields: dict
+        """
+        self.__state.update(fields)
+        self.__version += 1
+        self.__next_update = time.monotonic() + self.interval
+        self.__condition.notify_all()
+
+    def close(self, **fields):
+        """
+        Publish the final state, listeners stop after receiving it
+
+        :param fields: The fields of the state to update
+        """
+        with self.__condition:
+            # Listeners woken up in between would see a closed channel without its final state
+            self.__closed = True
+            self.__update(fields)
+
+    def wait(self, version=0, timeout=None):
+        """
+        Wait for a state newer than a version
+
+        :param version: The version of the last state the listener received
+        :type version: int
+
+        :param timeout: The maximum amount of seconds to wait
+        :type timeout: float
+
+        :returns: The current version, a copy of the state and if the channel is closed. The version is unchanged when
+                  the timeout expired.
+        :rtype: tuple
+        """
+        with self.__condition:
+            self.__condition.wait_for(lambda: self.__version > version or self.__closed, timeout=timeout)
+            return self.__version, dict(self.__state), self.__closed
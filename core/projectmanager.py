@@ -1,16 +1,22 @@
 import logging
 import pathlib
 import time
+from ast import literal_eval
 from os import remove
 from uuid import uuid4
 
 from flask import session
-from pickledb import PickleDB
+
+from core.datasetcache import DatasetCache
+from core.hyperparametersearch import apply_trial
+from core.metadatastore import MetadataStore
+from core.transformationlog import TransformationLog
 
 
 class ProjectManager:
     SCORING_TEST = 'test'
     SCORING_TRAIN = 'train'
+    SCORING_CROSSVALIDATION = 'crossvalidation'
     __PREPROCESSING_OPTIONS = {
         'train-test-split': str,
         'random-state': int,
@@ -23,14 +29,48 @@ class ProjectManager:
         'validation-split': float
     }
 
-    def __init__(self, db_instance):
+    def __init__(self, metadata_store, username=None):
         """
         Initialise the database connector
 
-        :param db_instance: The PickleDB connector instance
-        :type db_instance: PickleDB
+        :param metadata_store: The store holding project, dataset and model records
+        :type metadata_store: MetadataStore
+
+        :param username: The user to manage projects for, the user of the current session if None
+        :type username: str
+        """
+        self.__store = metadata_store
+        self.__username = username
+
+    def __get_username(self):
+        """
+        Request the user whose projects are managed
+
+        :rtype: str
+        """
+        if self.__username is not None:
+            return self.__username
+        return session['username']
+
+    @property
+    def username(self):
+        """
+        The user whose projects are managed
+
+        :rtype: str
+        """
+        return self.__get_username()
+
+    def bind(self, username):
+        """
+        Create a project manager for a fixed user, which can be used outside of a request, eg. by a training job
+
+        :param username: The user to manage projects for
+        :type username: str
+
+        :rtype: ProjectManager
         """
-        self.__db_client = db_instance
+        return ProjectManager(self.__store, username)
 
     def get_user_projects(self):
         """
@@ -40,9 +80,10 @@ class ProjectManager:
         :rtype: list
         """
         try:
-            return self.get_all_projects()[session['username']]
+            return [self.__store.get_record(MetadataStore.PROJECT, self.__get_username(), _name)
+                    for _name in self.__store.get_index(MetadataStore.PROJECT, self.__get_username())]
         except Exception as e:
-            logging.error(f'Something went wrong requesting the projects for user {session["username"]}: {e}')
+            logging.error(f'Something went wrong requesting the projects for user {self.__get_username()}: {e}')
             return []
 
     def create_project(self, name, description):
@@ -55,36 +96,15 @@ class ProjectManager:
         :param description: A description about the project
         :type description: str
         """
-        projects = self.get_all_projects()
-        if not projects:
-            projects = {}
-
-        if session['username'] not in projects:
-            projects[session['username']] = []
-
-        if not self.does_project_exist(name):
-            if session['username'] in projects.keys():
-                projects[session['username']].append({
-                    'name': name,
-                    'description': description
-                })
-            else:
-                projects[session['username']] = [{
+        with self.__store.transaction():
+            if not self.does_project_exist(name):
+                self.__store.set_record(MetadataStore.PROJECT, {
                     'name': name,
                     'description': description
-                }]
-            self.__db_client.set('projects', projects)
-            self.__db_client.dump()
-            self.create_model(project_name=name)
-            logging.info(f"Created project {name} for user {session['username']}")
-
-    def get_all_projects(self):
-        """
-        Request all projects
-
-        :rtype: dict
-        """
-        return self.__db_client.get('projects')
+                }, self.__get_username(), name)
+                self.__store.add_to_index(name, MetadataStore.PROJECT, self.__get_username())
+                self.create_model(project_name=name)
+                logging.info(f"Created project {name} for user {self.__get_username()}")
 
     def get_project(self, name):
         """
@@ -95,12 +115,9 @@ class ProjectManager:
 
         :rtype: dict
         """
-        projects = self.get_all_projects()
-        if not isinstance(projects, bool):
-            projects = projects[session['username']]
-            for project in projects:
-                if project['name'] == name:
-                    return project
+        project = self.__store.get_record(MetadataStore.PROJECT, self.__get_username(), name)
+        if project is not None:
+            return project
         return 0
 
     def drop_project(self, name):
@@ -110,14 +127,18 @@ class ProjectManager:
         :param name: The name of the project to delete
         :type name: str
         """
-        # Remove project from project list
-        projects = self.get_all_projects()
-        project_to_trash = self.get_project(name)
-        projects[session['username']].remove(project_to_trash)
-        self.__db_client.set('projects', projects)
-        self.__db_client.dump()
-        # Remove dataset from database entry
-        self.clear_project_dataset(project_to_trash['name'])
+        with self.__store.transaction():
+            # Remove the stored model from disk
+            model = self.load_model(name)
+            if model is not None and model.get('weights') is not None:
+                pathlib.Path(f'{pathlib.Path(__file__).parent.parent.absolute()}/data/models/{model["weights"]}') \
+                    .unlink(missing_ok=True)
+            # Remove project from project list
+            self.__store.remove_record(MetadataStore.PROJECT, self.__get_username(), name)
+            self.__store.remove_from_index(name, MetadataStore.PROJECT, self.__get_username())
+            self.__store.remove_record(MetadataStore.MODEL, self.__get_username(), name)
+            # Remove dataset from database entry
+            self.clear_project_dataset(name)
 
     def update_project(self, old_name, new_name, description):
         """
@@ -132,23 +153,27 @@ class ProjectManager:
         :param description: An optional updated description for the project
         :type description: str
         """
-        user_projects = self.get_user_projects()
-        if self.does_project_exist(new_name):
-            if old_name != new_name:
+        with self.__store.transaction():
+            if self.does_project_exist(new_name):
+                if old_name != new_name:
+                    return old_name
+            if not self.does_project_exist(old_name):
                 return old_name
-        # Change settings for the general project
-        for project in user_projects:
-            if project['name'] == old_name:
-                user_projects[user_projects.index(project)] = {'name': new_name, 'description': description}
-                # Change the name in the database under project datasets as well
+
+            # Change settings for the general project
+            self.__store.remove_record(MetadataStore.PROJECT, self.__get_username(), old_name)
+            self.__store.set_record(MetadataStore.PROJECT, {'name': new_name, 'description': description},
+                                    self.__get_username(), new_name)
+            self.__store.rename_in_index(old_name, new_name, MetadataStore.PROJECT, self.__get_username())
+            if old_name != new_name:
+                # Move the model & dataset records along with the project
+                model = self.load_model(old_name)
+                if model is not None:
+                    self.__store.remove_record(MetadataStore.MODEL, self.__get_username(), old_name)
+                    self.__store.set_record(MetadataStore.MODEL, model, self.__get_username(), new_name)
                 if self.does_project_have_dataset(old_name):
                     self.reassign_dataset(old_name, new_name)
-
-        projects = self.get_all_projects()
-        projects[session['username']] = user_projects
-        self.__db_client.set('projects', projects)
-        self.__db_client.dump()
-        return new_name
+            return new_name
 
     def does_project_exist(self, project_name):
         """
@@ -164,15 +189,18 @@ class ProjectManager:
             return 1
         return 0
 
-    def get_all_datasets(self):
+    def __get_dataset(self, project_name):
         """
-        Retrieve all datasets
+        Request the dataset record of a project
 
-        :rtype: dict
+        :param project_name: The project to request the dataset record from
+        :type project_name: str
+
+        :rtype: dict or None
         """
-        return self.__db_client.get('datasets')
+        return self.__store.get_record(MetadataStore.DATASET, self.__get_username(), project_name)
 
-    def assign_dataset(self, name, data_type, project_name):
+    def assign_dataset(self, name, data_type, project_name, content=None):
         """
         Assign a dataset to a users project
 
@@ -184,38 +212,32 @@ class ProjectManager:
 
         :param project_name: The name of the project
         :type project_name: str
-        """
-        data = self.get_all_datasets()
-        if not data:
-            data = {session['username']: []}
-
-        i = 0
-        for project in data[session['username']]:
-            if project['projectname'] == project_name:
-                data[session['username']][i] = {
-                    'dataset': name,
-                    'datatype': data_type,
-                    'preprocessing': {
-                        'train-test-split': 70,
-                        'random-state': 0,
-                        'output-columns': []
-                    }
+
+        :param content: The hash of the stored upload the dataset links to, see DatasetCache.ingest
+        :type content: str
+        """
+        with self.__store.transaction():
+            if content is not None:
+                _upload = self.__store.get_record(MetadataStore.UPLOAD, content) or {'references': 0}
+                _upload['references'] += 1
+                self.__store.set_record(MetadataStore.UPLOAD, _upload, content)
+            # The previous dataset is replaced, after referencing the new upload which may be the same one
+            self.__remove_dataset(project_name)
+            self.__store.set_record(MetadataStore.DATASET, {
+                'projectname': project_name,
+                'datatype': data_type,
+                'dataset': name,
+                'content': content,
+                'preprocessing': {
+                    'train-test-split': 70,
+                    'random-state': 0,
+                    'output-columns': [],
+                    'folds': 5,
+                    'stratify': False,
+                    'streaming': False
                 }
-                self.__db_client.set('datasets', data)
-                self.__db_client.dump()
-                return 1
-            i += 1
-        data[session['username']].append({
-            'projectname': project_name,
-            'datatype': data_type,
-            'dataset': name,
-            'preprocessing': {
-                'train-test-split': 70,
-                'random-state': 0,
-                'output-columns': []
-            }
-        })
-        self.__db_client.set('datasets', data)
+            }, self.__get_username(), project_name)
+        return 1
 
     def reassign_dataset(self, old_name, new_name):
         """
@@ -227,12 +249,12 @@ class ProjectManager:
         :param new_name: New projectname to assign the dataset to
         :type new_name: str
         """
-        data = self.get_all_datasets()
-        for i in range(len(data[session['username']])):
-            if data[session['username']][i]['projectname'] == old_name:
-                data[session['username']][i]['projectname'] = new_name
-        self.__db_client.set('datasets', data)
-        self.__db_client.dump()
+        with self.__store.transaction():
+            data = self.__get_dataset(old_name)
+            if data is not None:
+                data['projectname'] = new_name
+                self.__store.remove_record(MetadataStore.DATASET, self.__get_username(), old_name)
+                self.__store.set_record(MetadataStore.DATASET, data, self.__get_username(), new_name)
 
     def does_project_have_dataset(self, project_name):
         """
@@ -241,13 +263,9 @@ class ProjectManager:
         :param project_name: The project to check
         :type project_name: str
         """
-        data = self.get_all_datasets()
-        if data:
-            if session['username'] in data.keys():
-                for project in data[session['username']]:
-                    if project['projectname'] == project_name:
-                        if project['dataset'] is not None and project['datatype'] is not None:
-                            return 1
+        data = self.__get_dataset(project_name)
+        if data is not None and data['dataset'] is not None and data['datatype'] is not None:
+            return 1
         return 0
 
     def get_project_dataset(self, project_name):
@@ -257,12 +275,9 @@ class ProjectManager:
         :param project_name: The project to retrieve
         :type project_name: str
         """
-        data = self.get_all_datasets()
-        if data:
-            if session['username'] in data.keys():
-                for project in data[session['username']]:
-                    if project['projectname'] == project_name:
-                        return f'{project["dataset"]}.{project["datatype"]}'
+        data = self.__get_dataset(project_name)
+        if data is not None:
+            return f'{data["dataset"]}.{data["datatype"]}'
         return None
 
     def clear_project_dataset(self, projectname):
@@ -272,15 +287,45 @@ class ProjectManager:
         :param projectname: The project to delete
         :type projectname: str
         """
-        data = self.get_all_datasets()
-        if data:
-            for i in range(len(data[session['username']])):
-                if data[session['username']][i]['projectname'] == projectname:
-                    dataset = self.get_project_dataset(projectname)
-                    remove(f'{pathlib.Path(__file__).parent.parent.absolute()}/data/{dataset}')
-                    data[session['username']].remove(data[session['username']][i])
-                    self.__db_client.set('datasets', data)
-                    self.__db_client.dump()
+        with self.__store.transaction():
+            self.__remove_dataset(projectname)
+
+    def __remove_dataset(self, project_name):
+        """
+        Delete the dataset of a project and its files, must be called within a transaction
+
+        :param project_name: The project to delete the dataset of
+        :type project_name: str
+        """
+        data = self.__get_dataset(project_name)
+        dataset = self.get_project_dataset(project_name)
+        if dataset is not None:
+            remove(f'{pathlib.Path(__file__).parent.parent.absolute()}/data/{dataset}')
+            DatasetCache(f'{pathlib.Path(__file__).parent.parent.absolute()}/data').clear(dataset)
+            TransformationLog(f'{pathlib.Path(__file__).parent.parent.absolute()}/data/{dataset}.log').clear()
+            self.__store.remove_record(MetadataStore.DATASET, self.__get_username(), project_name)
+            if data.get('content') is not None:
+                self.__release_upload(data['content'], data['datatype'])
+
+    def __release_upload(self, content, data_type):
+        """
+        Drop a reference to a stored upload, the upload is deleted when no dataset links to it anymore
+
+        :param content: The hash of the upload
+        :type content: str
+
+        :param data_type: The extension of the upload
+        :type data_type: str
+        """
+        _upload = self.__store.get_record(MetadataStore.UPLOAD, content)
+        if _upload is not None and _upload['references'] > 1:
+            _upload['references'] -= 1
+            self.__store.set_record(MetadataStore.UPLOAD, _upload, content)
+            return
+        self.__store.remove_record(MetadataStore.UPLOAD, content)
+        DatasetCache(f'{pathlib.Path(__file__).parent.parent.absolute()}/data').remove_upload(
+            DatasetCache.get_upload_name(content, data_type))
+        logging.info(f'Removed upload {content}, no dataset uses it anymore')
 
     def set_preprocessing(self, project, param, value):
         """
@@ -297,24 +342,25 @@ class ProjectManager:
 
         :rtype: bool
         """
-        try:
-            data = self.get_all_datasets()
-            for _project in data[session['username']]:
-                if _project['projectname'] == project:
-                    logging.info(f'User {session["username"]} set {param} to {value} for {project}')
-                    # Attempt to store non-strings as their correct type
-                    try:
-                        _project['preprocessing'][param] = eval(value)
-                    except Exception as e:
-                        logging.warning(
-                            f"Could not store preprocessing parameter as evaluated datatype, defaulting to String: {e}")
-                        _project['preprocessing'][param] = value
-                    self.__db_client.set('datasets', data)
+        with self.__store.transaction():
+            try:
+                data = self.__get_dataset(project)
+                if data is not None:
+                    logging.info(f'User {self.__get_username()} set {param} to {value} for {project}')
+                    if isinstance(value, str):
+                        # Attempt to store strings holding other types as their correct type
+                        try:
+                            value = literal_eval(value)
+                        except (ValueError, SyntaxError) as e:
+                            logging.warning(f"Could not store preprocessing parameter as evaluated datatype, "
+                                            f"defaulting to String: {e}")
+                    data['preprocessing'][param] = value
+                    self.__store.set_record(MetadataStore.DATASET, data, self.__get_username(), project)
                     return 1
-            return 0
-        except Exception as e:
-            logging.error(f'Failed to set dataset percentage for {project} by user {session["username"]}: {e}')
-            return 0
+                return 0
+            except Exception as e:
+                logging.error(f'Failed to set dataset percentage for {project} by user {self.__get_username()}: {e}')
+                return 0
 
     def get_preprocessing(self, project_name, param_name):
         """
@@ -329,26 +375,14 @@ class ProjectManager:
         :rtype: float
         """
         try:
-            data = self.get_all_datasets()
-            for _project in data[session['username']]:
-                if _project['projectname'] == project_name:
-                    return _project['preprocessing'][param_name]
+            data = self.__get_dataset(project_name)
+            if data is not None:
+                return data['preprocessing'][param_name]
         except Exception as e:
             logging.error(
-                f'Failed to retrieve project {project_name} train_test_split data for user {session["username"]}: {e}')
+                f'Failed to retrieve project {project_name} train_test_split data for user {self.__get_username()}: {e}')
             return None
 
-    def get_all_models(self):
-        """
-        Load all models that have been created
-
-        :rtype: dict
-        """
-        try:
-            return self.__db_client.get('models')
-        except Exception as e:
-            logging.error(f'Error loading models: {e}')
-
     def create_model(self, project_name):
         """
         Create a new model dataholder in the database for a project
@@ -356,28 +390,18 @@ class ProjectManager:
         :param project_name: The project to create a model for
         :type project_name: str
         """
-        models = self.get_all_models()
-
-        # Handle if models is empty
-        if not models:
-            models = {}
-
-        # Handle if user has no models yet
-        if session['username'] not in models:
-            models[session['username']] = {}
-
-        # Check if project has a model defined
-        if project_name not in models[session['username']]:
-            models[session['username']][project_name] = {
-                'epochs': 5,
-                'batch-size': 10,
-                'layers': [],
-                'timestamp': time.time(),
-                'validation-split': 0.15,
-                'test_score': {}
-            }
-            # TODO: handle creating a new model + store old model in database
-        self.__db_client.set('models', models)
+        with self.__store.transaction():
+            # Check if project has a model defined
+            if self.load_model(project_name) is None:
+                self.__store.set_record(MetadataStore.MODEL, {
+                    'epochs': 5,
+                    'batch-size': 10,
+                    'layers': [],
+                    'timestamp': time.time(),
+                    'validation-split': 0.15,
+                    'test_score': {}
+                }, self.__get_username(), project_name)
+                # TODO: handle creating a new model + store old model in database
 
     def add_model_layer(self, project_name, layer_type, layer_params, description):
         """
@@ -395,25 +419,54 @@ class ProjectManager:
         :param description: Extra information about this layer
         :type description: str
         """
-        models = self.get_all_models()
-
-        # Create a base model if it doesn't exist
-        if not models or session['username'] not in models or project_name not in models[session['username']]:
+        with self.__store.transaction():
+            # Create a base model if it doesn't exist
             self.create_model(project_name)
-            models = self.get_all_models()
+            model = self.load_model(project_name)
 
-        # Check the layer count for order
-        layer_number = len(models[session['username']][project_name]['layers'])
+            # Check the layer count for order
+            layer_number = len(model['layers'])
 
-        # Add new layer
-        models[session['username']][project_name]['layers'].append({
-            'layerType': layer_type,
-            'layerId': str(uuid4()),
-            'order': layer_number,
-            'parameters': layer_params,
-            'description': description
-        })
-        self.__db_client.set('models', models)
+            # Add new layer
+            model['layers'].append({
+                'layerType': layer_type,
+                'layerId': str(uuid4()),
+                'order': layer_number,
+                'parameters': layer_params,
+                'description': description
+            })
+            self.__store.set_record(MetadataStore.MODEL, model, self.__get_username(), project_name)
+
+    def set_training_settings(self, project_name, epochs, batch_size, validation_split, early_stopping):
+        """
+        Set how a model is trained
+
+        :param project_name: The project that will get updated training settings
+        :type project_name: str
+
+        :param epochs: The maximal amount of epochs
+        :type epochs: int
+
+        :param batch_size: The amount of rows used for every update of the weights
+        :type batch_size: int
+
+        :param validation_split: The fraction of the training data used for validation
+        :type validation_split: float
+
+        :param early_stopping: The monitored metric, patience and min-delta of early stopping, None to train all epochs
+        :type early_stopping: dict or None
+        """
+        with self.__store.transaction():
+            # Create a base model if it doesn't exist
+            self.create_model(project_name)
+            model = self.load_model(project_name)
+            model.update({
+                'epochs': epochs,
+                'batch-size': batch_size,
+                'validation-split': validation_split,
+                'early-stopping': early_stopping
+            })
+            self.__store.set_record(MetadataStore.MODEL, model, self.__get_username(), project_name)
 
     def remove_model_layer(self, project_name, layer_id):
         """
@@ -427,19 +480,20 @@ class ProjectManager:
 
         :rtype: bool
         """
-        models = self.get_all_models()
+        with self.__store.transaction():
+            model = self.load_model(project_name)
 
-        # Check if models exist
-        if not models or session['username'] not in models or project_name not in models[session['username']]:
-            return 0
+            # Check if models exist
+            if model is None:
+                return 0
 
-        # Remove layer
-        for layer in models[session['username']][project_name]['layers']:
-            if layer['layerId'] == layer_id:
-                models[session['username']][project_name]['layers'].remove(layer)
-                self.__db_client.set('models', models)
-                return 1
-        return 0
+            # Remove layer
+            for layer in model['layers']:
+                if layer['layerId'] == layer_id:
+                    model['layers'].remove(layer)
+                    self.__store.set_record(MetadataStore.MODEL, model, self.__get_username(), project_name)
+                    return 1
+            return 0
 
     def load_model(self, project_name):
         """
@@ -450,11 +504,7 @@ class ProjectManager:
 
         :rtype: dict
         """
-        models = self.get_all_models()
-        if not models or session['username'] not in models or project_name not in models[session['username']]:
-            return None
-        else:
-            return models[session['username']][project_name]
+        return self.__store.get_record(MetadataStore.MODEL, self.__get_username(), project_name)
 
     def store_model_scoring(self, project_name, scoring, scoring_source):
         """
@@ -469,16 +519,95 @@ class ProjectManager:
         :param scoring_source: The source of scoring metrics
         :type scoring_source: str
         """
-        models = self.get_all_models()
-        # Check if models exist
-        if not models or session['username'] not in models or project_name not in models[session['username']]:
+        with self.__store.transaction():
+            model = self.load_model(project_name)
+            # Check if models exist
+            if model is None:
+                return 0
+
+            if scoring_source in [self.SCORING_TEST, self.SCORING_TRAIN, self.SCORING_CROSSVALIDATION]:
+                model[f'{scoring_source}_score'] = scoring
+                self.__store.set_record(MetadataStore.MODEL, model, self.__get_username(), project_name)
+                return 1
             return 0
 
-        if scoring_source in [self.SCORING_TEST, self.SCORING_TRAIN]:
-            models[session['username']][project_name][f'{scoring_source}_score'] = scoring
-            self.__db_client.set('models', models)
+    def store_model_weights(self, project_name, weights, weights_hash):
+        """
+        Record where the trained model of a project is stored
+
+        :param project_name: The project which model has been trained
+        :type project_name: str
+
+        :param weights: The filename of the stored model in the models directory
+        :type weights: str
+
+        :param weights_hash: The definition hash of the stored model, training only continues from a matching model
+        :type weights_hash: str
+
+        :rtype: bool
+        """
+        with self.__store.transaction():
+            model = self.load_model(project_name)
+            # Check if models exist
+            if model is None:
+                return 0
+            model.update({'weights': weights, 'weights-hash': weights_hash})
+            self.__store.set_record(MetadataStore.MODEL, model, self.__get_username(), project_name)
             return 1
-        return 0
+
+    def store_search_results(self, project_name, strategy, leaderboard):
+        """
+        Write the leaderboard of a hyperparameter search to the database, it replaces the previous search
+
+        :param project_name: The project which model has been searched
+        :type project_name: str
+
+        :param strategy: The search strategy
+        :type strategy: str
+
+        :param leaderboard: The ranked trials of the search
+        :type leaderboard: list
+
+        :rtype: bool
+        """
+        with self.__store.transaction():
+            model = self.load_model(project_name)
+            # Check if models exist
+            if model is None:
+                return 0
+            model['search'] = {
+                'strategy': strategy,
+                'timestamp': time.time(),
+                'leaderboard': leaderboard
+            }
+            self.__store.set_record(MetadataStore.MODEL, model, self.__get_username(), project_name)
+            return 1
+
+    def apply_search_trial(self, project_name, trial):
+        """
+        Replace the model parameters with the values of a trial of the last hyperparameter search
+
+        :param project_name: The project to update the model of
+        :type project_name: str
+
+        :param trial: The number of the trial
+        :type trial: int
+
+        :rtype: bool
+        """
+        with self.__store.transaction():
+            model = self.load_model(project_name)
+            # Check if models and search results exist
+            if model is None or 'search' not in model:
+                return 0
+            for _entry in model['search']['leaderboard']:
+                if _entry['trial'] == trial and _entry['loss'] is not None:
+                    _search = model.pop('search')
+                    model = apply_trial(model, _entry['values'])
+                    model['search'] = _search
+                    self.__store.set_record(MetadataStore.MODEL, model, self.__get_username(), project_name)
+                    return 1
+            return 0
 
     def load_model_scoring(self, project_name, scoring_source):
         """
@@ -492,14 +621,15 @@ class ProjectManager:
 
         :rtype: dict
         """
-        models = self.get_all_models()
+        model = self.load_model(project_name)
         # Check if models exist
-        if not models or session['username'] not in models or project_name not in models[session['username']]:
+        if model is None:
             return None
 
-        if scoring_source in [ProjectManager.SCORING_TEST, ProjectManager.SCORING_TRAIN]:
+        if scoring_source in [ProjectManager.SCORING_TEST, ProjectManager.SCORING_TRAIN,
+                              ProjectManager.SCORING_CROSSVALIDATION]:
             try:
-                return models[session['username']][project_name][f'{scoring_source}_score']
+                return model[f'{scoring_source}_score']
             except Exception as e:
                 logging.error(f'Could not load model scoring: {e}')
                 return None
@@ -1,16 +1,36 @@
 import logging
-
-import pandas as pd
-from sklearn.model_selection import train_test_split
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from uuid import uuid4
+
+import numpy as np
+from pandas import DataFrame
+from sklearn.model_selection import train_test_split, KFold, StratifiedKFold
 from sklearn.preprocessing import StandardScaler, RobustScaler, MinMaxScaler, MaxAbsScaler, Normalizer, \
     QuantileTransformer, PowerTransformer
 
-from core.modelmanager import ModelManager
+from core.columnprofiler import CHUNK_ROWS, profile_chunks, profile_column
+from core.datasetcache import DatasetCache
+from core.datasetcompaction import compact_columns, to_numpy_types, to_float32
+from core.datasetregistry import SHARED_DATASETS
+from core.datasetstream import DatasetStream, DatasetView
+from core.hyperparametersearch import HyperparameterSearch
+from core.modelmanager import COMPILED_MODELS, release_compiled_models, run_training_task
+from core.progresschannel import ProgressChannel
 from core.projectmanager import ProjectManager
+from core.rwlock import ReadWriteLock
+from core.sharedarray import SharedArray
+from core.trainingworker import TrainingWorkerPool
+from core.transformationlog import TransformationLog
 
 
 class ProjectRuntime:
-    def __init__(self, project_name, project_manager, dataset_dir):
+    MATERIALIZE_DELAY = 30.0  # Seconds between an edit and writing the edited dataset to disk
+    COMPACT_DATASETS = True  # Store every column in the smallest type which holds its values
+
+    def __init__(self, project_name, project_manager, dataset_dir, worker_pool=None):
         """
         Initialise project runtime
 
@@ -22,46 +42,373 @@ class ProjectRuntime:
 
         :param dataset_dir: The directory where datasets can be found
         :type dataset_dir: str
+
+        :param worker_pool: The training worker processes to train models in, models are trained in-process if None
+        :type worker_pool: TrainingWorkerPool
         """
         self.dataset = None
+        self.__view = None  # Streaming projects read their dataset from disk instead, see DatasetView
         self.__project_name = project_name
         self.dataset_name = project_manager.get_project_dataset(self.__project_name)
         self.__project_manager = project_manager
         self.__dataset_dir = dataset_dir
+        self.__dataset_cache = DatasetCache(dataset_dir)
+        self.__transformation_log = TransformationLog(f'{dataset_dir}/{self.dataset_name}.log')
+        self.__sequence = 0
+        self.__lock = ReadWriteLock()
+        self.__closed = 0
+        self.__materializer = None
+        self.__materialize_lock = threading.Lock()
+        self.__memory_report = {}
+        self.__version = 0
+        self.__column_versions = {}
+        self.__balance_cache = {}
         self.__load_dataset()
-        self.model_manager = ModelManager(project_name, project_manager)
+        self.__dataset_memory = ProjectRuntime.__get_memory(self.dataset)
+        self.__worker_pool = worker_pool
         self.__x_train, self.__x_test, self.__y_train, self.__y_test = None, None, None, None
 
     def __load_dataset(self):
         """
-        Load a dataset into memory
+        Load a dataset into memory, from its columnar cache if it is up-to-date, and replay the edits made after the
+        dataset was last materialized. The loaded dataset is shared with other runtimes which load the same contents.
+        The dataset of a streaming project stays on disk, it is only loaded once to materialize edits which can not be
+        replayed on a range of rows.
         """
         try:
-            if '.csv' in self.dataset_name:
-                self.dataset = pd.read_csv(f'{self.__dataset_dir}/{self.dataset_name}')
-            elif 'json' in self.dataset_name:
-                self.dataset = pd.read_json(f'{self.__dataset_dir}/{self.dataset_name}')
+            if self.streaming and self.__open_view():
+                return
+            self.dataset, self.__sequence = SHARED_DATASETS.read_dataset(self.__dataset_cache, self.dataset_name)
+            _operations = self.__transformation_log.get_operations(after=self.__sequence)
+            for _operation in _operations:
+                self.dataset = ProjectRuntime.__apply_operation(self.dataset, _operation)
+                self.__sequence = _operation['seq']
+            if _operations:
+                logging.info(f'Replayed {len(_operations)} edits on dataset {self.dataset_name}')
+                self.__schedule_materialization()
+            self.dataset = self.__compact(self.dataset)
+            if self.streaming:
+                # Written to the cache once, so the dataset can be streamed from disk from now on
+                if self.__materializer is not None:
+                    self.__materializer.cancel()
+                self.__materialize()
+                self.dataset = None
+                if not self.__open_view():
+                    raise ValueError(f'The dataset {self.dataset_name} could not be materialized')
         except Exception as e:
             logging.error(f'The dataset contains invalid encoding! {e}')
             self.dataset = None
 
-    def __write_dataset_to_disk(self):
+    def __open_view(self):
         """
-        Store data to disk after a change
+        Open the materialized dataset with the edits made after it was materialized
 
-        :returns: Nothing
-        :rtype: None
+        :returns: If the dataset could be opened, not if it was never materialized or edits need the whole dataset
+        :rtype: bool
         """
+        _cached = self.__dataset_cache.open(self.dataset_name)
+        if _cached is None:
+            return 0
         try:
-            if '.csv' in self.dataset_name:
-                self.dataset.to_csv(f'{self.__dataset_dir}/{self.dataset_name}',
-                                    index=False)
-            elif '.json' in self.dataset_name:
-                self.dataset.to_json(f'{self.__dataset_dir}/{self.dataset_name}',
-                                     orient='records')
-            logging.info(f'Written dataset {self.dataset_name} to disk for project {self.__project_name}')
-        except Exception as e:
-            logging.error(f'Error writing dataset for project {self.__project_name} to disk: {e}')
+            self.__view = DatasetView(_cached, self.__transformation_log.get_operations(after=_cached.sequence))
+        except ValueError:
+            return 0
+        self.__sequence = self.__view.sequence
+        logging.info(f'Streaming dataset {self.dataset_name} from disk')
+        return 1
+
+    @staticmethod
+    def __get_scaler(method):
+        """
+        Create the scaler for a preprocessing method
+
+        :param method: Which method of preprocessing to use, see RuntimeManager
+        :type method: str
+        """
+        if method == 'StandardScaler':
+            return StandardScaler()
+        elif method == 'MaxAbsScaler':
+            return MaxAbsScaler()
+        elif method == 'RobustScaler':
+            return RobustScaler()
+        elif method == 'Min-Max Scaler':
+            return MinMaxScaler()
+        elif method == 'Normalizer':
+            return Normalizer()
+        elif method == 'QuantileTransformer':
+            # Fixed random state, replaying the edit has to give the same result
+            return QuantileTransformer(random_state=0)
+        elif method == 'PowerTransformer':
+            return PowerTransformer()
+        raise ValueError(f'Preprocessing {method} does not exist!')
+
+    @staticmethod
+    def __replace_columns(dataset, columns):
+        """
+        Create a new dataset with some columns replaced. The given dataset is never written into, so it can still be
+        read while the new one is created. Before pandas 1.4, deleting a column copies the other columns stored in the
+        same block, later versions share them with the given dataset.
+
+        :param dataset: The dataset to start from
+        :type dataset: DataFrame
+
+        :param columns: The new values by column name
+        :type columns: dict
+
+        :rtype: DataFrame
+        """
+        dataset = dataset.copy(deep=False)
+        for _name, _values in columns.items():
+            _position = dataset.columns.get_loc(_name)
+            del dataset[_name]
+            dataset.insert(_position, _name, _values)
+        return dataset
+
+    @staticmethod
+    def __get_changed_columns(operation):
+        """
+        Request the columns of which an edit changes the values
+
+        :param operation: An operation from the TransformationLog
+        :type operation: dict
+
+        :rtype: list
+        """
+        if operation['op'] == TransformationLog.REPLACE:
+            return [operation['column']]
+        elif operation['op'] == TransformationLog.PREPROCESS:
+            return list(operation['columns'])
+        return []
+
+    def __compact(self, dataset, columns=None):
+        """
+        Store columns of a dataset in the smallest type which holds their values, see COMPACT_DATASETS
+
+        :param dataset: The dataset to compact
+        :type dataset: DataFrame
+
+        :param columns: The columns to compact, all columns if None
+        :type columns: list
+
+        :returns: The compacted dataset, a new DataFrame if any column changed
+        :rtype: DataFrame
+        """
+        if not ProjectRuntime.COMPACT_DATASETS or dataset is None or columns == []:
+            return dataset
+        compacted, report = compact_columns(dataset, columns)
+        self.__memory_report.update(report)
+        _before, _after = sum(_c['before'] for _c in report.values()), sum(_c['after'] for _c in report.values())
+        logging.info(f'Compacted {len(compacted)} columns of dataset {self.dataset_name} '
+                     f'from {_before / 1e6:.2f} MB to {_after / 1e6:.2f} MB')
+        if compacted:
+            return ProjectRuntime.__replace_columns(dataset, compacted)
+        return dataset
+
+    @staticmethod
+    def __apply_operation(dataset, operation):
+        """
+        Apply a recorded edit to a dataset
+
+        :param dataset: The dataset to edit
+        :type dataset: DataFrame
+
+        :param operation: An operation from the TransformationLog
+        :type operation: dict
+
+        :returns: The edited dataset, a new DataFrame
+        :rtype: DataFrame
+        """
+        if operation['op'] == TransformationLog.RENAME:
+            return dataset.rename(columns={operation['old_name']: operation['new_name']}, copy=False)
+        elif operation['op'] == TransformationLog.DROP:
+            # Deleting from a shallow copy leaves the shared dataset intact, the columns in the block of the deleted
+            # column are copied before pandas 1.4 and only views afterwards
+            dataset = dataset.copy(deep=False)
+            del dataset[operation['column']]
+            return dataset
+        elif operation['op'] == TransformationLog.REPLACE:
+            return ProjectRuntime.__replace_columns(dataset, {
+                operation['column']: dataset[operation['column']].replace(operation['old_value'],
+                                                                          operation['new_value'])
+            })
+        elif operation['op'] == TransformationLog.PREPROCESS:
+            _scaled = ProjectRuntime.__get_scaler(operation['method']).fit_transform(
+                to_numpy_types(dataset[operation['columns']]))
+            return ProjectRuntime.__replace_columns(dataset, {
+                _column: _scaled[:, _i] for _i, _column in enumerate(operation['columns'])
+            })
+        raise ValueError(f'Unknown dataset operation {operation["op"]}')
+
+    def __edit(self, operation, **params):
+        """
+        Apply an edit to the dataset and record it, writing the dataset to disk is left to the background
+
+        :param operation: The type of operation, see TransformationLog
+        :type operation: str
+
+        :param params: The parameters of the operation
+        """
+        with self.__lock.write():
+            if self.__closed:
+                # The runtime was dropped, a newly loaded runtime of the project has to make the edit
+                raise RuntimeError(f'The runtime of project {self.__project_name} was closed, the edit was not applied')
+            _operation = {'op': operation, **params}
+            if self.__view is not None:
+                if operation not in DatasetView.ROW_EDITS:
+                    raise ValueError(f'Edit {operation} needs the whole dataset, it can not be applied while streaming')
+                self.__sequence = self.__transformation_log.append(operation, **params)
+                self.__view = self.__view.extend({'seq': self.__sequence, **_operation})
+                self.__bump_version(_operation)
+                return
+            dataset = ProjectRuntime.__apply_operation(self.dataset, _operation)
+            dataset = self.__compact(dataset, ProjectRuntime.__get_changed_columns(_operation))
+            if operation == TransformationLog.RENAME and params['old_name'] in self.__memory_report:
+                self.__memory_report[params['new_name']] = self.__memory_report.pop(params['old_name'])
+            elif operation == TransformationLog.DROP:
+                self.__memory_report.pop(params['column'], None)
+            self.__bump_version(_operation)
+            self.__sequence = self.__transformation_log.append(operation, **params)
+            self.dataset = dataset
+            self.__dataset_memory = ProjectRuntime.__get_memory(dataset)
+        self.__schedule_materialization()
+
+    def __bump_version(self, operation):
+        """
+        Increase the dataset version after an edit and mark which columns it changed, must be called while holding the
+        write lock
+
+        :param operation: The applied operation
+        :type operation: dict
+        """
+        self.__version += 1
+        if operation['op'] == TransformationLog.RENAME:
+            for _versions in [self.__column_versions, self.__balance_cache]:
+                if operation['old_name'] in _versions:
+                    _versions[operation['new_name']] = _versions.pop(operation['old_name'])
+        elif operation['op'] == TransformationLog.DROP:
+            self.__column_versions.pop(operation['column'], None)
+            self.__balance_cache.pop(operation['column'], None)
+        for _column in ProjectRuntime.__get_changed_columns(operation):
+            self.__column_versions[_column] = self.__version
+
+    @property
+    def version(self):
+        """
+        The version of the dataset, increased by every edit
+
+        :rtype: int
+        """
+        with self.__lock.read():
+            return self.__version
+
+    def __schedule_materialization(self):
+        """
+        Write the dataset to the cache after a delay, edits made meanwhile are written together
+        """
+        with self.__lock.write():
+            # Streaming projects have nothing in memory to write
+            if self.__materializer is None and self.dataset is not None:
+                self.__materializer = threading.Timer(ProjectRuntime.MATERIALIZE_DELAY, self.__materialize)
+                self.__materializer.daemon = True
+                self.__materializer.start()
+
+    def __materialize(self):
+        """
+        Write the current dataset to the cache, so loading it does not need to replay the edits, and drop the edits
+        it contains from the log
+
+        :returns: The sequence number of the last edit written
+        :rtype: int
+        """
+        with self.__materialize_lock:
+            with self.__lock.write():
+                self.__materializer = None
+                dataset, sequence = self.dataset, self.__sequence
+            # Edits create a new DataFrame instead of changing this one, the snapshot can be written without the lock
+            _cached = self.__dataset_cache.open(self.dataset_name)
+            try:
+                _operations = [_operation for _operation in self.__transformation_log.get_operations(
+                    after=_cached.sequence if _cached is not None else 0) if _operation['seq'] <= sequence]
+            except ValueError as e:
+                # Without the cache the dropped edits can not identify the contents anymore
+                logging.error(f'Could not materialize dataset {self.dataset_name}: {e}')
+                return sequence
+            if not self.__dataset_cache.store(self.dataset_name, dataset, sequence=sequence, operations=_operations):
+                # The log still holds the edits, the cache and the log give the dataset up to the sequence number
+                return sequence
+            self.__transformation_log.compact(sequence)
+        logging.info(f'Materialized dataset {self.dataset_name} up to edit {sequence} for project {self.__project_name}')
+        return sequence
+
+    def materialize(self):
+        """
+        Write the edits which are waiting to be materialized to the cache now
+
+        :returns: The sequence number of the last edit in the cache
+        :rtype: int
+        """
+        with self.__lock.write():
+            _pending, sequence = self.__materializer, self.__sequence
+            if _pending is not None:
+                _pending.cancel()
+        if _pending is not None:
+            sequence = self.__materialize()
+        else:
+            # Wait for a materialization which is being written
+            with self.__materialize_lock:
+                pass
+        return sequence
+
+    @staticmethod
+    def __get_memory(dataset):
+        """
+        Measure the memory a dataset takes, including the Python objects it points to
+
+        :rtype: int
+        """
+        return int(dataset.memory_usage(index=True, deep=True).sum()) if dataset is not None else 0
+
+    @property
+    def memory_usage(self):
+        """
+        Estimate the memory the runtime holds: the dataset, its train-test split and the compiled models of the project,
+        in this process or in the training workers. The size of the dataset is measured after every edit, so this does
+        not wait for an edit which is running.
+
+        :returns: The amount of bytes
+        :rtype: int
+        """
+        _dataset = self.__dataset_memory
+        _splits = sum(_values.nbytes for _values in [self.__x_train, self.__x_test, self.__y_train, self.__y_test]
+                      if _values is not None)
+        _project_key = (self.__project_manager.username, self.__project_name)
+        if self.__worker_pool is not None:
+            # Models are compiled and cached in the training workers
+            return _dataset + _splits + self.__worker_pool.get_memory_usage(_project_key)
+        return _dataset + _splits + COMPILED_MODELS.get_memory_usage(_project_key)
+
+    @property
+    def lock(self):
+        """
+        The readers-writer lock of the runtime. Reads of the dataset share it, edits and the train-test split hold it
+        alone. Models train on a copy of the split taken under the lock, so edits do not wait for training.
+
+        :rtype: ReadWriteLock
+        """
+        return self.__lock
+
+    def close(self):
+        """
+        Write pending edits to disk and release the compiled models of the project, so the runtime can be dropped and
+        loaded again later without losing anything. Edits made to a closed runtime raise.
+        """
+        with self.__lock.write():
+            self.__closed = 1
+        self.materialize()
+        if self.__worker_pool is not None:
+            self.__worker_pool.release((self.__project_manager.username, self.__project_name))
+        else:
+            release_compiled_models((self.__project_manager.username, self.__project_name))
 
     def get_dataset_head(self):
         """
@@ -69,7 +416,9 @@ class ProjectRuntime:
 
         :rtype: str
         """
-        return self.dataset.head().to_html(
+        with self.__lock.read():
+            _head = self.__view.read(0, 5) if self.__view is not None else self.dataset.head()
+        return _head.to_html(
             classes='table table-striped table-hover table-scroll text-center',
             border=0,
             notebook=False)
@@ -87,10 +436,7 @@ class ProjectRuntime:
         :returns: Nothing
         :rtype: None
         """
-        self.dataset = self.dataset.rename(columns={
-            old_name: new_name
-        })
-        self.__write_dataset_to_disk()
+        self.__edit(TransformationLog.RENAME, old_name=old_name, new_name=new_name)
 
     def drop_column(self, col_name):
         """
@@ -102,8 +448,7 @@ class ProjectRuntime:
         :returns: Nothing
         :rtype: None
         """
-        self.dataset = self.dataset.drop([col_name], axis=1)
-        self.__write_dataset_to_disk()
+        self.__edit(TransformationLog.DROP, column=col_name)
 
     def get_columns(self):
         """
@@ -112,7 +457,10 @@ class ProjectRuntime:
         :returns: A list of column names
         :rtype: list
         """
-        return self.dataset.columns.to_list()
+        with self.__lock.read():
+            if self.__view is not None:
+                return list(self.__view.columns)
+            return self.dataset.columns.to_list()
 
     def replace_values(self, column, old_value, new_value):
         """
@@ -127,8 +475,7 @@ class ProjectRuntime:
         :param new_value: The new value to put in the column
         :type new_value: str
         """
-        self.dataset[column] = self.dataset[column].replace(old_value, new_value)
-        self.__write_dataset_to_disk()
+        self.__edit(TransformationLog.REPLACE, column=column, old_value=old_value, new_value=new_value)
 
     def preprocess_dataset(self, columns, method):
         """
@@ -141,43 +488,61 @@ class ProjectRuntime:
         :type method: str
         """
         logging.info(f'Preprocessing {columns} with {method}')
+        self.__edit(TransformationLog.PREPROCESS, columns=columns, method=method)
 
-        # Handle the preprocessing method
-        if method == 'StandardScaler':
-            scale_method = StandardScaler()
-        elif method == 'MaxAbsScaler':
-            scale_method = MaxAbsScaler()
-        elif method == 'RobustScaler':
-            scale_method = RobustScaler()
-        elif method == 'Min-Max Scaler':
-            scale_method = MinMaxScaler()
-        elif method == 'Normalizer':
-            scale_method = Normalizer()
-        elif method == 'QuantileTransformer':
-            scale_method = QuantileTransformer()
-        elif method == 'PowerTransformer':
-            scale_method = PowerTransformer()
-        else:
-            raise ValueError(f'Preprocessing {method} does not exist!')
+    def get_memory_report(self):
+        """
+        Request the memory usage of every compacted column before and after compaction
 
-        # Process data
-        self.dataset[columns] = scale_method.fit_transform(self.dataset[columns])
-        # Write to disk
-        self.__write_dataset_to_disk()
+        :returns: The type and memory usage in bytes before and after compaction by column name
+        :rtype: dict
+        """
+        with self.__lock.read():
+            return dict(self.__memory_report)
 
     def get_data_balance(self):
         """
-        Get the count for each unique value in each column
+        Get a bounded summary of the values in each column, summaries are cached until an edit changes the column
 
         :rtype: dict
-        :returns: a dictionary with all unique values per column name and their value counts
+        :returns: a dictionary with the profile of every column by column name, see profile_column
         """
+        with self.__lock.read():
+            dataset, view, column_versions = self.dataset, self.__view, dict(self.__column_versions)
+            cache = dict(self.__balance_cache)
         results = {}
-        if self.dataset is not None:
-            for column in self.dataset.columns.to_list():
-                results[column] = self.dataset[column].value_counts().to_dict()
+        if dataset is not None or view is not None:
+            for column in view.columns if view is not None else dataset.columns.to_list():
+                _version = column_versions.get(column, 0)
+                if column in cache and cache[column][0] == _version:
+                    results[column] = cache[column][1]
+                    continue
+                if view is not None:
+                    # Profile the column range by range from disk
+                    results[column] = profile_chunks(
+                        lambda: (view.read(_start, _start + CHUNK_ROWS, [column])[column]
+                                 for _start in range(0, view.rows, CHUNK_ROWS)),
+                        view.read(0, 0, [column])[column].dtype)
+                else:
+                    results[column] = profile_column(dataset[column])
+                with self.__lock.read():
+                    # Only cache the profile if the column did not change while counting, readers may cache at the
+                    # same time but edits wait
+                    if self.__column_versions.get(column, 0) == _version and column in self.get_columns():
+                        self.__balance_cache[column] = (_version, results[column])
         return results
 
+    def __read_dataset(self):
+        """
+        Request the whole dataset, a streaming project reads it from disk for the caller, must be called while holding
+        the lock
+
+        :rtype: DataFrame
+        """
+        if self.__view is not None:
+            return self.__view.read(0, self.__view.rows)
+        return self.dataset
+
     def train_test_split(self):
         """
         Split the dataset in train- and test-data
@@ -191,39 +556,243 @@ class ProjectRuntime:
 
         # Check if parameters have been set
         if _split_size is not None and _random_state is not None and _output_cols is not None:
-            # Load features
-            _x = self.dataset.drop(_output_cols, axis=1)
-            # Load targets
-            _y = self.dataset[_output_cols]
-            # Split features & according targets to train- and test-sets according to random-state and split-size
-            self.__x_train, self.__x_test, self.__y_train, self.__y_test = train_test_split(_x, _y,
-                                                                                            random_state=_random_state,
-                                                                                            train_size=_split_size)
+            # Edits wait for the split, so features and targets come from the same dataset
+            with self.__lock.write():
+                dataset = self.__read_dataset()
+                # Load features, converted once to the float32 arrays training, evaluating and predicting use
+                _x = to_float32(to_numpy_types(dataset.drop(_output_cols, axis=1)))
+                # Load targets
+                _y = to_float32(to_numpy_types(dataset[_output_cols]))
+                # Split features & according targets to train- and test-sets according to random-state and split-size
+                self.__x_train, self.__x_test, self.__y_train, self.__y_test = train_test_split(
+                    _x, _y, random_state=_random_state, train_size=_split_size)
             return 1
         return 0
 
-    def train_model(self):
+    @property
+    def streaming(self):
+        """
+        If models train on batches read from disk instead of on a split of the dataset in memory
+
+        :rtype: bool
+        """
+        return bool(self.__project_manager.get_preprocessing(self.__project_name, 'streaming'))
+
+    def __get_stream(self):
+        """
+        Materialize the dataset and stream it, split like train_test_split and held out for validation like Keras does
+
+        :rtype: DatasetStream
+        """
+        _split_size = self.__project_manager.get_preprocessing(self.__project_name, 'train-test-split')
+        _random_state = self.__project_manager.get_preprocessing(self.__project_name, 'random-state')
+        _output_cols = self.__project_manager.get_preprocessing(self.__project_name, 'output-columns')
+        if _split_size is None or _random_state is None or not _output_cols:
+            raise ValueError(f'The dataset of project {self.__project_name} can not be split')
+        _validation_split = float(self.__project_manager.load_model(self.__project_name).get('validation-split') or 0)
+        if _validation_split >= 1:
+            _validation_split /= 100.0
+        return DatasetStream(self.__dataset_dir, self.dataset_name, self.materialize(), _output_cols,
+                             train_size=float(_split_size) / 100.0,
+                             validation_split=_validation_split,
+                             random_state=_random_state)
+
+    def train_model(self, stop_event=None, progress=None, warm_start=False):
         """
-        Attempt training the model for the current running project
+        Train a model for the current running project, evaluate it and store it, in a training worker process if the
+        runtime has a worker pool. A streaming project reads its rows from disk while training, see DatasetStream.
+
+        :param stop_event: Optional event which stops training when it is set
+        :type stop_event: threading.Event
+
+        :param progress: Optional channel to publish training progress to
+        :type progress: ProgressChannel
+
+        :param warm_start: Continue training the stored model instead of training a new model
+        :type warm_start: bool
         """
+        _params = self.__project_manager.load_model(self.__project_name)
+        # The stored model is only loaded by the training task which continues training it
+        _weights = _params.get('weights') or f'{uuid4()}.h5'
+        _task = {
+            'username': self.__project_manager.username,
+            'project': self.__project_name,
+            'params': _params,
+            'model_path': os.path.join(self.__dataset_dir, 'models', _weights),
+            'model_hash': _params.get('weights-hash'),
+            'warm_start': warm_start,
+            'evaluate': True,
+            'stream': self.__get_stream() if self.streaming else None
+        }
+        with self.__lock.read():
+            _task.update(x_train=self.__x_train, y_train=self.__y_train, x_test=self.__x_test, y_test=self.__y_test)
+        if self.__worker_pool is not None:
+            _train_scoring, _test_scoring, _model_hash = self.__worker_pool.run(_task, stop_event, progress)
+        else:
+            _train_scoring, _test_scoring, _model_hash = run_training_task(_task, stop_event, progress)
+
+        self.__project_manager.store_model_weights(self.__project_name, _weights, _model_hash)
+
         self.__project_manager.store_model_scoring(
             project_name=self.__project_name,
-            scoring=self.model_manager.train_model(
-                x_train=self.__x_train,
-                y_train=self.__y_train
-            ),
+            scoring=_train_scoring,
             scoring_source=self.__project_manager.SCORING_TRAIN
         )
-
-    def test_model(self):
+        if _test_scoring is not None:
+            self.__project_manager.store_model_scoring(
+                project_name=self.__project_name,
+                scoring=_test_scoring,
+                scoring_source=self.__project_manager.SCORING_TEST
+            )
+
+    def cross_validate(self, stop_event=None, progress=None):
         """
-        Attempt evaluating the model that has been trained for the current project
+        Score the model with k-fold cross-validation on the whole dataset and store the scoring of every fold and their
+        mean and standard deviation. Folds train concurrently on the training worker processes if the runtime has a
+        worker pool, they read their rows from a single shared copy of the features.
+
+        :param stop_event: Optional event which stops cross-validation when it is set
+        :type stop_event: threading.Event
+
+        :param progress: Optional channel to publish cross-validation progress to
+        :type progress: ProgressChannel
         """
+        _random_state = self.__project_manager.get_preprocessing(self.__project_name, 'random-state')
+        _output_cols = self.__project_manager.get_preprocessing(self.__project_name, 'output-columns')
+        _folds = self.__project_manager.get_preprocessing(self.__project_name, 'folds') or 5
+        _stratify = self.__project_manager.get_preprocessing(self.__project_name, 'stratify')
+        if _random_state is None or _output_cols is None:
+            raise ValueError(f'The output columns of project {self.__project_name} have not been set')
+
+        # One float32 copy of the features, instead of a DataFrame for every fold
+        with self.__lock.read():
+            dataset = self.__read_dataset()
+            _x = to_float32(to_numpy_types(dataset.drop(_output_cols, axis=1)))
+            _y = to_float32(to_numpy_types(dataset[_output_cols]))
+        if _stratify:
+            # Stratify on the combination of the output columns
+            _labels = np.unique(_y.astype(str), axis=0, return_inverse=True)[1].ravel()
+            _splits = list(StratifiedKFold(n_splits=_folds, shuffle=True, random_state=_random_state).split(_x, _labels))
+        else:
+            _splits = list(KFold(n_splits=_folds, shuffle=True, random_state=_random_state).split(_x))
+
+        _params = self.__project_manager.load_model(self.__project_name)
+        _shared_x = SharedArray(_x) if self.__worker_pool is not None else None
+        _shared_y = SharedArray(_y) if self.__worker_pool is not None else None
+
+        def _rows(array, shared, index):
+            return shared.get_rows(index) if shared is not None else array[index]
+
+        def _train_fold(train_index, test_index):
+            if stop_event is not None and stop_event.is_set():
+                return None
+            _task = {
+                'username': self.__project_manager.username,
+                'project': self.__project_name,
+                'params': _params,
+                'model_path': None,
+                'model_hash': None,
+                'warm_start': False,
+                'evaluate': True,
+                'x_train': _rows(_x, _shared_x, train_index),
+                'y_train': _rows(_y, _shared_y, train_index),
+                'x_test': _rows(_x, _shared_x, test_index),
+                'y_test': _rows(_y, _shared_y, test_index)
+            }
+            if self.__worker_pool is not None:
+                return self.__worker_pool.run(_task, stop_event)[1]
+            return run_training_task(_task, stop_event)[1]
+
+        _scoring, _done = [None] * _folds, 0
+        try:
+            # In-process folds share the compiled models of the project, so they run one at a time
+            with ThreadPoolExecutor(max_workers=self.__worker_pool.workers if self.__worker_pool is not None else 1,
+                                    thread_name_prefix='crossvalidation-fold') as executor:
+                _futures = {
+                    executor.submit(_train_fold, _train_index, _test_index): _fold
+                    for _fold, (_train_index, _test_index) in enumerate(_splits)
+                }
+                for _future in as_completed(_futures):
+                    _scoring[_futures[_future]] = _future.result()
+                    _done += 1
+                    if progress is not None:
+                        progress.publish(fold=_done, folds=_folds)
+        finally:
+            for _shared in [_shared_x, _shared_y]:
+                if _shared is not None:
+                    _shared.close()
+        if stop_event is not None and stop_event.is_set():
+            return
+
+        _metrics = {
+            _metric: np.array([_fold[_metric] for _fold in _scoring]) for _metric in ['test_loss', 'test_accuracy']
+        }
         self.__project_manager.store_model_scoring(
             project_name=self.__project_name,
-            scoring=self.model_manager.test_model(
-                x_test=self.__x_test,
-                y_test=self.__y_test
-            ),
-            scoring_source=self.__project_manager.SCORING_TEST
+            scoring={
+                'folds': [
+                    {'fold': _fold + 1, **{_metric: _fold_scoring[_metric] for _metric in _metrics.keys()}}
+                    for _fold, _fold_scoring in enumerate(_scoring)
+                ],
+                'mean': {_metric: round(float(_values.mean()), 2) for _metric, _values in _metrics.items()},
+                'std': {_metric: round(float(_values.std()), 2) for _metric, _values in _metrics.items()},
+                'stratified': bool(_stratify),
+                'timestamp': time.time()
+            },
+            scoring_source=self.__project_manager.SCORING_CROSSVALIDATION
+        )
+
+    def search_model(self, space, strategy, trials=10, stop_event=None, progress=None):
+        """
+        Search the model parameters for the combination with the lowest validation loss and store the leaderboard,
+        trials run concurrently on the training worker processes if the runtime has a worker pool
+
+        :param space: The values to search, see get_search_space
+        :type space: dict
+
+        :param strategy: The search strategy, one of STRATEGIES
+        :type strategy: str
+
+        :param trials: The amount of sampled combinations
+        :type trials: int
+
+        :param stop_event: Optional event which stops the search when it is set
+        :type stop_event: threading.Event
+
+        :param progress: Optional channel to publish search progress to
+        :type progress: ProgressChannel
+        """
+        _params = self.__project_manager.load_model(self.__project_name)
+        with self.__lock.read():
+            _x_train, _y_train = self.__x_train, self.__y_train
+
+        def _train(params, model_path, model_hash, trial_stop_event):
+            _task = {
+                'username': self.__project_manager.username,
+                'project': self.__project_name,
+                'params': params,
+                'model_path': model_path,
+                'model_hash': model_hash,
+                'warm_start': model_hash is not None,
+                'evaluate': False,
+                'x_train': _x_train,
+                'y_train': _y_train,
+                'x_test': None,
+                'y_test': None
+            }
+            if self.__worker_pool is not None:
+                _train_scoring, _, _model_hash = self.__worker_pool.run(_task, trial_stop_event)
+            else:
+                _train_scoring, _, _model_hash = run_training_task(_task, trial_stop_event)
+            return _train_scoring, _model_hash
+
+        # In-process trials share the compiled models of the project, so they run one at a time
+        _search = HyperparameterSearch(
+            _params, space, strategy, _train,
+            directory=os.path.join(self.__dataset_dir, 'models', f'search-{uuid4()}'),
+            trials=trials,
+            workers=self.__worker_pool.workers if self.__worker_pool is not None else 1,
+            random_state=self.__project_manager.get_preprocessing(self.__project_name, 'random-state')
         )
+        self.__project_manager.store_search_results(self.__project_name, strategy,
+                                                    _search.run(stop_event=stop_event, progress=progress))
@@ -1,26 +1,240 @@
+import copy
 import gc
 import logging
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
 
 from flask import session
 
+from core.jobmanager import JobManager
 from core.projectmanager import ProjectManager
 from core.projectruntime import ProjectRuntime
+from core.trainingworker import TrainingWorkerPool
 
 
 class RuntimeManager:
-    def __init__(self, project_manager, dataset_dir):
+    __REAPER_INTERVAL = 60.0  # Maximal seconds between two checks for idle runtimes
+
+    def __init__(self, project_manager, dataset_dir, training_workers=1, progress_interval=0.5, worker_pool=None,
+                 memory_budget=None, idle_timeout=None):
         """
-        Manager class to keep track of all projects in the runtime
+        Manager class to keep track of all projects in the runtime. Running projects keep their runtime in memory until
+        the runtimes exceed the memory budget or the project has been idle too long, the least recently used runtimes
+        are dropped first and loaded from disk again when the project is used next. Requests for the same project read
+        its dataset at the same time, edits wait for them and hold the lock of the runtime alone, see ProjectRuntime.lock.
 
         :param project_manager: A pointer to the manager with database access
         :type project_manager: ProjectManager
 
         :param dataset_dir: The directory where datasets can be found
         :type dataset_dir: str
+
+        :param training_workers: The amount of models which can be trained at the same time
+        :type training_workers: int
+
+        :param progress_interval: The minimal amount of seconds between two training progress updates within an epoch
+        :type progress_interval: float
+
+        :param worker_pool: The training worker processes to train models in, models are trained in-process if None
+        :type worker_pool: TrainingWorkerPool
+
+        :param memory_budget: The amount of bytes all loaded runtimes may take together, unlimited if None
+        :type memory_budget: int
+
+        :param idle_timeout: The seconds after which an unused runtime is dropped, never if None
+        :type idle_timeout: float
         """
-        self.__runtime = {}
+        self.__username = None
+        self.__running = {}
+        self.__runtime = OrderedDict()  # Loaded runtimes by owner and project, least recently used first
+        self.__last_access = {}
+        self.__leases = {}  # Amount of calls using a runtime by owner and project
+        self.__lock = threading.RLock()
         self.__project_manager = project_manager
         self.__dataset_dir = dataset_dir
+        self.__job_manager = JobManager(workers=training_workers, progress_interval=progress_interval)
+        self.__worker_pool = worker_pool
+        self.__memory_budget = memory_budget
+        self.__idle_timeout = idle_timeout
+        if idle_timeout is not None:
+            threading.Thread(target=self.__reap, name='runtime-reaper', daemon=True).start()
+
+    def bind(self, username):
+        """
+        Create a view on the runtimes for a fixed user, which can be used outside of a request, eg. by the runtime server
+
+        :param username: The user to manage runtimes for
+        :type username: str
+
+        :rtype: RuntimeManager
+        """
+        # The view shares every runtime, job and lock with this manager
+        _bound = copy.copy(self)
+        _bound.__username = username
+        return _bound
+
+    def __get_username(self):
+        """
+        Request the user whose runtimes are managed
+
+        :rtype: str
+        """
+        if self.__username is not None:
+            return self.__username
+        return session['username']
+
+    def __load_runtime(self, username, project_name):
+        """
+        Create the runtime of a project, which loads its dataset from disk
+
+        :rtype: ProjectRuntime
+        """
+        # Training jobs use the runtime outside of the request, so it can not depend on the session
+        return ProjectRuntime(project_name,
+                              self.__project_manager.bind(username),
+                              self.__dataset_dir,
+                              self.__worker_pool)
+
+    def __lease(self, key):
+        """
+        Mark a loaded runtime as used by one more call and as the most recently used runtime, must be called while
+        holding the lock
+        """
+        self.__leases[key] = self.__leases.get(key, 0) + 1
+        self.__runtime.move_to_end(key)
+        self.__last_access[key] = time.monotonic()
+
+    def __acquire_runtime(self, key):
+        """
+        Lease the runtime of a running project, loading it again if it was dropped
+
+        :param key: The owner and name of the project
+        :type key: tuple
+
+        :rtype: ProjectRuntime
+        """
+        with self.__lock:
+            if key[1] not in self.__running.get(key[0], []):
+                raise KeyError(f'Project {key[1]} is not running')
+            _runtime = self.__runtime.get(key)
+            if _runtime is not None:
+                self.__lease(key)
+                return _runtime
+        # Loading reads the dataset from disk, other projects are served meanwhile
+        logging.info(f'Reloading the runtime of project {key[1]} for user {key[0]}')
+        _loaded = self.__load_runtime(*key)
+        with self.__lock:
+            if key[1] in self.__running.get(key[0], []):
+                _runtime = self.__runtime.setdefault(key, _loaded)
+                self.__lease(key)
+        if _runtime is not _loaded:
+            # Another request loaded the runtime first, or the project was stopped meanwhile
+            RuntimeManager.__close(_loaded)
+        if _runtime is None:
+            raise KeyError(f'Project {key[1]} is not running')
+        return _runtime
+
+    @contextmanager
+    def __use_runtime(self, project_name):
+        """
+        Use the runtime of a running project of the current user for the duration of a with-block, loading it again if
+        it was dropped. A runtime in use is never dropped, so an edit can not end up in a runtime which has been
+        replaced by a newly loaded one.
+
+        :param project_name: The project to request the runtime of
+        :type project_name: str
+
+        :rtype: ProjectRuntime
+        """
+        _key = (self.__get_username(), project_name)
+        _runtime = self.__acquire_runtime(_key)
+        try:
+            self.__enforce_budget(keep=_key)
+            yield _runtime
+        finally:
+            with self.__lock:
+                self.__leases[_key] -= 1
+                if not self.__leases[_key]:
+                    del self.__leases[_key]
+
+    def __is_busy(self, key):
+        """
+        Check if the runtime of a project is used by a call or by a queued or running job, so it can not be dropped,
+        must be called while holding the lock
+
+        :rtype: bool
+        """
+        return 1 if self.__leases.get(key) or self.__job_manager.has_active_job(*key) else 0
+
+    def __unload(self, key):
+        """
+        Remove a loaded runtime, it stays running and is loaded again when it is used next, must be called while
+        holding the lock. The runtime has to be closed afterwards, outside of the lock.
+
+        :returns: The removed runtime, or None if it was not loaded
+        :rtype: ProjectRuntime
+        """
+        self.__last_access.pop(key, None)
+        return self.__runtime.pop(key, None)
+
+    @staticmethod
+    def __close(runtime):
+        """
+        Write the pending edits of an unloaded runtime to disk and free its memory, it may wait for an edit or a split
+        of the runtime so it must not be called while holding the lock
+        """
+        runtime.close()
+        gc.collect()
+
+    def __enforce_budget(self, keep=None):
+        """
+        Drop the least recently used runtimes until the loaded runtimes fit in the memory budget. The memory usage is
+        read and runtimes are closed outside of the lock, so a busy runtime does not hold up requests of other projects.
+        Dropped runtimes are closed in the background.
+
+        :param keep: The owner and name of a project which must stay loaded
+        :type keep: tuple
+        """
+        if self.__memory_budget is None:
+            return
+        with self.__lock:
+            _runtimes = list(self.__runtime.items())
+        _usage = {_key: _runtime.memory_usage for _key, _runtime in _runtimes}
+        _total = sum(_usage.values())
+        _unloaded = []
+        with self.__lock:
+            for _key, _runtime in _runtimes:
+                if _total <= self.__memory_budget:
+                    break
+                # Skip runtimes which were replaced or unloaded since the snapshot
+                if _key == keep or self.__runtime.get(_key) is not _runtime or self.__is_busy(_key):
+                    continue
+                logging.info(f'Dropping the runtime of project {_key[1]} for user {_key[0]}, runtimes take '
+                             f'{_total / 1e6:.2f} MB of {self.__memory_budget / 1e6:.2f} MB')
+                _unloaded.append(self.__unload(_key))
+                _total -= _usage[_key]
+        for _runtime in _unloaded:
+            # The request which exceeded the budget does not wait for the runtime of another project
+            threading.Thread(target=RuntimeManager.__close, args=(_runtime,), name='runtime-close').start()
+
+    def __reap(self):
+        """
+        Drop runtimes which have not been used for the idle timeout, runs in a background thread
+        """
+        while True:
+            time.sleep(min(self.__idle_timeout, RuntimeManager.__REAPER_INTERVAL))
+            _deadline = time.monotonic() - self.__idle_timeout
+            _unloaded = []
+            with self.__lock:
+                for _key, _last_access in list(self.__last_access.items()):
+                    if _last_access < _deadline and not self.__is_busy(_key):
+                        logging.info(f'Dropping the idle runtime of project {_key[1]} for user {_key[0]}')
+                        _unloaded.append(self.__unload(_key))
+            for _runtime in _unloaded:
+                if _runtime is not None:
+                    RuntimeManager.__close(_runtime)
 
     def run_project(self, project_name):
         """
@@ -29,26 +243,36 @@ class RuntimeManager:
         :param project_name: The project to pop from runtime
         :type project_name: str
         """
-        if session['username'] in self.__runtime:
-            self.__runtime[session['username']][project_name] = ProjectRuntime(project_name,
-                                                                               self.__project_manager,
-                                                                               self.__dataset_dir)
-        else:
-            self.__runtime[session['username']] = {
-                project_name: ProjectRuntime(project_name,
-                                             self.__project_manager,
-                                             self.__dataset_dir)
-            }
+        _key = (self.__get_username(), project_name)
+        _runtime = self.__load_runtime(*_key)
+        with self.__lock:
+            _previous = self.__unload(_key)
+            self.__runtime[_key] = _runtime
+            self.__last_access[_key] = time.monotonic()
+            _projects = self.__running.setdefault(_key[0], [])
+            if project_name not in _projects:
+                _projects.append(project_name)
+        if _previous is not None:
+            RuntimeManager.__close(_previous)
+        self.__enforce_budget(keep=_key)
 
     def stop_project(self, project_name):
         """
-        Delete a project from the project runtime
+        Delete a project from the project runtime, a project which is not running is left as it is
 
         :param project_name: The project to pop from runtime
         :type project_name: str
         """
-        self.__runtime[session['username']].pop(project_name)
-        gc.collect()
+        self.cancel_training(project_name)
+        _key = (self.__get_username(), project_name)
+        with self.__lock:
+            _projects = self.__running.get(_key[0], [])
+            if project_name not in _projects:
+                return
+            _projects.remove(project_name)
+            _runtime = self.__unload(_key)
+        if _runtime is not None:
+            RuntimeManager.__close(_runtime)
 
     def is_project_running(self, project_name):
         """
@@ -60,8 +284,8 @@ class RuntimeManager:
         :returns: A boolean representing the project running state
         :rtype: bool
         """
-        for name, projects in self.__runtime.items():
-            if name == session['username'] and project_name in projects:
+        with self.__lock:
+            if project_name in self.__running.get(self.__get_username(), []):
                 return 1
         return 0
 
@@ -75,10 +299,8 @@ class RuntimeManager:
         :rtype: str or None
         """
         try:
-            return self.__runtime[session['username']][project_name].dataset.head().to_html(
-                classes='table table-striped table-hover table-scroll text-center',
-                border=0,
-                notebook=False)
+            with self.__use_runtime(project_name) as _runtime:
+                return _runtime.get_dataset_head()
         except Exception as e:
             logging.error(f'Error loading dataset for {e}')
             return None
@@ -94,7 +316,8 @@ class RuntimeManager:
         :rtype: list
         """
         try:
-            return self.__runtime[session['username']][project_name].get_columns()
+            with self.__use_runtime(project_name) as _runtime:
+                return _runtime.get_columns()
         except Exception as e:
             logging.error(f'Error loading column names for project {project_name}: {e}')
             return None
@@ -115,11 +338,13 @@ class RuntimeManager:
         :returns: Nothing
         """
         try:
-            if old_col_name in self.get_column_names(project_name) and old_col_name != new_col_name:
-                self.__runtime[session['username']][project_name].rename_column(old_name=old_col_name,
-                                                                                new_name=new_col_name)
-            else:
-                raise ValueError(f'No such column "{old_col_name}" in project {project_name}')
+            with self.__use_runtime(project_name) as _runtime:
+                # The column can not be dropped or renamed by another request between checking and renaming it
+                with _runtime.lock.write():
+                    if old_col_name in _runtime.get_columns() and old_col_name != new_col_name:
+                        _runtime.rename_column(old_name=old_col_name, new_name=new_col_name)
+                    else:
+                        raise ValueError(f'No such column "{old_col_name}" in project {project_name}')
         except Exception as e:
             logging.error(f'Error renaming column: {e}')
 
@@ -134,10 +359,12 @@ class RuntimeManager:
         :type col_name: str
         """
         try:
-            if col_name in self.get_column_names(project_name):
-                self.__runtime[session['username']][project_name].drop_column(col_name=col_name)
-            else:
-                raise ValueError(f'No such column name: {col_name}')
+            with self.__use_runtime(project_name) as _runtime:
+                with _runtime.lock.write():
+                    if col_name in _runtime.get_columns():
+                        _runtime.drop_column(col_name=col_name)
+                    else:
+                        raise ValueError(f'No such column name: {col_name}')
         except Exception as e:
             logging.error(f'Could not drop column {col_name} from {project_name}: {e}')
 
@@ -159,12 +386,12 @@ class RuntimeManager:
         :type value_new: str
         """
         try:
-            if col_name in self.get_column_names(project_name):
-                self.__runtime[session['username']][project_name].replace_values(column=col_name,
-                                                                                 old_value=value_old,
-                                                                                 new_value=value_new)
-            else:
-                raise ValueError(f'No such column name: {col_name}')
+            with self.__use_runtime(project_name) as _runtime:
+                with _runtime.lock.write():
+                    if col_name in _runtime.get_columns():
+                        _runtime.replace_values(column=col_name, old_value=value_old, new_value=value_new)
+                    else:
+                        raise ValueError(f'No such column name: {col_name}')
         except Exception as e:
             logging.error(
                 f'Could not replace values ({value_old} -> {value_new}) in project {project_name} for column {col_name}: {e}')
@@ -183,8 +410,8 @@ class RuntimeManager:
         :type columns: list
         """
         try:
-            self.__runtime[session['username']][project_name].preprocess_dataset(method=method,
-                                                                                 columns=columns)
+            with self.__use_runtime(project_name) as _runtime:
+                _runtime.preprocess_dataset(method=method, columns=columns)
         except Exception as e:
             logging.error(
                 f'Could not preprocess the columns {columns} with method {method} in project {project_name}: {e}')
@@ -199,7 +426,23 @@ class RuntimeManager:
         :rtype: dict
         """
         try:
-            return self.__runtime[session['username']][project_name].get_data_balance()
+            with self.__use_runtime(project_name) as _runtime:
+                return _runtime.get_data_balance()
+        except Exception as e:
+            logging.error(e)
+
+    def get_memory_report(self, project_name):
+        """
+        Return the memory usage of the columns of a dataset before and after compaction
+
+        :param project_name: The project to request the memory report from
+        :type project_name: str
+
+        :rtype: dict
+        """
+        try:
+            with self.__use_runtime(project_name) as _runtime:
+                return _runtime.get_memory_report()
         except Exception as e:
             logging.error(e)
 
@@ -210,11 +453,10 @@ class RuntimeManager:
         :rtype: list
         """
         try:
-            if session['username'] in self.__runtime:
-                return list(self.__runtime[session['username']].keys())
-            return []
+            with self.__lock:
+                return list(self.__running.get(self.__get_username(), []))
         except Exception as e:
-            logging.error(f'Error loading active projects for {session["username"]}: {e}')
+            logging.error(f'Error loading active projects for {self.__get_username()}: {e}')
             return []
 
     def split_project_dataset(self, project_name):
@@ -224,15 +466,110 @@ class RuntimeManager:
         :param project_name: The project to split the dataset for
         :type project_name: str
         """
-        self.__runtime[session['username']][project_name].train_test_split()
+        with self.__use_runtime(project_name) as _runtime:
+            _runtime.train_test_split()
 
-    def train_project_model(self, project_name):
+    def train_project_model(self, project_name, warm_start=False):
         """
-        Train the model
+        Queue a job which splits the dataset, trains the model and evaluates it
 
         :param project_name: The project to train a model for
         :type project_name: str
+
+        :param warm_start: Continue training the stored model instead of training a new model
+        :type warm_start: bool
+
+        :returns: The id of the training job
+        :rtype: str
+        """
+        # Once the job is queued, it keeps the runtime from being dropped
+        with self.__use_runtime(project_name) as _runtime:
+            def _train(stop_event, progress):
+                # A streaming project splits its rows while reading them
+                if not _runtime.streaming and not _runtime.train_test_split():
+                    raise ValueError(f'The dataset of project {project_name} can not be split')
+                _runtime.train_model(stop_event=stop_event, progress=progress, warm_start=warm_start)
+
+            return self.__job_manager.submit(self.__get_username(), project_name, _train)
+
+    def cross_validate_project_model(self, project_name):
+        """
+        Queue a job which scores the model with k-fold cross-validation, it is the training job of the project
+
+        :param project_name: The project to cross-validate the model of
+        :type project_name: str
+
+        :returns: The id of the cross-validation job
+        :rtype: str
+        """
+        # Once the job is queued, it keeps the runtime from being dropped
+        with self.__use_runtime(project_name) as _runtime:
+            def _cross_validate(stop_event, progress):
+                _runtime.cross_validate(stop_event=stop_event, progress=progress)
+
+            return self.__job_manager.submit(self.__get_username(), project_name, _cross_validate)
+
+    def search_project_model(self, project_name, space, strategy, trials=10):
+        """
+        Queue a job which splits the dataset and searches the model parameters, it is the training job of the project
+
+        :param project_name: The project to search model parameters for
+        :type project_name: str
+
+        :param space: The values to search, see get_search_space
+        :type space: dict
+
+        :param strategy: The search strategy, one of STRATEGIES
+        :type strategy: str
+
+        :param trials: The amount of sampled combinations
+        :type trials: int
+
+        :returns: The id of the search job
+        :rtype: str
+        """
+        # Once the job is queued, it keeps the runtime from being dropped
+        with self.__use_runtime(project_name) as _runtime:
+            def _search(stop_event, progress):
+                if not _runtime.train_test_split():
+                    raise ValueError(f'The dataset of project {project_name} can not be split')
+                _runtime.search_model(space, strategy, trials=trials, stop_event=stop_event, progress=progress)
+
+            return self.__job_manager.submit(self.__get_username(), project_name, _search)
+
+    def get_training_job(self, project_name):
+        """
+        Request the state of the last training job of a project
+
+        :param project_name: The project to request the training job for
+        :type project_name: str
+
+        :returns: The job record, or None if the project has not been trained since it started running
+        :rtype: dict or None
+        """
+        return self.__job_manager.get_project_job(self.__get_username(), project_name)
+
+    def get_training_progress(self, project_name):
+        """
+        Request the progress channel of the last training job of a project
+
+        :param project_name: The project to request training progress for
+        :type project_name: str
+
+        :rtype: ProgressChannel or None
+        """
+        _job = self.get_training_job(project_name)
+        if _job is not None:
+            return self.__job_manager.get_progress(_job['id'])
+        return None
+
+    def cancel_training(self, project_name):
+        """
+        Cancel the training job of a project, if it has one
+
+        :param project_name: The project to stop training for
+        :type project_name: str
         """
-        self.split_project_dataset(project_name=project_name)
-        self.__runtime[session['username']][project_name].train_model()
-        self.__runtime[session['username']][project_name].test_model()
+        _job = self.get_training_job(project_name)
+        if _job is not None:
+            self.__job_manager.cancel(_job['id'])
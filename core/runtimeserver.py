@@ -0,0 +1,229 @@
+"""
+Runtime server, a long-lived process which owns the runtimes of all running projects, so every web worker process
+sees the same running projects and loaded datasets and they survive restarts of the web workers. Web workers call the
+RuntimeManager of the server through a RuntimeClient over a local socket. The server is started as
+
+    KERASUITE_DATABASE_BACKEND=sqlite KERASUITE_RUNTIME_SERVER=<socket> python3 -m core.runtimeserver
+
+with the same environment as the web workers, it writes the connection key next to the socket.
+"""
+import logging
+import os
+import sys
+import threading
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+
+from flask import session
+
+ADDRESS_VARIABLE = 'KERASUITE_RUNTIME_SERVER'
+
+
+def _get_authkey_path(address):
+    """
+    Request the file holding the connection key of a server, readable by the owner only
+    """
+    return f'{address}.key'
+
+
+class RuntimeServer:
+    # RuntimeManager methods web workers may call
+    METHODS = frozenset([
+        'run_project', 'stop_project', 'is_project_running', 'get_running_projects', 'get_data_head',
+        'get_column_names', 'rename_column', 'drop_column', 'replace_values', 'preprocess_project',
+        'get_data_balance', 'get_memory_report', 'split_project_dataset', 'train_project_model',
+        'cross_validate_project_model', 'search_project_model', 'get_training_job', 'get_training_progress',
+        'wait_training_progress', 'cancel_training'
+    ])
+
+    def __init__(self, runtime_manager, address):
+        """
+        Serve a runtime manager on a Unix socket, every connection is served by its own thread
+
+        :param runtime_manager: The manager which owns the runtimes
+        :type runtime_manager: RuntimeManager
+
+        :param address: The path of the socket
+        :type address: str
+        """
+        self.__runtime_manager = runtime_manager
+        self.__address = address
+        self.__authkey = os.urandom(32)
+
+    def __call(self, username, method, args, kwargs):
+        """
+        Call a method of the runtime manager for a user
+
+        :returns: The result of the method, which has to be picklable
+        """
+        if method not in RuntimeServer.METHODS:
+            raise ValueError(f'Unknown runtime method {method}')
+        _manager = self.__runtime_manager.bind(username)
+        if method == 'get_training_progress':
+            # The channel stays in the server, clients poll it with wait_training_progress
+            _progress = _manager.get_training_progress(*args, **kwargs)
+            return _progress.interval if _progress is not None else None
+        if method == 'wait_training_progress':
+            _project_name, _version, _timeout = args
+            _progress = _manager.get_training_progress(_project_name)
+            return _progress.wait(_version, timeout=_timeout) if _progress is not None else (_version, {}, True)
+        return getattr(_manager, method)(*args, **kwargs)
+
+    def __serve_connection(self, connection):
+        """
+        Answer the requests of one client until it disconnects
+        """
+        with connection:
+            try:
+                while True:
+                    _username, _method, _args, _kwargs = connection.recv()
+                    try:
+                        _reply = ('result', self.__call(_username, _method, _args, _kwargs))
+                    except Exception as e:
+                        # Exceptions of other modules may not be importable by the client
+                        _reply = ('error', e if type(e).__module__ == 'builtins' else RuntimeError(str(e)))
+                    connection.send(_reply)
+            except (EOFError, OSError):
+                pass
+
+    def serve_forever(self):
+        """
+        Accept connections until the process is stopped
+        """
+        if os.path.exists(self.__address):
+            os.remove(self.__address)
+        _authkey_path = _get_authkey_path(self.__address)
+        with open(os.open(_authkey_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'w') as f:
+            f.write(self.__authkey.hex())
+        with Listener(self.__address, family='AF_UNIX', authkey=self.__authkey) as listener:
+            logging.info(f'Runtime server listening on {self.__address}')
+            while True:
+                try:
+                    _connection = listener.accept()
+                except (AuthenticationError, EOFError, OSError) as e:
+                    logging.error(f'Refused a runtime client: {e}')
+                    continue
+                threading.Thread(target=self.__serve_connection, args=(_connection,), name='runtime-connection',
+                                 daemon=True).start()
+
+
+class RemoteProgress:
+    def __init__(self, client, username, project_name, interval):
+        """
+        Progress channel of a training job in the runtime server, with the wait method of ProgressChannel
+
+        :param client: The client of the server
+        :type client: RuntimeClient
+
+        :param username: The owner of the project
+        :type username: str
+
+        :param project_name: The project which is training
+        :type project_name: str
+
+        :param interval: The interval of the channel in the server
+        :type interval: float
+        """
+        self.interval = interval
+        self.__client = client
+        self.__username = username
+        self.__project_name = project_name
+
+    def wait(self, version=0, timeout=None):
+        """
+        Wait for a state newer than a version, see ProgressChannel.wait
+
+        :rtype: tuple
+        """
+        return self.__client.request(self.__username, 'wait_training_progress', self.__project_name, version, timeout)
+
+
+class RuntimeClient:
+    def __init__(self, address):
+        """
+        Client of a runtime server, with the methods of RuntimeManager for the user of the current session. Every
+        thread which calls the server at the same time gets its own connection, idle connections are reused.
+
+        :param address: The path of the socket of the server
+        :type address: str
+        """
+        self.__address = address
+        self.__lock = threading.Lock()
+        self.__idle = []
+
+    def __connect(self):
+        """
+        Open a connection to the server, with the key it wrote when it started
+
+        :rtype: multiprocessing.connection.Connection
+        """
+        with open(_get_authkey_path(self.__address)) as f:
+            _authkey = bytes.fromhex(f.read().strip())
+        return Client(self.__address, family='AF_UNIX', authkey=_authkey)
+
+    def request(self, username, method, *args, **kwargs):
+        """
+        Call a method of the runtime manager in the server
+
+        :param username: The user to call the method for
+        :type username: str
+
+        :param method: The name of the method, see RuntimeServer.METHODS
+        :type method: str
+
+        :returns: The result of the method
+        """
+        while True:
+            with self.__lock:
+                _connection = self.__idle.pop() if self.__idle else None
+            _reused = _connection is not None
+            try:
+                if _connection is None:
+                    _connection = self.__connect()
+                _connection.send((username, method, args, kwargs))
+                _status, _value = _connection.recv()
+            except (EOFError, OSError) as e:
+                if _connection is not None:
+                    _connection.close()
+                if _reused:
+                    # The server restarted since the connection was last used
+                    continue
+                raise RuntimeError(f'Lost the connection to the runtime server: {e}')
+            with self.__lock:
+                self.__idle.append(_connection)
+            if _status == 'error':
+                raise _value
+            return _value
+
+    def get_training_progress(self, project_name):
+        """
+        Request the progress channel of the last training job of a project
+
+        :param project_name: The project to request training progress for
+        :type project_name: str
+
+        :rtype: RemoteProgress or None
+        """
+        _username = session['username']
+        _interval = self.request(_username, 'get_training_progress', project_name)
+        if _interval is None:
+            return None
+        # The progress stream outlives the request, so the channel keeps the username
+        return RemoteProgress(self, _username, project_name, _interval)
+
+    def __getattr__(self, method):
+        if method not in RuntimeServer.METHODS:
+            raise AttributeError(method)
+        return lambda *args, **kwargs: self.request(session['username'], method, *args, **kwargs)
+
+
+if __name__ == '__main__':
+    if os.environ.get('KERASUITE_DATABASE_BACKEND') != 'sqlite':
+        # Every process would keep its own copy of the journal database
+        sys.exit('The runtime server shares the database with the web workers, it requires the SQLite backend')
+    _address = os.path.abspath(os.environ[ADDRESS_VARIABLE])
+    # The app builds the in-process runtime manager with the configuration of the web workers when no server is set
+    os.environ[ADDRESS_VARIABLE] = ''
+    import app
+
+    RuntimeServer(app.runtime_manager, _address).serve_forever()
@@ -0,0 +1,92 @@
+import threading
+from contextlib import contextmanager
+
+
+class ReadWriteLock:
+    def __init__(self):
+        """
+        Lock which is held by any amount of readers at the same time, or by a single writer. Waiting writers go before
+        new readers, so a steady stream of reads can not starve an edit. Both locks can be taken again by the thread
+        which holds them and the writer may also read, but a reader can not upgrade to writing.
+        """
+        self.__condition = threading.Condition(threading.Lock())
+        self.__readers = {}  # Depth of the read lock by thread
+        self.__writer = None
+        self.__write_depth = 0
+        self.__waiting_writers = 0
+
+    def acquire_read(self):
+        """
+        Wait until no thread writes or waits to write and take a read lock
+        """
+        _thread = threading.get_ident()
+        with self.__condition:
+            if self.__writer != _thread and _thread not in self.__readers:
+                self.__condition.wait_for(lambda: self.__writer is None and not self.__waiting_writers)
+            self.__readers[_thread] = self.__readers.get(_thread, 0) + 1
+
+    def release_read(self):
+        """
+        Release a read lock of the current thread
+        """
+        _thread = threading.get_ident()
+        with self.__condition:
+            if self.__readers[_thread] > 1:
+                self.__readers[_thread] -= 1
+                return
+            del self.__readers[_thread]
+            if not self.__readers:
+                self.__condition.notify_all()
+
+    def acquire_write(self):
+        """
+        Wait until no other thread reads or writes and take the write lock
+        """
+        _thread = threading.get_ident()
+        with self.__condition:
+            if self.__writer == _thread:
+                self.__write_depth += 1
+                return
+            if _thread in self.__readers:
+                # Two readers upgrading at the same time would wait for each other forever
+                raise RuntimeError('A read lock can not be upgraded to a write lock')
+            self.__waiting_writers += 1
+            try:
+                self.__condition.wait_for(lambda: self.__writer is None and not self.__readers)
+            finally:
+                self.__waiting_writers -= 1
+            self.__writer, self.__write_depth = _thread, 1
+
+    def release_write(self):
+        """
+        Release the write lock of the current thread
+        """
+        with self.__condition:
+            if self.__writer != threading.get_ident():
+                raise RuntimeError('The write lock is not held by this thread')
+            self.__write_depth -= 1
+            if self.__write_depth == 0:
+                self.__writer = None
+                self.__condition.notify_all()
+
+    @contextmanager
+    def read(self):
+        """
+        Hold a read lock for the duration of a with-block
+        """
+        self.acquire_read()
+        try:
+            yield self
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def write(self):
+        """
+        Hold the write lock for the duration of a with-block
+        """
+        self.acquire_write()
+        try:
+            yield self
+        finally:
+            self.release_write()
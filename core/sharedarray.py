@@ -0,0 +1,84 @@
+"""
+Arrays in shared memory, so training worker processes read the rows they need from a single copy of a matrix instead
+of receiving a copy of it with every task.
+"""
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+
+class SharedArray:
+    def __init__(self, array):
+        """
+        Copy an array to a new shared memory block, which lives until close is called
+
+        :param array: The array to share, it can not hold Python objects
+        :type array: np.ndarray
+        """
+        if array.dtype.hasobject:
+            raise ValueError('Arrays of Python objects can not be shared')
+        self.__memory = SharedMemory(create=True, size=max(1, array.nbytes))
+        self.__shape, self.__dtype = array.shape, array.dtype.str
+        np.ndarray(array.shape, dtype=array.dtype, buffer=self.__memory.buf)[...] = array
+
+    def get_rows(self, index):
+        """
+        Request a reference to some rows of the array, which is cheap to send to a worker process
+
+        :param index: The row numbers
+        :type index: np.ndarray
+
+        :rtype: SharedRows
+        """
+        return SharedRows(self.__memory.name, self.__shape, self.__dtype, index)
+
+    def close(self):
+        """
+        Free the shared memory block, rows which have been loaded stay valid
+        """
+        self.__memory.close()
+        self.__memory.unlink()
+
+
+class SharedRows:
+    def __init__(self, name, shape, dtype, index):
+        """
+        Reference to some rows of a SharedArray
+
+        :param name: The name of the shared memory block
+        :type name: str
+
+        :param shape: The shape of the shared array
+        :type shape: tuple
+
+        :param dtype: The type of the shared array
+        :type dtype: str
+
+        :param index: The row numbers
+        :type index: np.ndarray
+        """
+        self.name, self.shape, self.dtype, self.index = name, shape, dtype, index
+
+    def load(self):
+        """
+        Copy the rows out of shared memory
+
+        :rtype: np.ndarray
+        """
+        _memory = SharedMemory(name=self.name)
+        try:
+            # The process which created the block unlinks it, the tracker of this process must not
+            resource_tracker.unregister(_memory._name, 'shared_memory')
+            return np.ndarray(self.shape, dtype=self.dtype, buffer=_memory.buf)[self.index]
+        finally:
+            _memory.close()
+
+
+def load_rows(values):
+    """
+    Load shared rows, other values are returned as they are
+
+    :rtype: np.ndarray or DataFrame
+    """
+    return values.load() if isinstance(values, SharedRows) else values
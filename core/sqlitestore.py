@@ -0,0 +1,144 @@
+import json
+import logging
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+
+class SQLiteStore:
+    def __init__(self, location, timeout=30.0):
+        """
+        Open a key-value database in SQLite, which can be shared by several processes. The database runs in WAL mode
+        so readers never wait on a writer.
+
+        :param location: The path of the SQLite database file
+        :type location: str
+
+        :param timeout: The amount of seconds to wait for a lock held by another connection
+        :type timeout: float
+        """
+        self.__location = location
+        self.__timeout = timeout
+        # sqlite3 connections can not be shared between threads, every thread gets its own
+        self.__local = threading.local()
+
+        with self.transaction() as _connection:
+            _connection.execute('CREATE TABLE IF NOT EXISTS records (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+        logging.info(f'Opened SQLite database {self.__location}')
+
+    def __get_connection(self):
+        """
+        Request the connection of the current thread
+
+        :rtype: sqlite3.Connection
+        """
+        if getattr(self.__local, 'connection', None) is None:
+            # Autocommit mode, transactions are started explicitly
+            _connection = sqlite3.connect(self.__location, timeout=self.__timeout, isolation_level=None)
+            _connection.execute('PRAGMA journal_mode=WAL')
+            _connection.execute('PRAGMA synchronous=NORMAL')
+            self.__local.connection = _connection
+            self.__local.depth = 0
+        return self.__local.connection
+
+    @contextmanager
+    def transaction(self):
+        """
+        Group reads and writes in a single transaction, nested transactions join the outer one
+
+        :rtype: sqlite3.Connection
+        """
+        _connection = self.__get_connection()
+        if self.__local.depth == 0:
+            # Take the write lock up front so a read-modify-write can not interleave with another process
+            _connection.execute('BEGIN IMMEDIATE')
+        self.__local.depth += 1
+        try:
+            yield _connection
+        except BaseException:
+            self.__local.depth -= 1
+            if self.__local.depth == 0:
+                _connection.execute('ROLLBACK')
+            raise
+        else:
+            self.__local.depth -= 1
+            if self.__local.depth == 0:
+                _connection.execute('COMMIT')
+
+    def get(self, key):
+        """
+        Request the value of a key
+
+        :param key: The key to request
+        :type key: str
+
+        :returns: The value or False if the key does not exist, like PickleDB
+        """
+        _row = self.__get_connection().execute('SELECT value FROM records WHERE key = ?', (key,)).fetchone()
+        if _row is None:
+            return False
+        return json.loads(_row[0])
+
+    def set(self, key, value):
+        """
+        Set the value of a key
+
+        :param key: The key to set
+        :type key: str
+
+        :param value: A JSON serializable value
+        :type value: Any
+
+        :rtype: bool
+        """
+        with self.transaction() as _connection:
+            _connection.execute('INSERT OR REPLACE INTO records (key, value) VALUES (?, ?)', (key, json.dumps(value)))
+        return True
+
+    def rem(self, key):
+        """
+        Remove a key
+
+        :param key: The key to remove
+        :type key: str
+
+        :rtype: bool
+        """
+        with self.transaction() as _connection:
+            return _connection.execute('DELETE FROM records WHERE key = ?', (key,)).rowcount > 0
+
+    def exists(self, key):
+        """
+        Check if a key exists
+
+        :param key: The key to check
+        :type key: str
+
+        :rtype: bool
+        """
+        return self.__get_connection().execute('SELECT 1 FROM records WHERE key = ?', (key,)).fetchone() is not None
+
+    def getall(self):
+        """
+        Request all keys
+
+        :rtype: list
+        """
+        return [_row[0] for _row in self.__get_connection().execute('SELECT key FROM records')]
+
+    def dump(self):
+        """
+        Move the WAL contents into the database file, every transaction is durable on its own
+
+        :rtype: bool
+        """
+        self.__get_connection().execute('PRAGMA wal_checkpoint(PASSIVE)')
+        return True
+
+    def close(self):
+        """
+        Close the connection of the current thread
+        """
+        if getattr(self.__local, 'connection', None) is not None:
+            self.__local.connection.close()
+            self.__local.connection = None
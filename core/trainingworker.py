@@ -0,0 +1,401 @@
+"""
+Process-isolated training workers. Every worker is a separate Python process with its own TensorFlow thread pools,
+optionally pinned to a subset of the CPU cores, which trains one model at a time. The worker process is started as
+
+    python3 -m core.trainingworker <socket> <intra-op threads> <inter-op threads> [<cpu>,...]
+
+with the connection key in the environment, it is not meant to be started by hand.
+"""
+import atexit
+import logging
+import os
+import queue
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from multiprocessing.connection import Client, Listener
+from uuid import uuid4
+
+from core.progresschannel import ProgressChannel
+
+AUTHKEY_VARIABLE = 'KERASUITE_WORKER_AUTHKEY'
+
+
+class TrainingWorker:
+    __START_TIMEOUT = 120.0  # Seconds to wait for a worker to import TensorFlow and accept the connection
+    __POLL_INTERVAL = 0.1  # Seconds between two checks for cancellation while waiting for the worker
+
+    def __init__(self, intra_op_threads=0, inter_op_threads=0, cpus=None):
+        """
+        Start a training worker process
+
+        :param intra_op_threads: The threads TensorFlow uses within an operation, 0 lets TensorFlow decide
+        :type intra_op_threads: int
+
+        :param inter_op_threads: The threads TensorFlow uses to run independent operations, 0 lets TensorFlow decide
+        :type inter_op_threads: int
+
+        :param cpus: The CPU cores to pin the worker to, all cores if None
+        :type cpus: list
+        """
+        self.__directory = tempfile.mkdtemp(prefix='kerasuite-worker-')
+        self.__connection = None
+        self.__send_lock = threading.Lock()  # The connection is shared by the running task and release requests
+        self.__model_memory = {}  # Bytes of the compiled models cached in the worker by project, see CompiledModelCache
+        _address = os.path.join(self.__directory, 'worker.sock')
+        _authkey = os.urandom(32)
+        _arguments = [sys.executable, '-m', 'core.trainingworker', _address, str(intra_op_threads),
+                      str(inter_op_threads)]
+        if cpus:
+            _arguments.append(','.join(str(_cpu) for _cpu in cpus))
+        self.__process = subprocess.Popen(_arguments,
+                                          cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                          env={**os.environ, AUTHKEY_VARIABLE: _authkey.hex()})
+        self.__connection = self.__connect(_address, _authkey)
+        logging.info(f'Started training worker {self.__process.pid} on CPUs {cpus or "all"}')
+
+    def __connect(self, address, authkey):
+        """
+        Connect to the worker once it listens
+
+        :rtype: multiprocessing.connection.Connection
+        """
+        _deadline = time.monotonic() + TrainingWorker.__START_TIMEOUT
+        while True:
+            try:
+                return Client(address, family='AF_UNIX', authkey=authkey)
+            except (FileNotFoundError, ConnectionRefusedError):
+                if self.__process.poll() is not None or time.monotonic() > _deadline:
+                    self.close()
+                    raise RuntimeError('The training worker did not start')
+                time.sleep(TrainingWorker.__POLL_INTERVAL)
+
+    def is_alive(self):
+        """
+        Check if the worker process is still running
+
+        :rtype: bool
+        """
+        return self.__process.poll() is None
+
+    def __send(self, message):
+        """
+        Send a message to the worker process
+        """
+        with self.__send_lock:
+            self.__connection.send(message)
+
+    @property
+    def model_memory(self):
+        """
+        The memory the compiled models cached in the worker take by project, as reported after the last task
+
+        :rtype: dict
+        """
+        return dict(self.__model_memory)
+
+    def release(self, project_key):
+        """
+        Ask the worker to drop the compiled models of a project, it frees them right away or after the running task
+
+        :param project_key: The owner and name of the project
+        :type project_key: tuple
+        """
+        self.__model_memory.pop(project_key, None)
+        if not self.is_alive():
+            return
+        try:
+            self.__send(('release', project_key))
+        except (EOFError, OSError) as e:
+            logging.warning(f'Could not release the models of {project_key} in training worker: {e}')
+
+    def run(self, task, stop_event=None, progress=None):
+        """
+        Run a training task on the worker and wait for its result
+
+        :param task: The task, see run_training_task
+        :type task: dict
+
+        :param stop_event: Optional event which stops training when it is set
+        :type stop_event: threading.Event
+
+        :param progress: Optional channel to relay the training progress of the worker to
+        :type progress: ProgressChannel
+
+        :returns: The result of run_training_task
+        :rtype: tuple
+        """
+        _interval = progress.interval if progress is not None else None
+        # Identifies the task a stop request is meant for, however late or early it reaches the worker
+        _task_id = uuid4().hex
+        try:
+            self.__send(('train', _task_id, task, _interval))
+            _stop_sent = False
+            while True:
+                if stop_event is not None and stop_event.is_set() and not _stop_sent:
+                    self.__send(('stop', _task_id))
+                    _stop_sent = True
+                if not self.__connection.poll(TrainingWorker.__POLL_INTERVAL):
+                    if not self.is_alive():
+                        raise RuntimeError('The training worker exited')
+                    continue
+                _message = self.__connection.recv()
+                if _message[0] == 'progress':
+                    if progress is not None:
+                        progress.publish(**_message[1])
+                elif _message[0] == 'result':
+                    self.__model_memory = _message[2]
+                    return _message[1]
+                elif _message[0] == 'error':
+                    self.__model_memory = _message[2]
+                    raise RuntimeError(_message[1])
+        except (EOFError, OSError) as e:
+            self.close()
+            raise RuntimeError(f'Lost the connection to the training worker: {e}')
+
+    def close(self):
+        """
+        Stop the worker process
+        """
+        if self.__connection is not None:
+            try:
+                self.__connection.close()
+            except OSError:
+                pass
+        if self.__process.poll() is None:
+            self.__process.terminate()
+            try:
+                self.__process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.__process.kill()
+        shutil.rmtree(self.__directory, ignore_errors=True)
+
+
+class TrainingWorkerPool:
+    def __init__(self, workers=1, intra_op_threads=0, inter_op_threads=0, cpu_affinity=False):
+        """
+        Pool of training worker processes, which are started when they are first needed. With CPU affinity every
+        worker gets its own share of the available cores, so concurrent jobs do not compete for the same cores.
+
+        :param workers: The amount of worker processes
+        :type workers: int
+
+        :param intra_op_threads: The threads TensorFlow uses within an operation in each worker, 0 lets TF decide
+        :type intra_op_threads: int
+
+        :param inter_op_threads: The threads TensorFlow uses to run independent operations in each worker
+        :type inter_op_threads: int
+
+        :param cpu_affinity: Pin every worker to its own share of the available CPU cores, only supported on Linux
+        :type cpu_affinity: bool
+        """
+        self.__intra_op_threads = intra_op_threads
+        self.__inter_op_threads = inter_op_threads
+        self.__size = workers
+        self.__lock = threading.Lock()
+        self.__workers = []
+        self.__idle = queue.Queue()
+        for _cpus in TrainingWorkerPool.__get_cpu_sets(workers, cpu_affinity):
+            # Slots hold the CPU set of a worker until it has been started
+            self.__idle.put((None, _cpus))
+        atexit.register(self.close)
+
+    @property
+    def workers(self):
+        """
+        The amount of worker processes, the amount of tasks which run at the same time
+
+        :rtype: int
+        """
+        return self.__size
+
+    @staticmethod
+    def __get_cpu_sets(workers, cpu_affinity):
+        """
+        Divide the available CPU cores between the workers
+
+        :returns: The cores of every worker, None if workers are not pinned
+        :rtype: list
+        """
+        if not cpu_affinity or not hasattr(os, 'sched_getaffinity'):
+            return [None] * workers
+        _cpus = sorted(os.sched_getaffinity(0))
+        _share = max(1, len(_cpus) // workers)
+        # With more workers than cores, workers share cores round-robin
+        _starts = [(_i * _share) % len(_cpus) for _i in range(workers)]
+        return [_cpus[_start:_start + _share] for _start in _starts]
+
+    def run(self, task, stop_event=None, progress=None):
+        """
+        Run a training task on the first idle worker, waiting for one if all workers are busy
+
+        :param task: The task, see run_training_task
+        :type task: dict
+
+        :param stop_event: Optional event which stops training when it is set
+        :type stop_event: threading.Event
+
+        :param progress: Optional channel to relay training progress to
+        :type progress: ProgressChannel
+
+        :returns: The result of run_training_task
+        :rtype: tuple
+        """
+        _worker, _cpus = self.__idle.get()
+        try:
+            if _worker is None or not _worker.is_alive():
+                _worker = TrainingWorker(self.__intra_op_threads, self.__inter_op_threads, _cpus)
+                with self.__lock:
+                    self.__workers.append(_worker)
+            return _worker.run(task, stop_event, progress)
+        finally:
+            self.__idle.put((_worker, _cpus))
+
+    def get_memory_usage(self, project_key):
+        """
+        Estimate the memory the compiled models of a project take in all workers, as reported after their last task
+
+        :param project_key: The owner and name of the project
+        :type project_key: tuple
+
+        :returns: The amount of bytes
+        :rtype: int
+        """
+        with self.__lock:
+            _workers = list(self.__workers)
+        return sum(_worker.model_memory.get(project_key, 0) for _worker in _workers)
+
+    def release(self, project_key):
+        """
+        Drop the compiled models of a project in all workers, so the memory of its models is freed
+
+        :param project_key: The owner and name of the project
+        :type project_key: tuple
+        """
+        with self.__lock:
+            _workers = list(self.__workers)
+        for _worker in _workers:
+            _worker.release(project_key)
+
+    def close(self):
+        """
+        Stop all worker processes
+        """
+        with self.__lock:
+            _workers, self.__workers = self.__workers, []
+        for _worker in _workers:
+            _worker.close()
+
+
+class ProgressSender:
+    def __init__(self, connection, interval):
+        """
+        Progress channel of a worker process, which sends throttled updates to the process which started the worker
+
+        :param connection: The connection to the parent process
+        :type connection: multiprocessing.connection.Connection
+
+        :param interval: The minimal amount of seconds between two throttled updates
+        :type interval: float
+        """
+        self.interval = interval
+        self.__connection = connection
+        self.__next_update = 0.0
+
+    def is_due(self):
+        """
+        Check if a throttled update should be sent now
+
+        :rtype: bool
+        """
+        return time.monotonic() >= self.__next_update
+
+    def publish(self, **fields):
+        """
+        Send an update to the parent process
+
+        :param fields: The fields of the progress state to update
+        """
+        self.__connection.send(('progress', fields))
+        self.__next_update = time.monotonic() + self.interval
+
+
+def _configure(intra_op_threads, inter_op_threads, cpus):
+    """
+    Pin the worker to its CPU cores and size the TensorFlow thread pools, before TensorFlow creates them
+    """
+    if cpus and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cpus)
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(intra_op_threads)
+    tf.config.threading.set_inter_op_parallelism_threads(inter_op_threads)
+
+
+def _serve(address, authkey):
+    """
+    Accept the connection of the parent process and run the tasks it sends, one at a time
+    """
+    # Imported after configuring TensorFlow
+    from core.modelmanager import COMPILED_MODELS, release_compiled_models, run_training_task
+
+    with Listener(address, family='AF_UNIX', authkey=authkey) as listener:
+        connection = listener.accept()
+    tasks, lock = queue.Queue(), threading.Lock()
+    stopped = set()  # Tasks which were asked to stop, a request can arrive before its task is started
+    current = {'id': None, 'stop_event': threading.Event()}
+
+    def _receive():
+        # Reads messages while the main thread trains, so stop requests arrive during training
+        try:
+            while True:
+                _message = connection.recv()
+                if _message[0] == 'stop':
+                    with lock:
+                        stopped.add(_message[1])
+                        if current['id'] == _message[1]:
+                            current['stop_event'].set()
+                elif _message[0] == 'release':
+                    # Dropped right away, the Keras session is only cleared between tasks
+                    COMPILED_MODELS.clear(_message[1])
+                    tasks.put(_message)
+                else:
+                    tasks.put(_message)
+        except (EOFError, OSError):
+            tasks.put(None)
+
+    threading.Thread(target=_receive, name='worker-receiver', daemon=True).start()
+    while True:
+        _message = tasks.get()
+        if _message is None:
+            break
+        if _message[0] == 'release':
+            release_compiled_models(_message[1])
+            continue
+        _, _task_id, _task, _interval = _message
+        _stop_event = threading.Event()
+        with lock:
+            current.update(id=_task_id, stop_event=_stop_event)
+            if _task_id in stopped:
+                _stop_event.set()
+            # Tasks run one after the other, requests for earlier tasks came too late
+            stopped.clear()
+        try:
+            _progress = ProgressSender(connection, _interval) if _interval is not None else None
+            _result = run_training_task(_task, _stop_event, _progress)
+            connection.send(('result', _result, COMPILED_MODELS.get_memory_report()))
+        except Exception as e:
+            logging.error(f'Training failed in worker {os.getpid()}: {e}')
+            connection.send(('error', str(e), COMPILED_MODELS.get_memory_report()))
+        finally:
+            with lock:
+                current['id'] = None
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    _configure(int(sys.argv[2]), int(sys.argv[3]),
+                [int(_cpu) for _cpu in sys.argv[4].split(',')] if len(sys.argv) > 4 else None)
+    _serve(sys.argv[1], bytes.fromhex(os.environ.pop(AUTHKEY_VARIABLE)))
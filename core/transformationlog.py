@@ -0,0 +1,132 @@
+import json
+import logging
+import os
+import threading
+
+
+class TransformationLog:
+    RENAME = 'rename'
+    DROP = 'drop'
+    REPLACE = 'replace'
+    PREPROCESS = 'preprocess'
+    __BASE = 'base'  # First line of a compacted log, the sequence number of the last operation which was dropped
+
+    def __init__(self, location):
+        """
+        Append-only log of the edits made to a dataset, one JSON object per line. Every operation gets an increasing
+        sequence number, so a materialized copy of the dataset knows which operations it already contains. Operations
+        which were materialized can be dropped with compact.
+
+        :param location: The path of the log file
+        :type location: str
+        """
+        self.__location = location
+        self.__lock = threading.Lock()
+        self.__base, self.__operations = self.__read()
+
+    def __read(self):
+        """
+        Read all operations from disk
+
+        :returns: The sequence number of the last dropped operation and the operations
+        :rtype: tuple
+        """
+        base, operations = 0, []
+        if os.path.exists(self.__location):
+            with open(self.__location, 'r', encoding='utf-8') as f:
+                for _line in f:
+                    try:
+                        operations.append(json.loads(_line))
+                    except json.JSONDecodeError:
+                        logging.warning(f'Ignoring incomplete operation at the end of {self.__location}')
+                        break
+        if operations and operations[0]['op'] == TransformationLog.__BASE:
+            base = operations.pop(0)['seq']
+        return base, operations
+
+    @property
+    def sequence(self):
+        """
+        The sequence number of the last operation, 0 if there are none
+
+        :rtype: int
+        """
+        with self.__lock:
+            return self.__get_sequence()
+
+    def __get_sequence(self):
+        """
+        Request the sequence number of the last operation, must be called while holding the lock
+
+        :rtype: int
+        """
+        return self.__operations[-1]['seq'] if self.__operations else self.__base
+
+    def append(self, operation, **params):
+        """
+        Record an operation
+
+        :param operation: The type of operation, one of RENAME, DROP, REPLACE or PREPROCESS
+        :type operation: str
+
+        :param params: The JSON serializable parameters needed to replay the operation
+
+        :returns: The sequence number of the recorded operation
+        :rtype: int
+        """
+        with self.__lock:
+            _seq = self.__get_sequence() + 1
+            _operation = {'seq': _seq, 'op': operation, **params}
+            with open(self.__location, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(_operation) + '\n')
+            self.__operations.append(_operation)
+            return _seq
+
+    def get_operations(self, after=0):
+        """
+        Request the operations recorded after a sequence number
+
+        :param after: The sequence number of the last operation that should not be returned
+        :type after: int
+
+        :raises ValueError: If operations after the sequence number were dropped
+
+        :rtype: list
+        """
+        with self.__lock:
+            if after < self.__base:
+                raise ValueError(f'The operations of {self.__location} after {after} were compacted')
+            return [_operation for _operation in self.__operations if _operation['seq'] > after]
+
+    def compact(self, sequence):
+        """
+        Drop the operations up to a sequence number, once a materialized copy of the dataset contains them. The log
+        is rewritten to a temporary file which replaces it, so a crash leaves either log intact.
+
+        :param sequence: The sequence number of the last operation to drop
+        :type sequence: int
+        """
+        with self.__lock:
+            if not self.__operations or self.__operations[0]['seq'] > sequence:
+                return
+            _base = min(sequence, self.__get_sequence())
+            _operations = [_operation for _operation in self.__operations if _operation['seq'] > _base]
+            _tmp_location = f'{self.__location}.tmp'
+            with open(_tmp_location, 'w', encoding='utf-8') as f:
+                # Appending continues after the dropped operations
+                f.write(json.dumps({'seq': _base, 'op': TransformationLog.__BASE}) + '\n')
+                for _operation in _operations:
+                    f.write(json.dumps(_operation) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(_tmp_location, self.__location)
+            self.__base, self.__operations = _base, _operations
+
+    def clear(self):
+        """
+        Delete the log
+        """
+        with self.__lock:
+            if os.path.exists(self.__location):
+                os.remove(self.__location)
+            self.__base, self.__operations = 0, []
@@ -2,19 +2,31 @@ import logging
 
 from flask import session
 from passlib.hash import bcrypt
-from pickledb import PickleDB
+
+from core.metadatastore import MetadataStore
 
 
 class UserManager:
 
-    def __init__(self, db):
+    def __init__(self, metadata_store):
         """
         Create an usermanager instance
 
-        :param db: A pointer to the database connector
-        :type db: PickleDB
+        :param metadata_store: The store holding user records
+        :type metadata_store: MetadataStore
+        """
+        self.__store = metadata_store
+
+    def __get_user(self, username):
+        """
+        Request the record of a single user
+
+        :param username: The user to request
+        :type username: str
+
+        :rtype: dict or None
         """
-        self.__db_client = db
+        return self.__store.get_record(MetadataStore.USER, username)
 
     def attempt_login(self, username, password):
         """
@@ -31,7 +43,7 @@ class UserManager:
         """
         try:
             logging.info(f'Attempting to login with username "{username}"')
-            userdata = self.__db_client.get('users')[username]['password']
+            userdata = self.__get_user(username)['password']
             if userdata is not None:
                 # Will return True if the submitted password matches the hashed password
                 return bcrypt.verify(password, userdata)
@@ -48,7 +60,7 @@ class UserManager:
         :rtype: bool
         """
         try:
-            return self.__db_client.get('users')[session['username']]["admin"]
+            return self.__get_user(session['username'])["admin"]
         except Exception as e:
             logging.error(f'Error retrieving user rights: {e}')
             return 0
@@ -60,7 +72,8 @@ class UserManager:
         :rtype: dict
         """
         if self.has_elevated_rights():
-            return self.__db_client.get('users')
+            return {_username: self.__get_user(_username)
+                    for _username in self.__store.get_index(MetadataStore.USER)}
         return None
 
     def does_user_exist(self, username):
@@ -72,8 +85,7 @@ class UserManager:
 
         :rtype: bool
         """
-        users = self.__db_client.get('users')
-        if username in users.keys():
+        if self.__get_user(username) is not None:
             return 1
         return 0
 
@@ -84,10 +96,9 @@ class UserManager:
         :param username: An username to delete
         :type username: str
         """
-        users = self.__db_client.get('users')
-        del users[username]
-        self.__db_client.set('users', users)
-        self.__db_client.dump()
+        with self.__store.transaction():
+            self.__store.remove_record(MetadataStore.USER, username)
+            self.__store.remove_from_index(username, MetadataStore.USER)
 
     def register_user(self, username, password, elevated_rights):
         """
@@ -102,10 +113,10 @@ class UserManager:
         :param elevated_rights: Does the newly created user have elevated rights or not
         :type elevated_rights: bool
         """
-        users = self.__db_client.get('users')
-        users[username] = {"password": bcrypt.hash(password), "admin": elevated_rights}
-        self.__db_client.set('users', users)
-        self.__db_client.dump()
+        _password = bcrypt.hash(password)
+        with self.__store.transaction():
+            self.__store.set_record(MetadataStore.USER, {"password": _password, "admin": elevated_rights}, username)
+            self.__store.add_to_index(username, MetadataStore.USER)
 
     def change_permissions(self, username):
         """
@@ -114,17 +125,17 @@ class UserManager:
         :param username: An username to change permissions for
         :type username: str
         """
-        users = self.__db_client.get('users')
-        users[username]['admin'] = not users[username]['admin']
-        self.__db_client.set('users', users)
-        self.__db_client.dump()
+        with self.__store.transaction():
+            user = self.__get_user(username)
+            user['admin'] = not user['admin']
+            self.__store.set_record(MetadataStore.USER, user, username)
 
     def admin_has_default_pass(self):
         """
         Check if the admin has changed his password
         :rtype: bool
         """
-        return bcrypt.verify('Kerasuite', self.__db_client.get('users')['admin']['password'])
+        return bcrypt.verify('Kerasuite', self.__get_user('admin')['password'])
 
     def change_password(self, old, new, new_repeat):
         """
@@ -139,9 +150,17 @@ class UserManager:
         :param new_repeat: Repeat of the new password for typo verification
         :type new_repeat: str
         """
-        if new == new_repeat:
-            if self.attempt_login(session['username'], old):
-                users = self.__db_client.get('users')
-                users[session['username']]['password'] = bcrypt.hash(new)
-                self.__db_client.set('users', users)
-                self.__db_client.dump()
+        if new != new_repeat:
+            return
+        _username = session['username']
+        _verified = self.__get_user(_username)
+        # Hashing is slow, it is done before the transaction so other processes are not locked out of the database
+        if _verified is None or not self.attempt_login(_username, old):
+            return
+        _password = bcrypt.hash(new)
+        with self.__store.transaction():
+            user = self.__get_user(_username)
+            # Only store the new password if the password was not changed while hashing
+            if user is not None and user['password'] == _verified['password']:
+                user['password'] = _password
+                self.__store.set_record(MetadataStore.USER, user, _username)
@@ -2,9 +2,10 @@ import logging
 
 from flask import session, request
 from wtforms import Form, StringField, PasswordField, validators, HiddenField, TextAreaField, SelectMultipleField, \
-    SelectField
-from wtforms.fields.html5 import IntegerRangeField, IntegerField
+    SelectField, BooleanField
+from wtforms.fields.html5 import IntegerRangeField, IntegerField, DecimalField
 
+from core.hyperparametersearch import STRATEGIES, MODEL_OPTIONS, MAX_TRIALS
 from core.modelcomponents import LAYER_OPTIONS, ACTIVATION_FUNCTIONS
 
 # Globals
@@ -237,6 +238,21 @@ class PreprocessingForm(Form):
         label="Custom random state (optional)",
         default=0
     )
+    folds = IntegerField(
+        label='Cross-validation folds',
+        validators=[
+            validators.NumberRange(min=2, max=20, message='Cross-validation needs between 2 and 20 folds')
+        ],
+        default=5
+    )
+    stratify = BooleanField(
+        label='Stratify cross-validation folds on the output column(s)',
+        default=False
+    )
+    streaming = BooleanField(
+        label='Stream the dataset from disk while training, for datasets which do not fit in memory',
+        default=False
+    )
     column_output = SelectMultipleField(
         label="Select output column(s)",
         validators=[
@@ -496,3 +512,95 @@ class AddDropoutLayerForm(Form):
             'max': 100
         }
     )
+
+
+class SearchModelForm(Form):
+    # Layer parameters are read from the fields layer-<layer id>-<parameter> in app.py
+    project = HiddenField(
+        validators=[
+            validators.DataRequired(message='Stop messing with the HTML, I need that.')
+        ]
+    )
+    strategy = SelectField(
+        label='Search strategy',
+        validators=[
+            validators.DataRequired(message='A search strategy is required')
+        ],
+        choices=[(key, value) for key, value in STRATEGIES.items()],
+        render_kw={
+            'class': 'form-select'
+        }
+    )
+    trials = IntegerField(
+        label='Trials: the amount of sampled combinations, unused by grid and Hyperband searches',
+        validators=[
+            validators.NumberRange(min=1, max=MAX_TRIALS,
+                                   message=f'The amount of trials must be between 1 and {MAX_TRIALS}')
+        ],
+        default=10
+    )
+    epochs = StringField(
+        label=f'Epochs: {MODEL_OPTIONS["epochs"]["description"]}',
+        render_kw={
+            'placeholder': '5, 10, 20 or 5..20'
+        }
+    )
+    batch_size = StringField(
+        label=f'Batch size: {MODEL_OPTIONS["batch-size"]["description"]}',
+        render_kw={
+            'placeholder': '16, 32, 64 or 16..64'
+        }
+    )
+
+
+class TrainingSettingsForm(Form):
+    project = HiddenField(
+        validators=[
+            validators.DataRequired(message='Stop messing with the HTML, I need that.')
+        ]
+    )
+    epochs = IntegerField(
+        label='Epochs: the maximal amount of passes over the training data',
+        validators=[
+            validators.NumberRange(min=1, message='A model must train for at least 1 epoch'),
+            validators.DataRequired(message='Epochs is a required parameter')
+        ]
+    )
+    batch_size = IntegerField(
+        label='Batch size: the amount of rows used for every update of the weights',
+        validators=[
+            validators.NumberRange(min=1, message='A batch must have at least 1 row'),
+            validators.DataRequired(message='Batch size is a required parameter')
+        ]
+    )
+    validation_split = IntegerField(
+        label='Validation split: the percentage of the training data used to validate every epoch',
+        validators=[
+            validators.NumberRange(min=0, max=50, message='The validation split must be between 0 and 50 percent')
+        ]
+    )
+    early_stopping = BooleanField(
+        label='Stop early when the monitored metric stops improving and restore the best epoch',
+        default=False
+    )
+    monitor = SelectField(
+        label='Monitored metric',
+        choices=[(item, item) for item in ['val_loss', 'val_accuracy', 'loss', 'accuracy']],
+        render_kw={
+            'class': 'form-select'
+        }
+    )
+    patience = IntegerField(
+        label='Patience: the amount of epochs without improvement after which training stops',
+        validators=[
+            validators.NumberRange(min=1, message='The patience must be at least 1 epoch')
+        ],
+        default=10
+    )
+    min_delta = DecimalField(
+        label='Min-delta: the minimal change of the monitored metric which counts as an improvement',
+        validators=[
+            validators.NumberRange(min=0, message='The min-delta can not be negative')
+        ],
+        default=0
+    )
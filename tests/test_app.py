@@ -0,0 +1,39 @@
+import io
+import os
+
+import pytest
+
+pytest.importorskip('tensorflow')
+
+
+@pytest.fixture
+def app_module(tmp_path, monkeypatch):
+    # The database is created in the working directory, models are trained in-process
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('KERASUITE_TRAINING_PROCESSES', '0')
+    monkeypatch.delenv('KERASUITE_RUNTIME_SERVER', raising=False)
+    import app
+    yield app
+    # The database is relative to the working directory, which is restored after the test
+    app.database.close()
+
+
+def test_upload_to_fresh_project(app_module):
+    projects = app_module.project_manager.bind('alice')
+    projects.create_project('fresh_project', 'Never had a dataset')
+    client = app_module.app.test_client()
+    with client.session_transaction() as session:
+        session['loggedin'] = True
+        session['username'] = 'alice'
+    try:
+        response = client.post('/set/project/dataset', data={
+            'projectname': 'fresh_project',
+            'dataset': (io.BytesIO(b'a,b\n1,2\n3,4\n'), 'upload.csv')
+        }, content_type='multipart/form-data')
+        assert response.status_code == 302
+        assert response.headers['Location'].endswith('/run?project=fresh_project')
+        dataset = projects.get_project_dataset('fresh_project')
+        assert dataset is not None
+        assert os.path.exists(os.path.join(app_module.app.config['UPLOAD_FOLDER'], dataset))
+    finally:
+        projects.drop_project('fresh_project')
@@ -0,0 +1,32 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from core.columnarwriter import ColumnarWriter
+from core.datasetcache import CachedDataset
+
+
+def _write(location, chunks, monkeypatch, max_categories):
+    monkeypatch.setattr(ColumnarWriter, 'MAX_CATEGORIES', max_categories)
+    writer = ColumnarWriter(location, compact=True)
+    for _chunk in chunks:
+        writer.append(_chunk)
+    return CachedDataset(location, writer.finish(sequence=0))
+
+
+def test_many_unique_values_are_stored_as_text(tmp_path, monkeypatch):
+    values = pd.Series([f'id "{_i}"\nnext line' if _i % 7 else None for _i in range(1000)], dtype=object)
+    dataset = pd.DataFrame({'id': values, 'x': np.arange(1000)})
+    chunks = [dataset.iloc[_start:_start + 300] for _start in range(0, 1000, 300)]
+
+    cached = _write(str(tmp_path / 'text'), chunks, monkeypatch, max_categories=100)
+    coded = _write(str(tmp_path / 'codes'), chunks, monkeypatch, max_categories=1000)
+
+    assert os.path.exists(str(tmp_path / 'text' / '0.txt'))
+    assert not os.path.exists(str(tmp_path / 'codes' / '0.txt'))
+    assert cached.read(0, 0).shape == (0, 2)
+    assert cached.read(0, 1000)['id'].equals(coded.read(0, 1000)['id'])
+    assert cached.read(298, 301, columns=['id'])['id'].tolist() == ['id "298"\nnext line', 'id "299"\nnext line',
+                                                                    'id "300"\nnext line']
+    assert np.isnan(cached.read(7, 8)['id'].iloc[0])
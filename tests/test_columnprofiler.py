@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+
+from core.columnprofiler import HISTOGRAM_BINS, TOP_VALUES, profile_chunks, profile_column
+
+
+def test_empty_column():
+    profile = profile_column(pd.Series([], dtype=np.float64))
+    assert profile == {'summary': 'counts', 'counts': {}, 'distinct': 0}
+
+
+def test_all_missing_column():
+    profile = profile_column(pd.Series([np.nan] * 10))
+    assert profile == {'summary': 'counts', 'counts': {}, 'distinct': 0}
+
+
+def test_few_values_are_counted():
+    profile = profile_column(pd.Series([1, 1, 2, np.nan]))
+    assert profile['summary'] == 'counts'
+    assert profile['counts'] == {'1.0': 2, '2.0': 1}
+
+
+def test_close_values_keep_their_counts():
+    profile = profile_column(pd.Series([1.00001, 1.00001, 1.00002]))
+    assert profile['counts'] == {'1.00001': 2, '1.00002': 1}
+
+
+def test_values_with_the_same_text_keep_their_counts():
+    profile = profile_column(pd.Series([1, 1, '1'], dtype=object))
+    assert profile['counts'] == {'1 (int)': 2, '1 (str)': 1}
+
+
+def test_infinite_values_are_not_binned():
+    values = pd.Series(np.r_[np.arange(100, dtype=np.float64), [np.inf, np.inf, -np.inf, np.nan]])
+    profile = profile_column(values)
+    assert profile['summary'] == 'histogram'
+    assert profile['counts'].pop('inf') == 2
+    assert profile['counts'].pop('-inf') == 1
+    assert len(profile['counts']) == HISTOGRAM_BINS
+    assert sum(profile['counts'].values()) == 100
+
+
+def test_narrow_bins_get_distinct_labels():
+    profile = profile_column(pd.Series(np.linspace(1e6, 1e6 + 1e-3, 1000)))
+    assert len(profile['counts']) == HISTOGRAM_BINS
+    assert sum(profile['counts'].values()) == 1000
+
+
+def test_many_strings_get_top_values():
+    values = pd.Series([f'value {_i % 50}' for _i in range(1000)] + ['common'] * 100)
+    profile = profile_column(values)
+    assert profile['summary'] == 'top-values'
+    assert len(profile['counts']) == TOP_VALUES
+    assert next(iter(profile['counts'].items())) == ('common', 100)
+
+
+def test_chunks_match_whole_column():
+    values = pd.Series(np.random.RandomState(0).normal(size=1000))
+    chunks = profile_chunks(lambda: (values.iloc[_start:_start + 100] for _start in range(0, 1000, 100)),
+                            values.dtype)
+    assert chunks == profile_column(values)
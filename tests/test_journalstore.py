@@ -0,0 +1,64 @@
+import os
+
+import pytest
+
+from core.journalstore import JournalStore
+
+
+def _open(location):
+    # Flushing and compacting in the background would race the test
+    return JournalStore(location, flush_interval=3600, compact_size=1 << 30)
+
+
+def test_failed_compaction_keeps_rotated_entries(tmp_path):
+    location = str(tmp_path / 'test.db')
+    store = _open(location)
+    store.set('a', 1)
+
+    # The snapshot can not be written while a directory is in the way
+    os.mkdir(f'{location}.tmp')
+    with pytest.raises(OSError):
+        store.compact()
+    store.set('b', 2)
+    with pytest.raises(OSError):
+        store.compact()
+    os.rmdir(f'{location}.tmp')
+
+    # Crash: the second rotation happened, its snapshot never landed
+    reopened = _open(location)
+    assert reopened.get('a') == 1
+    assert reopened.get('b') == 2
+    assert not os.path.exists(f'{location}.journal.old')
+
+
+def test_replays_journal_after_crash(tmp_path):
+    location = str(tmp_path / 'test.db')
+    store = _open(location)
+    store.set('a', 1)
+    store.set('b', 2)
+    store.rem('a')
+    store.flush()
+
+    # Crash: the process dies without closing the store, halfway through writing an entry
+    with open(f'{location}.journal', 'a', encoding='utf-8') as f:
+        f.write('{"op": "set", "key": "c"')
+    reopened = _open(location)
+    assert not reopened.exists('a')
+    assert reopened.get('b') == 2
+    assert not reopened.exists('c')
+
+
+def test_compaction_writes_snapshot(tmp_path):
+    location = str(tmp_path / 'test.db')
+    store = _open(location)
+    store.set('a', {'nested': [1, 2]})
+    store.set('b', 2)
+    store.compact()
+
+    assert os.path.getsize(f'{location}.journal') == 0
+    assert not os.path.exists(f'{location}.journal.old')
+    store.set('b', 3)
+    store.flush()
+    reopened = _open(location)
+    assert reopened.get('a') == {'nested': [1, 2]}
+    assert reopened.get('b') == 3
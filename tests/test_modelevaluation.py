@@ -0,0 +1,30 @@
+import numpy as np
+
+from core.modelevaluation import ModelEvaluation
+
+
+def test_binary_target_gets_confusion_matrix():
+    evaluation = ModelEvaluation()
+    evaluation.update(np.array([0.0, 1.0, 1.0, 0.0]), np.array([0.2, 0.7, 0.4, 0.1]))
+    scoring = evaluation.get_scoring()
+    assert scoring['confusion_matrix'] == {'labels': [0, 1], 'matrix': [[2, 0], [1, 1]]}
+    assert scoring['classification_report']['1']['support'] == 2
+
+
+def test_continuous_target_is_not_scored_per_class():
+    evaluation = ModelEvaluation()
+    evaluation.update(np.array([0.0, 1.0]), np.array([0.2, 0.7]))
+    evaluation.update(np.array([0.5, 1234.25]), np.array([0.4, 0.3]))
+    scoring = evaluation.get_scoring()
+    assert not evaluation.is_classification
+    assert scoring['confusion_matrix'] is None
+    assert scoring['classification_report'] == {}
+    assert scoring['test_loss'] > 0
+
+
+def test_too_many_classes_are_not_scored_per_class():
+    evaluation = ModelEvaluation()
+    _samples = ModelEvaluation.MAX_CLASSES + 1
+    evaluation.update(np.arange(_samples, dtype=np.float64), np.zeros(_samples))
+    assert not evaluation.is_classification
+    assert evaluation.confusion_matrix.shape == (0, 0)
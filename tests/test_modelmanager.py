@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('tensorflow')
+
+from core.modelmanager import CompiledModelCache
+
+
+def _entry(size):
+    return None, [np.zeros(size, dtype=np.uint8)]
+
+
+def test_cache_is_bounded_across_projects():
+    cache = CompiledModelCache(models_per_project=2, models=3)
+    cache.put(('alice', 'a'), 'first', _entry(1))
+    cache.put(('alice', 'a'), 'second', _entry(1))
+    cache.put(('bob', 'b'), 'first', _entry(1))
+    assert cache.get(('alice', 'a'), 'first') is not None
+    cache.put(('bob', 'b'), 'second', _entry(1))
+
+    # The least recently used model of any project goes first
+    assert len(cache) == 3
+    assert cache.get(('alice', 'a'), 'second') is None
+    assert cache.get(('alice', 'a'), 'first') is not None
+
+
+def test_memory_report_by_project():
+    cache = CompiledModelCache()
+    cache.put(('alice', 'a'), 'first', _entry(10))
+    cache.put(('bob', 'b'), 'first', _entry(5))
+    cache.clear(('bob', 'b'))
+    # The weights and the copy of the initial weights
+    assert cache.get_memory_report() == {('alice', 'a'): 20}
+    assert len(cache) == 1
@@ -0,0 +1,80 @@
+import threading
+
+import pytest
+
+from core.rwlock import ReadWriteLock
+
+
+def _run(target):
+    """
+    Run a function in another thread and wait at most a second for it
+
+    :returns: If the function returned in time
+    :rtype: bool
+    """
+    _thread = threading.Thread(target=target, daemon=True)
+    _thread.start()
+    _thread.join(timeout=1)
+    return not _thread.is_alive()
+
+
+def test_read_lock_is_reentrant():
+    lock = ReadWriteLock()
+    with lock.read():
+        with lock.read():
+            pass
+        # Still held once, a writer has to wait
+        assert not _run(lambda: lock.acquire_write())
+
+
+def test_write_lock_is_reentrant_and_may_read():
+    lock = ReadWriteLock()
+    with lock.write():
+        with lock.write():
+            with lock.read():
+                pass
+        assert not _run(lambda: lock.acquire_read())
+    assert _run(lambda: lock.acquire_write())
+
+
+def test_read_lock_can_not_be_upgraded():
+    lock = ReadWriteLock()
+    with lock.read():
+        with pytest.raises(RuntimeError):
+            lock.acquire_write()
+    # The refused upgrade left nothing behind
+    assert _run(lambda: lock.acquire_write())
+
+
+def test_write_lock_is_released_by_its_owner_only():
+    lock = ReadWriteLock()
+    lock.acquire_write()
+    _errors = []
+
+    def _release():
+        try:
+            lock.release_write()
+        except RuntimeError as e:
+            _errors.append(e)
+
+    assert _run(_release)
+    assert len(_errors) == 1
+
+
+def test_readers_share_the_lock():
+    lock = ReadWriteLock()
+    with lock.read():
+        assert _run(lambda: lock.acquire_read())
+
+
+def test_waiting_writer_goes_before_new_readers():
+    lock = ReadWriteLock()
+    lock.acquire_read()
+    _writer = threading.Thread(target=lock.acquire_write, daemon=True)
+    _writer.start()
+    _writer.join(timeout=0.1)
+    assert _writer.is_alive()
+    assert not _run(lambda: lock.acquire_read())
+    lock.release_read()
+    _writer.join(timeout=1)
+    assert not _writer.is_alive()
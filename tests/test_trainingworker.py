@@ -0,0 +1,78 @@
+import threading
+
+import numpy as np
+import pytest
+
+pytest.importorskip('tensorflow')
+
+from core.trainingworker import TrainingWorker, TrainingWorkerPool
+
+
+def _task(epochs):
+    """
+    Create a training task which does not store its model
+    """
+    _random = np.random.RandomState(0)
+    return {
+        'username': 'alice',
+        'project': 'stopping',
+        'params': {
+            'epochs': epochs,
+            'batch-size': 8,
+            'validation-split': 0,
+            'layers': [{'layerType': 'Dense', 'layerId': 'output', 'order': 0,
+                        'parameters': {'units': 1, 'activation': 'Linear'}}]
+        },
+        'model_path': None,
+        'model_hash': None,
+        'warm_start': False,
+        'evaluate': True,
+        'x_train': _random.rand(64, 2),
+        'y_train': _random.rand(64, 1),
+        'x_test': _random.rand(16, 2),
+        'y_test': _random.rand(16, 1)
+    }
+
+
+@pytest.fixture(scope='module')
+def pool():
+    pool = TrainingWorkerPool(workers=1)
+    yield pool
+    pool.close()
+
+
+def test_task_trains_and_evaluates(pool):
+    _train_scoring, _test_scoring, _model_hash = pool.run(_task(epochs=1))
+    assert _test_scoring is not None
+    assert _model_hash is not None
+
+
+def test_stop_before_the_task_starts(pool):
+    # The stop request reaches the worker right behind the task, before the worker starts it
+    stop_event = threading.Event()
+    stop_event.set()
+    _train_scoring, _test_scoring, _ = pool.run(_task(epochs=1000), stop_event)
+    assert _test_scoring is None
+
+
+def test_stop_does_not_reach_the_next_task(pool):
+    stop_event = threading.Event()
+    stop_event.set()
+    pool.run(_task(epochs=1000), stop_event)
+    _, _test_scoring, _ = pool.run(_task(epochs=1))
+    assert _test_scoring is not None
+
+
+def test_stop_is_kept_for_its_task():
+    # Stop requests can reach the worker while it still trains the previous task
+    worker = TrainingWorker()
+    connection = worker._TrainingWorker__connection
+    try:
+        connection.send(('train', 'first', _task(epochs=20), None))
+        connection.send(('train', 'second', _task(epochs=1000), None))
+        connection.send(('stop', 'second'))
+        _first, _second = connection.recv(), connection.recv()
+        assert _first[0] == 'result' and _first[1][1] is not None
+        assert _second[0] == 'result' and _second[1][1] is None
+    finally:
+        worker.close()